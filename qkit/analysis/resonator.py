@@ -3,6 +3,16 @@
 #import h5py
 import numpy as np
 import logging
+import os
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 import qkit
 from qkit.storage import store
@@ -29,6 +39,18 @@ class Resonator(object):
         res.fit_lorentzian(fit_all=True,f_min=5.667e9,f_max=5.668e9)
         res.fit_fano(fit_all=True)
         res.fit_circle(fit_all=True,f_max=5.668e9)
+
+    live fitting (streaming mode):
+        the measurement hands every new trace to the fitter, the datasets are not read from the file again
+        res.submit_trace(amplitude, phase, 'lorentzian', f_min=5.667e9, f_max=5.668e9)  # fitted on a worker thread
+        res.wait()  # at the end of the measurement
+
+    batch fitting (fit_all):
+        the traces are fitted in a pool of worker processes (res.fit_processes, default: qkit.cfg['resonator_fit_processes']
+        or the number of cpus), every fit starts from the result of the neighbouring trace (res.warm_start)
+        within chunks of res.fit_chunk traces. The chunks do not depend on the number of processes, so the
+        results do not either. The results are written to the file as whole arrays, the throughput is kept
+        in res.fit_stats.
     '''
 
     def __init__(self, hf_path):
@@ -43,6 +65,16 @@ class Resonator(object):
         self.pre_filter_params = []
         self._debug = False
 
+        self._f_range = None # (f_min, f_max) of the current frequency window, see _prepare_f_range
+        self._trace = None # (amplitude, phase) of the trace to fit in streaming mode
+        self._worker = None
+
+        # batch fitting (fit_all), see _fit_batch
+        self.fit_processes = qkit.cfg.get('resonator_fit_processes', None) # None: number of cpus
+        self.warm_start = True
+        self.fit_chunk = int(qkit.cfg.get('resonator_fit_chunk', 32)) # traces per warm start chain
+        self.fit_stats = None
+
         # these ds_url should always be present in a resonator measurement
         self.ds_url_amp = "/entry/data0/amplitude"
         self.ds_url_pha = "/entry/data0/phase"
@@ -76,6 +108,7 @@ class Resonator(object):
         self._prepare()
 
     def close(self):
+        self.wait()
         self._hf.close()
 
     def set_x_coord(self,x_co):
@@ -136,12 +169,9 @@ class Resonator(object):
         the data in the .h5-file is NOT changed
         '''
         if data.ndim == 1:
-            return data[(self._frequency >= self._f_min) & (self._frequency <= self._f_max)]
+            return data[self._f_mask]
         if data.ndim == 2:
-            ret_array=np.empty(shape=(data.shape[0],self._fit_frequency.shape[0]),dtype=np.float64)
-            for i,a in enumerate(data):
-                ret_array[i]=data[i][(self._frequency >= self._f_min) & (self._frequency <= self._f_max)]
-            return ret_array
+            return np.array(data[:, self._f_mask], dtype=np.float64)
 
     def _get_datasets(self):
         '''
@@ -158,6 +188,7 @@ class Resonator(object):
         self._amplitude = np.array(self._hf[self.ds_url_amp],dtype=np.float64)
         self._phase = np.array(self._hf[self.ds_url_pha],dtype=np.float64)
         self._frequency = np.array(self._hf[self.ds_url_freq],dtype=np.float64)
+        self._f_range = None
 
         try:
             self._x_co = self._hf.get_dataset(self._ds_amp.x_ds_url)
@@ -179,39 +210,109 @@ class Resonator(object):
         prepares the data to be fitted:
         f_min (float): lower boundary
         f_max (float): upper boundary
-        '''
-
-        self._f_min = np.min(self._frequency)
-        self._f_max = np.max(self._frequency)
-
-        '''
-        f_min f_max do not have to be exactly an entry in the freq-array
-        '''
-        if f_min:
-            for freq in self._frequency:
-                if freq > f_min:
-                    self._f_min = freq
-                    break
-        if f_max:
-            for freq in self._frequency:
-                if freq > f_max:
-                    self._f_max = freq
-                    break
+        the frequency window (and the analysis frequency coordinate) is only
+        computed again if f_min or f_max change.
+        '''
+        if self._f_range != (f_min, f_max):
+            self._f_min = np.min(self._frequency)
+            self._f_max = np.max(self._frequency)
+
+            '''
+            f_min f_max do not have to be exactly an entry in the freq-array
+            '''
+            if f_min:
+                above = self._frequency > f_min
+                if above.any():
+                    self._f_min = self._frequency[np.argmax(above)]
+            if f_max:
+                above = self._frequency > f_max
+                if above.any():
+                    self._f_max = self._frequency[np.argmax(above)]
+            self._f_mask = (self._frequency >= self._f_min) & (self._frequency <= self._f_max)
+            self._fit_frequency = np.array(self._set_data_range(self._frequency))
+
+            self._frequency_co = self._hf.add_coordinate('frequency',folder='analysis', unit = 'Hz')
+            self._frequency_co.add(self._fit_frequency)
+            self._f_range = (f_min, f_max)
 
         '''
         cut the data-arrays with f_min/f_max and fit_all information
         '''
-        self._fit_frequency = np.array(self._set_data_range(self._frequency))
         self._fit_amplitude = np.array(self._set_data_range(self._amplitude))
         self._fit_phase = np.array(self._set_data_range(self._phase))
 
-        self._frequency_co = self._hf.add_coordinate('frequency',folder='analysis', unit = 'Hz')
-        self._frequency_co.add(self._fit_frequency)
-
     def _update_data(self):
+        if self._trace is not None:
+            # streaming mode: only the trace handed over by the measurement is fitted
+            self._amplitude = np.asarray(self._trace[0], dtype=np.float64)
+            self._phase = np.asarray(self._trace[1], dtype=np.float64)
+            return
         self._amplitude = np.array(self._hf[self.ds_url_amp],dtype=np.float64)
         self._phase = np.array(self._hf[self.ds_url_pha],dtype=np.float64)
 
+    def fit_trace(self, amplitude, phase, fit_function='lorentzian', f_min=None, f_max=None):
+        '''
+        streaming mode for live fits: fits the given trace and appends the results to the analysis datasets,
+        the measured datasets are not read from the file.
+
+        input:
+        amplitude, phase (1D arrays): trace at the frequencies of the frequency dataset
+        fit_function (string): 'lorentzian', 'skewed_lorentzian', 'circle_fit_reflection', 'circle_fit_notch' or 'fano'
+        f_min (float), f_max (float): boundaries for the data to be fitted (optional)
+        '''
+        if not self._datasets_loaded:
+            self._get_datasets()
+        self._trace = (amplitude, phase)
+        try:
+            if fit_function == 'lorentzian':
+                self.fit_lorentzian(f_min=f_min, f_max=f_max)
+            elif fit_function == 'skewed_lorentzian':
+                self.fit_skewed_lorentzian(f_min=f_min, f_max=f_max)
+            elif fit_function == 'circle_fit_reflection':
+                self.fit_circle(reflection=True, f_min=f_min, f_max=f_max)
+            elif fit_function == 'circle_fit_notch':
+                self.fit_circle(notch=True, f_min=f_min, f_max=f_max)
+            elif fit_function == 'fano':
+                self.fit_fano(f_min=f_min, f_max=f_max)
+            else:
+                logging.error('Resonator: unknown fit function %s' % fit_function)
+                raise ValueError('Resonator: unknown fit function %s' % fit_function)
+        finally:
+            self._trace = None
+
+    def submit_trace(self, amplitude, phase, fit_function='lorentzian', f_min=None, f_max=None):
+        '''
+        like fit_trace, but the fit runs on a worker thread and the measurement continues right away.
+        The traces are fitted in the order they are submitted, wait() returns when all are done.
+        '''
+        if self._worker is None:
+            self._queue = queue.Queue()
+            self._worker = threading.Thread(target=self._fit_worker, name='resonator_fit')
+            self._worker.daemon = True
+            self._worker.start()
+        self._queue.put((amplitude, phase, fit_function, f_min, f_max))
+
+    def _fit_worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                self.fit_trace(*job)
+            except Exception as e:
+                logging.error('Resonator: live fit failed: %s' % e)
+            finally:
+                self._queue.task_done()
+
+    def wait(self):
+        '''
+        waits until all traces handed over with submit_trace are fitted and stops the worker
+        '''
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join()
+            self._worker = None
+
     def _get_starting_values(self):
         pass
     
@@ -221,23 +322,18 @@ class Resonator(object):
         self._circle_notch = notch
         if not reflection and not notch:
             self._circle_notch = True
-        
+
         if not self._datasets_loaded:
             self._get_datasets()
 
         self._update_data()
         self._prepare_f_range(f_min, f_max)
-        
+
         if self._first_circle:
             self._prepare_circle()
             self._first_circle = False
 
-        if self._circle_reflection:
-           self._circle_port = circuit.reflection_port(f_data = self._fit_frequency)
-        elif self._circle_notch:
-            self._circle_port = circuit.notch_port(f_data = self._fit_frequency)
-            
-        self._do_fit_circle()
+        return self._do_fit_circle()
 
     def _do_fit_circle(self):
         '''
@@ -248,39 +344,20 @@ class Resonator(object):
         input:
         fit_all (bool): True or False, default: False. Whole data (True) or only last "slice" (False) is fitted (optional)
         '''
+        z_data_raw = self._get_data_circle()
+        self._write_block(self._data_real_gen, z_data_raw.real)
+        self._write_block(self._data_imag_gen, z_data_raw.imag)
 
-        self._get_data_circle()
-        trace = 0
-        self.debug("circle fit:")
-        for i,z_data_raw in enumerate(self._z_data_raw):
-            
-            z_data_raw.real = self._pre_filter_data(z_data_raw.real)
-            z_data_raw.imag = self._pre_filter_data(z_data_raw.imag)
-            self.debug("fitting trace: "+str(trace))
-            self._circle_port.z_data_raw = z_data_raw
-            
-            try:
-                self._circle_port.autofit()
-            except:
-                err=np.array([np.nan for f in self._fit_frequency])
-                self._circ_amp_gen.append(err,reset=(i==0))
-                self._circ_pha_gen.append(err,reset=(i==0))
-                self._circ_real_gen.append(err,reset=(i==0))
-                self._circ_imag_gen.append(err,reset=(i==0))
-
-                for key in iter(self._results):
-                    self._results[str(key)].append(np.nan)
-
-            else:
-                self._circ_amp_gen.append(np.absolute(self._circle_port.z_data_sim),reset=(i==0))
-                self._circ_pha_gen.append(np.angle(self._circle_port.z_data_sim),reset=(i==0))
-                self._circ_real_gen.append(np.real(self._circle_port.z_data_sim),reset=(i==0))
-                self._circ_imag_gen.append(np.imag(self._circle_port.z_data_sim),reset=(i==0))
-                print(i,i==0)
+        z_data = np.empty(z_data_raw.shape, dtype=np.complex64)
+        for i, z in enumerate(z_data_raw):
+            z_data[i].real = self._pre_filter_data(z.real)
+            z_data[i].imag = self._pre_filter_data(z.imag)
 
-                for key in iter(self._results):
-                    self._results[str(key)].append(float(self._circle_port.fitresults[str(key)]))
-            trace+=1
+        self.debug("circle fit:")
+        return self._fit_batch('circle', z_data,
+                               [self._circ_amp_gen, self._circ_pha_gen, self._circ_real_gen, self._circ_imag_gen],
+                               [self._results[key] for key in self._result_keys],
+                               port='reflection' if self._circle_reflection else 'notch', result_keys=self._result_keys)
 
     def _prepare_circle(self):
         '''
@@ -296,7 +373,7 @@ class Resonator(object):
             elif self._circle_reflection:
                 self._result_keys = ["Qi", "Qc", "Ql", "fr", "theta0", "Ql_err",
                                      "Qc_err", "fr_err", "chi_square", "Qi_err"]
-                
+
         elif circle_fit_version == 2:
             self._result_keys = ["delay", "delay_remaining", "a", "alpha", "theta", "phi", "fr", "Ql", "Qc",
                                  "Qc_no_dia_corr", "Qi", "Qi_no_dia_corr", "fr_err", "Ql_err", "absQc_err",
@@ -351,34 +428,86 @@ class Resonator(object):
 
     def _get_data_circle(self):
         '''
-        calc complex data from amp and pha
+        calc complex data from amp and pha, one trace per row
         '''
-        if not self._fit_all:
-            self._z_data_raw = np.empty((1,self._fit_frequency.shape[0]), dtype=np.complex64)
-
-            if self._fit_amplitude.ndim == 1: 
-                self._z_data_raw[0] = np.array(self._fit_amplitude*np.exp(1j*self._fit_phase),dtype=np.complex64)
-            else: 
-                self._z_data_raw[0] = np.array(self._fit_amplitude[-1]*np.exp(1j*self._fit_phase[-1]),dtype=np.complex64)
-
-            self._data_real_gen.append(self._z_data_raw[0].real)
-            self._data_imag_gen.append(self._z_data_raw[0].imag)
+        amplitude = self._get_traces(self._fit_amplitude)
+        phase = self._get_traces(self._fit_phase)
+        return np.array(amplitude*np.exp(1j*phase), dtype=np.complex64)
 
+    def _get_traces(self, data):
+        '''
+        returns the traces to be fitted, one per row:
+        all traces (fit_all) or only the last one
+        '''
+        data = np.atleast_2d(data)
         if self._fit_all:
-            self._z_data_raw = np.empty((self._fit_amplitude.shape), dtype=np.complex64)
-            for i,a in enumerate(self._fit_amplitude):
-                self._z_data_raw[i] = self._fit_amplitude[i]*np.exp(1j*self._fit_phase[i])
-                self._data_real_gen.append(self._z_data_raw[i].real)
-                self._data_imag_gen.append(self._z_data_raw[i].imag)
-
-    def _get_last_amp_trace(self):
-        tmp_amp = np.empty((1,self._fit_frequency.shape[0]))
-        if self._fit_amplitude.ndim==1: 
-            tmp_amp[0] = self._fit_amplitude
+            return data
+        return data[-1:]
+
+    def _fit_batch(self, kind, traces, gen_datasets, value_datasets, **options):
+        '''
+        batch fitting engine: fits the traces (one per row) with the fit of kind and
+        writes the generated data and the fit values as whole arrays to the datasets.
+
+        Traces are fitted in contiguous chunks of self.fit_chunk traces. Within a chunk,
+        every fit starts from the result of the previous trace (warm start along the sweep
+        axis, self.warm_start). With more than one chunk, the chunks are distributed over a
+        process pool with self.fit_processes workers (default: qkit.cfg['resonator_fit_processes']
+        or the number of cpus). The chunks are the same in the pool and in this process, so
+        the results do not depend on the number of processes. The throughput is logged and
+        kept in self.fit_stats.
+        '''
+        start = time.time()
+        n = len(traces)
+        processes = int(self.fit_processes or os.cpu_count() or 1)
+        chunks = [(i, min(n, i + self.fit_chunk)) for i in range(0, n, max(1, self.fit_chunk))]
+        results = None
+        if processes > 1 and len(chunks) > 1:
+            try:
+                results = self._fit_in_pool(kind, traces, chunks, processes, options)
+            except Exception as e:
+                logging.warning("Resonator: fitting in worker processes failed ({}), fitting here.".format(e))
+        if results is None:
+            processes = 1
+            results = [r for a, b in chunks for r in _fit_chunk(kind, self._fit_frequency, traces[a:b], self.warm_start, options)]
+
+        nan_trace = np.full(len(self._fit_frequency), np.nan)
+        for i, ds in enumerate(gen_datasets):
+            # the circle fit overwrites the last generated trace, as it always did
+            self._write_block(ds, [nan_trace if r is None else r[0][i] for r in results], reset=(kind == 'circle'))
+        for i, ds in enumerate(value_datasets):
+            self._write_block(ds, [np.nan if r is None else r[1][i] for r in results])
+
+        elapsed = time.time() - start
+        self.fit_stats = {'traces': n, 'seconds': elapsed, 'processes': processes,
+                          'traces_per_s': n / elapsed if elapsed > 0 else float('inf')}
+        if n > 1:
+            logging.info("Resonator: {} fit of {} traces in {:.2f}s ({:.1f} traces/s, {} processes)".format(
+                kind, n, elapsed, self.fit_stats['traces_per_s'], processes))
+        return self.fit_stats
+
+    def _fit_in_pool(self, kind, traces, chunks, processes, options):
+        pool = _get_pool(processes)
+        try:
+            futures = [pool.submit(_fit_chunk, kind, self._fit_frequency, traces[a:b], self.warm_start, options)
+                       for a, b in chunks]
+            return [r for f in futures for r in f.result()]
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            raise
+
+    def _write_block(self, ds, data, reset=False):
+        '''
+        appends one result per fitted trace, several results at once to matrix datasets
+        '''
+        if reset:
+            ds.append(data[0], reset=True)
+            data = data[1:]
+        if self._ds_type == ds_types['matrix'] and len(data) > 1:
+            ds.append_block(data)
         else:
-            tmp_amp[0] = self._fit_amplitude[-1]
-        self._fit_amplitude = np.empty((1,self._fit_frequency.shape[0]))
-        self._fit_amplitude[0] = tmp_amp[0]
+            for d in data:
+                ds.append(d)
 
     def fit_lorentzian(self,fit_all = False,f_min=None,f_max=None,pre_filter_data=None):
         '''
@@ -391,11 +520,6 @@ class Resonator(object):
         f_min (float): lower boundary for data to be fitted (optional, default: None, results in min(frequency-array))
         f_max (float): upper boundary for data to be fitted (optional, default: None, results in max(frequency-array))
         '''
-        def residuals(p,x,y):
-            f0,k,a,offs=p
-            err = y-(a/(1+4*((x-f0)/k)**2)+offs)
-            return err
-        
         self._fit_all = fit_all
 
         if not self._datasets_loaded:
@@ -407,76 +531,23 @@ class Resonator(object):
             self._prepare_lorentzian()
             self._first_lorentzian=False
 
-        '''
-        fit_amplitude is always 2dim np array.
-        for 1dim data, shape: (1, # fit frequency points)
-        for 2dim data, shape: (# amplitude slices (i.e. power values in scan), # fit frequency points)
-        '''
-        if not self._fit_all:
-            self._get_last_amp_trace()
-
-        for amplitudes in self._fit_amplitude:
-            amplitudes = np.absolute(amplitudes)
-            amplitudes_sq = amplitudes**2
-            '''extract starting parameter for lorentzian from data'''
-            s_offs = np.mean(np.array([amplitudes_sq[:int(np.size(amplitudes_sq)*.1)], amplitudes_sq[int(np.size(amplitudes_sq)-int(np.size(amplitudes_sq)*.1)):]]))
-            '''offset is calculated from the first and last 10% of the data to improve fitting on tight windows'''
-
-            if np.abs(np.max(amplitudes_sq)-np.mean(amplitudes_sq)) > np.abs(np.min(amplitudes_sq)-np.mean(amplitudes_sq)):
-                '''peak is expected'''
-                s_a = np.abs((np.max(amplitudes_sq)-np.mean(amplitudes_sq)))
-                s_f0 = self._fit_frequency[np.argmax(amplitudes_sq)]
-            else:
-                '''dip is expected'''
-                s_a = -np.abs((np.min(amplitudes_sq)-np.mean(amplitudes_sq)))
-                s_f0 = self._fit_frequency[np.argmin(amplitudes_sq)]
-
-            '''estimate peak/dip width'''
-            mid = s_offs + .5*s_a #estimated mid region between base line and peak/dip
-            m = [] #mid points
-            for i in range(len(amplitudes_sq)-1):
-                if np.sign(amplitudes_sq[i]-mid) != np.sign(amplitudes_sq[i+1]-mid):#mid level crossing
-                    m.append(i)
-            if len(m)>1:
-                s_k = self._fit_frequency[m[-1]]-self._fit_frequency[m[0]]
-            else:
-                s_k = .15*(self._fit_frequency[-1]-self._fit_frequency[0]) #try 15% of window
-            p0=[s_f0, s_k, s_a, s_offs]
-            try:
-                fit = leastsq(residuals,p0,args=(self._fit_frequency,amplitudes_sq))
-            except:
-                self._lrnz_amp_gen.append(np.array([np.nan for f in self._fit_frequency]))
-                self._lrnz_f0.append(np.nan)
-                self._lrnz_k.append(np.nan)
-                self._lrnz_a.append(np.nan)
-                self._lrnz_offs.append(np.nan)
-                self._lrnz_Ql.append(np.nan)
-                self._lrnz_chi2_fit.append(np.nan)
-            else:
-                popt=fit[0]
-                chi2 = self._lorentzian_fit_chi2(popt,amplitudes_sq)
-                self._lrnz_amp_gen.append(np.sqrt(np.array(self._lorentzian_from_fit(popt))))
-                self._lrnz_f0.append(float(popt[0]))
-                self._lrnz_k.append(float(np.fabs(float(popt[1]))))
-                self._lrnz_a.append(float(popt[2]))
-                self._lrnz_offs.append(float(popt[3]))
-                self._lrnz_Ql.append(float(float(popt[0])/np.fabs(float(popt[1]))))
-                self._lrnz_chi2_fit.append(float(chi2))
+        return self._fit_batch('lorentzian', self._get_traces(self._fit_amplitude), [self._lrnz_amp_gen],
+                               [self._lrnz_f0, self._lrnz_k, self._lrnz_a, self._lrnz_offs, self._lrnz_Ql, self._lrnz_chi2_fit])
 
     def _prepare_lorentzian(self):
         '''
         creates the datasets for the lorentzian fit in the hdf-file
         '''
         if self._ds_type == ds_types['vector']: # data from measure_1d
-            self._lrnz_amp_gen = self._hf.add_value_vector('lrnz_amp_gen', folder = 'analysis', x = self._frequency_co, unit = 'arb. unit')  
+            self._lrnz_amp_gen = self._hf.add_value_vector('lrnz_amp_gen', folder = 'analysis', x = self._frequency_co, unit = 'arb. unit')
             self._lrnz_f0 = self._hf.add_coordinate('lrnz_f0', folder = 'analysis', unit = 'Hz')
             self._lrnz_k = self._hf.add_coordinate('lrnz_k', folder = 'analysis', unit = 'Hz')
             self._lrnz_a = self._hf.add_coordinate('lrnz_a', folder = 'analysis', unit = '')
             self._lrnz_offs = self._hf.add_coordinate('lrnz_offs', folder = 'analysis', unit = '')
             self._lrnz_Ql = self._hf.add_coordinate('lrnz_ql', folder = 'analysis', unit = '')
-    
+
             self._lrnz_chi2_fit  = self._hf.add_coordinate('lrnz_chi2' , folder = 'analysis', unit = '')
-            
+
         if self._ds_type == ds_types['matrix']: # data from measure_2d
             self._lrnz_amp_gen = self._hf.add_value_matrix('lrnz_amp_gen', folder = 'analysis', x = self._x_co, y = self._frequency_co, unit = 'arb. unit')
             self._lrnz_f0 = self._hf.add_value_vector('lrnz_f0', folder = 'analysis', x = self._x_co, unit = 'Hz')
@@ -484,18 +555,17 @@ class Resonator(object):
             self._lrnz_a = self._hf.add_value_vector('lrnz_a', folder = 'analysis', x = self._x_co, unit = '')
             self._lrnz_offs = self._hf.add_value_vector('lrnz_offs', folder = 'analysis', x = self._x_co, unit = '')
             self._lrnz_Ql = self._hf.add_value_vector('lrnz_ql', folder = 'analysis', x = self._x_co, unit = '')
-    
+
             self._lrnz_chi2_fit  = self._hf.add_value_vector('lrnz_chi2' , folder = 'analysis', x = self._x_co, unit = '')
 
         lrnz_view = self._hf.add_view("lrnz_fit", x = self._y_co, y = self._ds_amp)
         lrnz_view.add(x=self._frequency_co, y=self._lrnz_amp_gen)
 
     def _lorentzian_from_fit(self,fit):
-        return fit[2] / (1 + (4*((self._fit_frequency-fit[0])/fit[1]) ** 2)) + fit[3]
+        return _lorentzian(self._fit_frequency, fit)
 
     def _lorentzian_fit_chi2(self, fit, amplitudes_sq):
-        chi2 = np.sum((self._lorentzian_from_fit(fit)-amplitudes_sq)**2) / (len(amplitudes_sq)-len(fit))
-        return chi2
+        return _chi2(self._lorentzian_from_fit(fit), amplitudes_sq, fit)
 
     def fit_skewed_lorentzian(self, fit_all = False, f_min=None, f_max=None,pre_filter_data=None):
         '''
@@ -508,15 +578,6 @@ class Resonator(object):
         f_min (float): lower boundary for data to be fitted (optional, default: None, results in min(frequency-array))
         f_max (float): upper boundary for data to be fitted (optional, default: None, results in max(frequency-array))
         '''
-        def residuals(p,x,y):
-            A2, A4, Qr = p
-            err = y -(A1a+A2*(x-fra)+(A3a+A4*(x-fra))/(1.+4.*Qr**2*((x-fra)/fra)**2))
-            return err
-        def residuals2(p,x,y):
-            A1, A2, A3, A4, fr, Qr = p
-            err = y -(A1+A2*(x-fr)+(A3+A4*(x-fr))/(1.+4.*Qr**2*((x-fr)/fr)**2))
-            return err
-
         self._fit_all = fit_all
 
         if not self._datasets_loaded:
@@ -528,58 +589,11 @@ class Resonator(object):
             self._prepare_skewed_lorentzian()
             self._first_skewed_lorentzian = False
 
-        '''
-        fit_amplitude is always 2dim np array.
-        for 1dim data, shape: (1, # fit frequency points)
-        for 2dim data, shape: (# amplitude slices (i.e. power values in scan), # fit frequency points)
-        '''
-        if not self._fit_all:
-            self._get_last_amp_trace()
-
-        for amplitudes in self._fit_amplitude:
-            "fits a skewed lorenzian to reflection amplitudes of a resonator"
-            # prefilter the data
-            amplitudes = self._pre_filter_data(amplitudes)
-
-            amplitudes = np.absolute(amplitudes)
-            amplitudes_sq = amplitudes**2
-
-            A1a = np.minimum(amplitudes_sq[0],amplitudes_sq[-1])
-            A3a = -np.max(amplitudes_sq)
-            fra = self._fit_frequency[np.argmin(amplitudes_sq)]
-
-            p0 = [0., 0., 1e3]
-
-            try:
-                p_final = leastsq(residuals,p0,args=(self._fit_frequency,amplitudes_sq))
-                A2a, A4a, Qra = p_final[0]
-
-                p0 = [A1a, A2a , A3a, A4a, fra, Qra]
-                p_final = leastsq(residuals2,p0,args=(self._fit_frequency,amplitudes_sq))
-                popt=p_final[0]
-            except:
-                self._skwd_amp_gen.append(np.array([np.nan for f in self._fit_frequency]))
-                self._skwd_f0.append(np.nan)
-                self._skwd_a1.append(np.nan)
-                self._skwd_a2.append(np.nan)
-                self._skwd_a3.append(np.nan)
-                self._skwd_a4.append(np.nan)
-                self._skwd_Qr.append(np.nan)
-                self._skwd_chi2_fit.append(np.nan)
-            else:
-                chi2 = self._skewed_fit_chi2(popt,amplitudes_sq)
-                amp_gen = np.sqrt(np.array(self._skewed_from_fit(popt)))
-
-                self._skwd_amp_gen.append(amp_gen)
-                self._skwd_f0.append(float(popt[4]))
-                self._skwd_a1.append(float(popt[0]))
-                self._skwd_a2.append(float(popt[1]))
-                self._skwd_a3.append(float(popt[2]))
-                self._skwd_a4.append(float(popt[3]))
-                self._skwd_Qr.append(float(popt[5]))
-                self._skwd_chi2_fit.append(float(chi2))
-
-            self._skwd_Qi.append(self._skewed_estimate_Qi(popt))
+        # prefilter the data
+        amplitudes = np.array([self._pre_filter_data(a) for a in self._get_traces(self._fit_amplitude)])
+        return self._fit_batch('skewed_lorentzian', amplitudes, [self._skwd_amp_gen],
+                               [self._skwd_f0, self._skwd_a1, self._skwd_a2, self._skwd_a3, self._skwd_a4, self._skwd_Qr,
+                                self._skwd_chi2_fit, self._skwd_Qi])
 
     def _prepare_skewed_lorentzian(self):
         '''
@@ -594,7 +608,7 @@ class Resonator(object):
             self._skwd_a4 = self._hf.add_coordinate('sklr_a4', folder = 'analysis', unit = '')
             self._skwd_Qr = self._hf.add_coordinate('sklr_qr', folder = 'analysis', unit = '')
             self._skwd_Qi = self._hf.add_coordinate('sklr_qi', folder = 'analysis', unit = '')
-    
+
             self._skwd_chi2_fit  = self._hf.add_coordinate('sklr_chi2' , folder = 'analysis', unit = '')
 
         if self._ds_type == ds_types['matrix']: # data from measure_2d
@@ -606,44 +620,20 @@ class Resonator(object):
             self._skwd_a4 = self._hf.add_value_vector('sklr_a4', folder = 'analysis', x = self._x_co, unit = '')
             self._skwd_Qr = self._hf.add_value_vector('sklr_qr', folder = 'analysis', x = self._x_co, unit = '')
             self._skwd_Qi = self._hf.add_value_vector('sklr_qi', folder = 'analysis', x = self._x_co, unit = '')
-    
+
             self._skwd_chi2_fit  = self._hf.add_value_vector('sklr_chi2' , folder = 'analysis', x = self._x_co, unit = '')
 
         skwd_view = self._hf.add_view('sklr_fit', x = self._y_co, y = self._ds_amp)
         skwd_view.add(x=self._frequency_co, y=self._skwd_amp_gen)
 
     def _skewed_fit_chi2(self, fit, amplitudes_sq):
-        chi2 = np.sum((self._skewed_from_fit(fit)-amplitudes_sq)**2) / (len(amplitudes_sq)-len(fit))
-        return chi2
+        return _chi2(self._skewed_from_fit(fit), amplitudes_sq, fit)
 
     def _skewed_from_fit(self,p):
-        A1, A2, A3, A4, fr, Qr = p
-        return A1+A2*(self._fit_frequency-fr)+(A3+A4*(self._fit_frequency-fr))/(1.+4.*Qr**2*((self._fit_frequency-fr)/fr)**2)
+        return _skewed_lorentzian(self._fit_frequency, p)
 
     def _skewed_estimate_Qi(self,p):
-
-        #this is a very clumsy numerical estimate of the Qi factor based on the +3dB method.#
-        A1, A2, A3, A4, fr, Qr = p
-        def skewed_from_fit(p,f):
-            A1, A2, A3, A4, fr, Qr = p
-            return A1+A2*(f-fr)+(A3+A4*(f-fr))/(1.+4.*Qr**2*((f-fr)/fr)**2)
-
-        #df = fr/(Qr*10000)
-        fmax = fr+fr/Qr
-        fs = np.linspace(fr,fmax,1000,dtype=np.float64)
-        Amin = skewed_from_fit(p,fr)
-        #print("---")
-        #print("Amin, 2*Amin",Amin, 2*Amin)
-
-        for f in fs:
-            A = skewed_from_fit(p,f)
-            #print(A, f)
-            if A>2*Amin:
-                break
-        qi = fr/(2*(f-fr))
-        #print("f, A, fr/2*(f-fr)", f,A, qi)
-
-        return float(qi)
+        return _skewed_estimate_Qi(p)
 
     def _prepare_fano(self):
         "create the datasets for the fano fit in the hdf-file"
@@ -653,18 +643,18 @@ class Resonator(object):
             self._fano_bw_fit = self._hf.add_coordinate('fano_bw', folder = 'analysis', unit = 'Hz')
             self._fano_fr_fit = self._hf.add_coordinate('fano_fr', folder = 'analysis', unit = 'Hz')
             self._fano_a_fit  = self._hf.add_coordinate('fano_a' , folder = 'analysis', unit = '')
-    
+
             self._fano_chi2_fit  = self._hf.add_coordinate('fano_chi2' , folder = 'analysis', unit = '')
             self._fano_Ql_fit    = self._hf.add_coordinate('fano_Ql' , folder = 'analysis', unit = '')
             self._fano_Q0_fit    = self._hf.add_coordinate('fano_Q0' , folder = 'analysis', unit = '')
-            
+
         if self._ds_type == ds_types['matrix']: # data from measure_2d
             self._fano_amp_gen = self._hf.add_value_matrix('fano_amp_gen', folder = 'analysis', x = self._x_co, y = self._frequency_co, unit = 'arb. unit')
             self._fano_q_fit  = self._hf.add_value_vector('fano_q' , folder = 'analysis', x = self._x_co, unit = '')
             self._fano_bw_fit = self._hf.add_value_vector('fano_bw', folder = 'analysis', x = self._x_co, unit = 'Hz')
             self._fano_fr_fit = self._hf.add_value_vector('fano_fr', folder = 'analysis', x = self._x_co, unit = 'Hz')
             self._fano_a_fit  = self._hf.add_value_vector('fano_a' , folder = 'analysis', x = self._x_co, unit = '')
-    
+
             self._fano_chi2_fit  = self._hf.add_value_vector('fano_chi2' , folder = 'analysis', x = self._x_co, unit = '')
             self._fano_Ql_fit    = self._hf.add_value_vector('fano_Ql' , folder = 'analysis', x = self._x_co, unit = '')
             self._fano_Q0_fit    = self._hf.add_value_vector('fano_Q0' , folder = 'analysis', x = self._x_co, unit = '')
@@ -693,44 +683,9 @@ class Resonator(object):
             self._prepare_fano()
             self._first_fano = False
 
-        '''
-        fit_amplitude is always 2dim np array.
-        for 1dim data, shape: (1, # fit frequency points)
-        for 2dim data, shape: (# amplitude slices (i.e. power values in scan), # fit frequency points)
-        '''
-        if not self._fit_all:
-            self._get_last_amp_trace()
-
-        for amplitudes in self._fit_amplitude:
-            amplitude_sq = (np.absolute(amplitudes))**2
-            try:
-                fit = self._do_fit_fano(amplitude_sq)
-                amplitudes_gen = self._fano_reflection_from_fit(fit)
-
-                '''calculate the chi2 of fit and data'''
-                chi2 = self._fano_fit_chi2(fit, amplitude_sq)
-
-            except:
-                self._fano_amp_gen.append(np.array([np.nan for f in self._fit_frequency]))
-                self._fano_q_fit.append(np.nan)
-                self._fano_bw_fit.append(np.nan)
-                self._fano_fr_fit.append(np.nan)
-                self._fano_a_fit.append(np.nan)
-                self._fano_chi2_fit.append(np.nan)
-                self._fano_Ql_fit.append(np.nan)
-                self._fano_Q0_fit.append(np.nan)
-
-            else:
-                ''' save the fitted data to the hdf_file'''
-                self._fano_amp_gen.append(np.sqrt(np.absolute(amplitudes_gen)))
-                self._fano_q_fit.append(float(fit[0]))
-                self._fano_bw_fit.append(float(fit[1]))
-                self._fano_fr_fit.append(float(fit[2]))
-                self._fano_a_fit.append(float(fit[3]))
-                self._fano_chi2_fit.append(float(chi2))
-                self._fano_Ql_fit.append(float(fit[2])/float(fit[1]))
-                q0=self._fano_fit_q0(np.sqrt(np.absolute(amplitudes_gen)),float(fit[2]))
-                self._fano_Q0_fit.append(q0)
+        return self._fit_batch('fano', self._get_traces(self._fit_amplitude), [self._fano_amp_gen],
+                               [self._fano_q_fit, self._fano_bw_fit, self._fano_fr_fit, self._fano_a_fit, self._fano_chi2_fit,
+                                self._fano_Ql_fit, self._fano_Q0_fit])
 
     def _fano_reflection(self,f,q,bw,fr,a=1,b=1):
         '''
@@ -742,7 +697,7 @@ class Resonator(object):
         fano-factor q
         bandwidth bw
         '''
-        return a*(1 - self._fano_transmission(f,q,bw,fr))
+        return _fano_reflection(f,q,bw,fr,a)
 
     def _fano_transmission(self,f,q,bw,fr,a=1,b=1):
         '''
@@ -754,48 +709,215 @@ class Resonator(object):
         fano-factor q
         bandwidth bw
         '''
-        F = 2*(f-fr)/bw
-        return ( 1/(1+q**2) * (F+q)**2 / (F**2+1))
+        return _fano_transmission(f,q,bw,fr)
 
     def _do_fit_fano(self, amplitudes_sq):
+        return _fit_fano_trace(self._fit_frequency, np.sqrt(amplitudes_sq))[2]
+
+    def _fano_reflection_from_fit(self,fit):
+        return _fano_reflection(self._fit_frequency,fit[0],fit[1],fit[2],fit[3])
+
+    def _fano_fit_chi2(self,fit,amplitudes_sq):
+        return _chi2(self._fano_reflection_from_fit(fit), amplitudes_sq, fit)
+
+    def _fano_fit_q0(self,amp_gen,fr):
+        return _fano_fit_q0(self._fit_frequency, amp_gen, fr)
+
+
+'''
+fit functions of single traces, used by the batch fitting engine (also in worker processes).
+_fit_*_trace(frequency, amplitudes, p0=None) returns ([generated data], [fit values], p_opt),
+without p0 the starting values are estimated from the data.
+'''
+
+def _chi2(generated, amplitudes_sq, fit):
+    return np.sum((generated-amplitudes_sq)**2) / (len(amplitudes_sq)-len(fit))
+
+def _lorentzian(f, p):
+    f0, k, a, offs = p
+    return a/(1+4*((f-f0)/k)**2)+offs
+
+def _lorentzian_starting_values(frequency, amplitudes_sq):
+    '''extract starting parameter for lorentzian from data'''
+    s_offs = np.mean(np.array([amplitudes_sq[:int(np.size(amplitudes_sq)*.1)], amplitudes_sq[int(np.size(amplitudes_sq)-int(np.size(amplitudes_sq)*.1)):]]))
+    '''offset is calculated from the first and last 10% of the data to improve fitting on tight windows'''
+
+    if np.abs(np.max(amplitudes_sq)-np.mean(amplitudes_sq)) > np.abs(np.min(amplitudes_sq)-np.mean(amplitudes_sq)):
+        '''peak is expected'''
+        s_a = np.abs((np.max(amplitudes_sq)-np.mean(amplitudes_sq)))
+        s_f0 = frequency[np.argmax(amplitudes_sq)]
+    else:
+        '''dip is expected'''
+        s_a = -np.abs((np.min(amplitudes_sq)-np.mean(amplitudes_sq)))
+        s_f0 = frequency[np.argmin(amplitudes_sq)]
+
+    '''estimate peak/dip width'''
+    mid = s_offs + .5*s_a #estimated mid region between base line and peak/dip
+    m = np.nonzero(np.diff(np.sign(amplitudes_sq-mid)))[0] #mid level crossings
+    if len(m)>1:
+        s_k = frequency[m[-1]]-frequency[m[0]]
+    else:
+        s_k = .15*(frequency[-1]-frequency[0]) #try 15% of window
+    return [s_f0, s_k, s_a, s_offs]
+
+def _fit_lorentzian_trace(frequency, amplitudes, p0=None):
+    def residuals(p,x,y):
+        return y-_lorentzian(x,p)
+
+    amplitudes_sq = np.absolute(amplitudes)**2
+    if p0 is None:
+        p0 = _lorentzian_starting_values(frequency, amplitudes_sq)
+    popt = leastsq(residuals,p0,args=(frequency,amplitudes_sq))[0]
+    chi2 = _chi2(_lorentzian(frequency, popt), amplitudes_sq, popt)
+    k = float(np.fabs(popt[1]))
+    values = [float(popt[0]), k, float(popt[2]), float(popt[3]), float(popt[0])/k, float(chi2)]
+    return [np.sqrt(np.array(_lorentzian(frequency, popt)))], values, popt
+
+def _skewed_lorentzian(f, p):
+    A1, A2, A3, A4, fr, Qr = p
+    return A1+A2*(f-fr)+(A3+A4*(f-fr))/(1.+4.*Qr**2*((f-fr)/fr)**2)
+
+def _skewed_estimate_Qi(p):
+    #this is a very clumsy numerical estimate of the Qi factor based on the +3dB method.#
+    A1, A2, A3, A4, fr, Qr = p
+    fmax = fr+fr/Qr
+    fs = np.linspace(fr,fmax,1000,dtype=np.float64)
+    Amin = _skewed_lorentzian(fr,p)
+    above = np.nonzero(_skewed_lorentzian(fs,p)>2*Amin)[0]
+    f = fs[above[0]] if len(above) else fs[-1]
+    qi = fr/(2*(f-fr))
+    return float(qi)
+
+def _fit_skewed_lorentzian_trace(frequency, amplitudes, p0=None):
+    "fits a skewed lorenzian to reflection amplitudes of a resonator"
+    def residuals2(p,x,y):
+        return y-_skewed_lorentzian(x,p)
+
+    amplitudes_sq = np.absolute(amplitudes)**2
+    if p0 is None:
+        A1a = np.minimum(amplitudes_sq[0],amplitudes_sq[-1])
+        A3a = -np.max(amplitudes_sq)
+        fra = frequency[np.argmin(amplitudes_sq)]
+
+        def residuals(p,x,y):
+            A2, A4, Qr = p
+            return y-_skewed_lorentzian(x,(A1a, A2, A3a, A4, fra, Qr))
+
+        A2a, A4a, Qra = leastsq(residuals,[0., 0., 1e3],args=(frequency,amplitudes_sq))[0]
+        p0 = [A1a, A2a , A3a, A4a, fra, Qra]
+    popt = leastsq(residuals2,p0,args=(frequency,amplitudes_sq))[0]
+    chi2 = _chi2(_skewed_lorentzian(frequency, popt), amplitudes_sq, popt)
+    values = [float(popt[4]), float(popt[0]), float(popt[1]), float(popt[2]), float(popt[3]), float(popt[5]),
+              float(chi2), _skewed_estimate_Qi(popt)]
+    return [np.sqrt(np.array(_skewed_lorentzian(frequency, popt)))], values, popt
+
+def _fano_transmission(f,q,bw,fr):
+    F = 2*(f-fr)/bw
+    return ( 1/(1+q**2) * (F+q)**2 / (F**2+1))
+
+def _fano_reflection(f,q,bw,fr,a=1):
+    return a*(1 - _fano_transmission(f,q,bw,fr))
+
+def _fano_fit_q0(frequency, amp_gen, fr):
+    '''
+    calculates q0 from 3dB bandwidth above minimum in fit function
+    '''
+    amp_3dB=10*np.log10((np.min(amp_gen)))+3
+    amp_3dB_lin=10**(amp_3dB/10)
+    f_3dB = frequency[np.nonzero(np.diff(np.sign(amp_gen-amp_3dB_lin)))[0]] #crossing@amp_3dB
+    if len(f_3dB)>1:
+        q0 = fr/(f_3dB[1]-f_3dB[0])
+        return float(q0)
+    else: return np.nan
+
+def _fit_fano_trace(frequency, amplitudes, p0=None):
+    def fano_residuals(p,frequency,amplitude_sq):
+        q, bw, fr, a = p
+        return amplitude_sq-_fano_reflection(frequency,q,bw,fr=fr,a=a)
+
+    amplitudes_sq = np.absolute(amplitudes)**2
+    if p0 is None:
         # initial guess
         bw = 1e6
         q  = 1 #np.sqrt(1-amplitudes_sq).min()  # 1-Amp_sq = 1-1+q^2  => A_min = q
-        fr = self._fit_frequency[np.argmin(amplitudes_sq)]
+        fr = frequency[np.argmin(amplitudes_sq)]
         a  = amplitudes_sq.max()
-
         p0 = [q, bw, fr, a]
+    fit = leastsq(fano_residuals,p0,args=(frequency,amplitudes_sq))[0]
+    amplitudes_gen = _fano_reflection(frequency,fit[0],fit[1],fit[2],fit[3])
+    '''calculate the chi2 of fit and data'''
+    chi2 = _chi2(amplitudes_gen, amplitudes_sq, fit)
+    amp_gen = np.sqrt(np.absolute(amplitudes_gen))
+    values = [float(fit[0]), float(fit[1]), float(fit[2]), float(fit[3]), float(chi2), float(fit[2])/float(fit[1]),
+              _fano_fit_q0(frequency, amp_gen, float(fit[2]))]
+    return [amp_gen], values, fit
+
+def _fit_circle_trace(frequency, z_data_raw, p0=None, port='notch', result_keys=()):
+    if port == 'reflection':
+        circle_port = circuit.reflection_port(f_data = frequency)
+    else:
+        circle_port = circuit.notch_port(f_data = frequency)
+    circle_port.z_data_raw = z_data_raw
+    circle_port.autofit()
+    z_data_sim = circle_port.z_data_sim
+    gen = [np.absolute(z_data_sim), np.angle(z_data_sim), np.real(z_data_sim), np.imag(z_data_sim)]
+    return gen, [float(circle_port.fitresults[str(key)]) for key in result_keys], None
 
-        def fano_residuals(p,frequency,amplitude_sq):
-            q, bw, fr, a = p
-            err = amplitude_sq-self._fano_reflection(frequency,q,bw,fr=fr,a=a)
-            return err
-
-        p_fit = leastsq(fano_residuals,p0,args=(self._fit_frequency,np.array(amplitudes_sq)))
-        #print(("q:%g bw:%g fr:%g a:%g")% (p_fit[0][0],p_fit[0][1],p_fit[0][2],p_fit[0][3]))
-        return p_fit[0]
-
-    def _fano_reflection_from_fit(self,fit):
-        return self._fano_reflection(self._fit_frequency,fit[0],fit[1],fit[2],fit[3])
-
-    def _fano_fit_chi2(self,fit,amplitudes_sq):
-        chi2 = np.sum((self._fano_reflection_from_fit(fit)-amplitudes_sq)**2) / (len(amplitudes_sq)-len(fit))
-        return chi2
+_pool = None # (processes, ProcessPoolExecutor) of the batch fits
+_pool_lock = threading.Lock()
 
-    def _fano_fit_q0(self,amp_gen,fr):
-        '''
-        calculates q0 from 3dB bandwidth above minimum in fit function
-        '''
-        amp_3dB=10*np.log10((np.min(amp_gen)))+3
-        amp_3dB_lin=10**(amp_3dB/10)
-        f_3dB=[]
-        for i in range(len(amp_gen)-1):
-            if np.sign(amp_gen[i]-amp_3dB_lin) != np.sign(amp_gen[i+1]-amp_3dB_lin):#crossing@amp_3dB
-                f_3dB.append(self._fit_frequency[i])
-        if len(f_3dB)>1:
-            q0 = fr/(f_3dB[1]-f_3dB[0])
-            return float(q0)
-        else: return np.nan
+def _get_pool(processes):
+    '''
+    returns the process pool for the batch fits. The workers are spawned, as the measurement
+    process can have threads running (e.g. the fid). Spawning takes a few seconds, so the pool
+    is kept for the next fits.
+    '''
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool[0] != processes:
+            if _pool is not None:
+                _pool[1].shutdown(wait=False)
+            _pool = (processes, ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')))
+        return _pool[1]
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool[1] is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+_trace_fits = {'lorentzian': _fit_lorentzian_trace, 'skewed_lorentzian': _fit_skewed_lorentzian_trace,
+               'fano': _fit_fano_trace, 'circle': _fit_circle_trace}
+
+def _fit_chunk(kind, frequency, traces, warm_start=True, options={}):
+    '''
+    fits consecutive traces, returns ([generated data], [fit values]) per trace or None if the fit failed.
+    With warm_start, every fit starts from the result of the previous trace. If that fit
+    fails or does not converge to finite values, it is repeated with estimated starting values.
+    '''
+    fit = _trace_fits[kind]
+    results = []
+    p0 = None
+    for trace in traces:
+        result = None
+        if p0 is not None:
+            try:
+                result = fit(frequency, trace, p0, **options)
+                if not np.all(np.isfinite(result[2])):
+                    result = None
+            except Exception:
+                result = None
+        if result is None:
+            try:
+                result = fit(frequency, trace, **options)
+            except Exception:
+                results.append(None)
+                p0 = None
+                continue
+        results.append(result[:2])
+        p0 = result[2] if warm_start else None
+    return results
 
 if __name__ == "__main__":
     import argparse
@@ -814,12 +936,15 @@ if __name__ == "__main__":
     parser.add_argument('-fp','--filter-params',type=str, help='(optional) (pre-) filter data: parameter')
     parser.add_argument('-d','--debug-output', default=False, action='store_true', help='(optional) debug: more verbose')
     parser.add_argument('-t','--type',   type=str, help='resonator type: (r)eflection or (n)otch')
+    parser.add_argument('-p','--processes', type=int, help='number of worker processes for fit_all (default: number of cpus)')
     args=parser.parse_args()
     #argsfile=None
     if args.file:
         R = Resonator(args.file)
         if args.debug_output:
             R._debug = True
+        if args.processes:
+            R.fit_processes = args.processes
 
         fit_all = args.fit_all
 
@@ -858,6 +983,8 @@ if __name__ == "__main__":
             R.fit_skewed_lorentzian(fit_all=fit_all, f_min=f_min,f_max=f_max)
         if args.fano_fit:
             R.fit_fano(fit_all=fit_all, f_min=f_min,f_max=f_max)
+        if R.fit_stats:
+            print("{traces} traces in {seconds:.2f}s ({traces_per_s:.1f} traces/s, {processes} processes)".format(**R.fit_stats))
         R.close()
     else:
         print("no file supplied. type -h for help")
@@ -34,6 +34,11 @@ cfg['datadir'] = os.path.join(cfg['qkitdir'],'data')
 
 cfg['instruments_dir']      = os.path.join(cfg['qkitdir'],'drivers')
 cfg['user_instruments_dir'] = None
+## reload driver modules on every qkit.instruments.create (slow, only for driver development)
+#cfg['instruments_reload'] = False # default: False
+## read the parameters after creating an instrument: 'all', 'background' or 'none'
+## ('background' only synchronizes parameter get/set with the prefetch thread)
+#cfg['instruments_prefetch'] = 'all' # default: 'all'
 
 
 ##
@@ -53,6 +58,48 @@ cfg['datafolder_structure'] = 2
 #fid_scan_hdf     = False
 ## should the viewer object be created on startup (slow, needs pandas) ?
 #fid_init_viewer  = True
+## inspect every file at startup instead of only the changed directories ?
+#fid_full_scan    = False
+## with fid_scan_hdf, the h5 files are read on a pool of processes or threads
+#cfg['fid_scan_pool']    = 'process' # or 'thread'
+#cfg['fid_scan_workers'] = 8
+#cfg['fid_scan_timeout'] = 30 # seconds per file, slower files are skipped until the next start
+## keep the fid up to date with new/changed/deleted files: 'auto', 'inotify', 'poll' or False
+## (use 'poll' for network shares written by other machines)
+#cfg['fid_watch'] = 'auto'
+#cfg['fid_watch_interval'] = None # seconds, default: 2 (inotify), 30 (poll)
+
+##
+## Buffer appended data in memory and write it in blocks to the h5 files
+## (write-behind). Data is written when one of the limits is reached
+## (number of traces, bytes, age in seconds) and always on close.
+#cfg['hdf_write_buffer'] = {'rows': 100, 'nbytes': 16*1024**2, 'interval': 2.}
+##
+## Create 2D and 3D datasets at their final size if the sweep is known up
+## front (MeasureBase, spectroscopy). Unused parts are removed on close.
+#cfg['hdf_preallocate'] = False
+##
+## Write measurement files in single-writer/multiple-reader (SWMR) mode.
+## qviewkit then keeps the file open during the measurement (MeasureBase).
+#cfg['hdf_swmr'] = False
+## Datasets without data after this many seconds do not delay the SWMR mode.
+#cfg['hdf_swmr_wait'] = 30
+##
+## Pipelined measurement loops (spectroscopy): the data is written and fitted
+## on a consumer thread while the VNA already measures the next point.
+## The time per stage is stored in <measurement>.stage_timings.
+#cfg['measure_pipelined'] = False
+#cfg['measure_pipeline_queue'] = 4 # traces the writer may fall behind
+##
+## Chunk layout and lossless compression of new datasets, 
+## see qkit/storage/hdf_storage_policy.py
+## layout: 'legacy' (default), 'rows' (appending, trace reading) or
+## 'columns' (slices across traces, e.g. in qviewkit)
+#cfg['hdf_chunk_layout'] = 'legacy'
+#cfg['hdf_chunk_bytes'] = 256*1024
+#cfg['hdf_compression'] = None # None, 'gzip' or 'lzf'
+#cfg['hdf_compression_opts'] = 4 # gzip level
+#cfg['hdf_shuffle'] = True
 
 ##
 ## Load (py) visa (Virtual Instrument Software Architecture) lib 
@@ -64,6 +111,11 @@ cfg['datafolder_structure'] = 2
 ## set and define the plot engine 
 ## in the moment only qviewkit is supported
 cfg['plot_engine'] = 'qkit.gui.qviewkit.main' # default: qviewkit
+##
+## qviewkit displays long traces min/max decimated and large 2d plots 
+## block-reduced to the screen resolution, zooming in loads finer tiles.
+#cfg['qviewkit_lod'] = True # default: True
+#cfg['qviewkit_lod_min_pixels'] = 512 # default: 512, points per axis displayed at least
 
 ##
 ## Load QKIT info service, 
@@ -79,6 +131,13 @@ cfg['plot_engine'] = 'qkit.gui.qviewkit.main' # default: qviewkit
 #cfg['ris_port']  = 5700  # this is the port rpc could use
 #cfg['ris_host']  = 'localhost' # as above
 
+##
+## Startup: create the fid and the ris in background threads and the visa 
+## ResourceManager on first access. qkit.core.startup.report() shows the
+## time of every init stage and of the heavy imports.
+#cfg['startup_lazy'] = True # default: True
+#cfg['startup_profile'] = False # print the startup profile after qkit.start()
+
 ##
 ## File based QKIT logging for internal messages 
 ## the log file is located under cfg['logdir']
@@ -102,6 +161,22 @@ cfg['stdout_log_level'] = 'WARNING'
 ## Make png files at the end of the measurement
 ##
 #cfg['save_png'] = True
+## The plots are rendered in a pool of worker processes, 0 renders them in
+## the measurement process. At most 'save_plots_queue' files wait for
+## rendering, further calls wait until one is done.
+#cfg['save_plots_processes'] = 2 # default: 2
+#cfg['save_plots_queue'] = 4 # default: 4
+## Matrices and box slices are plotted with at most this many points per
+## axis (strided read), None plots all points.
+#cfg['save_plots_preview_points'] = None # default: None
+
+##
+## Resonator fits with fit_all run in a pool of worker processes,
+## None uses one process per cpu, 1 fits in the calling process.
+#cfg['resonator_fit_processes'] = None # default: None
+## Each fit starts from the result of the previous trace within chunks of
+## 'resonator_fit_chunk' traces, independent of the number of processes.
+#cfg['resonator_fit_chunk'] = 32 # default: 32
 
 ##
 ## QT related options
@@ -176,6 +176,11 @@ class FlowControl(object):
         '''Request an abort.'''
         self._abort = True
 
+    def abort_requested(self):
+        '''Return whether an abort is requested, without handling it
+        (used by background threads, e.g. the ramp engine).'''
+        return self._abort
+
     def is_paused(self):
         return self._pause
 
@@ -20,11 +20,13 @@ from __future__ import print_function
 import copy
 import inspect
 import logging
+import threading
 import time
 
 import numpy as np
 
 import qkit
+from qkit.core.lib import ramp as ramp_engine
 
 
 class Instrument(object):
@@ -38,6 +40,14 @@ class Instrument(object):
     Implement an instrument:
     In __init__ call self.add_variable(<name>, <option dict>)
     Implement _do_get_<variable> and _do_set_<variable> functions
+
+    Optionally, a driver can read and write several parameters with one
+    command (e.g. a semicolon-joined SCPI query) by implementing
+        _do_get_multiple(names, **kwargs) -> {name: value}
+        _do_set_multiple({name: value}, **kwargs)
+    They are used by get(<list>) and set(<dict>). Parameters missing in the
+    returned dict of _do_get_multiple are read one by one. Values passed to
+    _do_set_multiple are already checked and converted as in set().
     """
 
 
@@ -68,6 +78,14 @@ class Instrument(object):
         self._added_methods = []
         self._probe_ids = []
         self._offsets = {}
+        # names of parameters whose cached value was not yet read from the
+        # device, see Insttools.create(prefetch='background')
+        self._stale = set()
+        # held by get/set of parameters, so that the prefetch thread and parameter
+        # access of the user do not interleave. Direct driver calls do not take it.
+        self._io_lock = threading.RLock()
+        # running ramp per parameter, see _start_ramp
+        self._ramps = {}
 
     def __str__(self):
         return "Instrument '%s'" % (self.get_name())
@@ -550,7 +568,7 @@ class Instrument(object):
 
         flags = p['flags']
         if not query or flags & 8: #self.FLAG_SOFTGET:
-            if 'value' in p:
+            if 'value' in p and name not in self._stale:
                 if p['type'] == np.ndarray:
                     return self._offset(name,np.array(p['value']),+1)
                 else:
@@ -572,7 +590,16 @@ class Instrument(object):
             return None
 
         func = p['get_func']
-        value = func(**kwargs)
+        with self._io_lock:
+            value = func(**kwargs)
+        return self._store_value(name, value)
+
+    def _store_value(self, name, value):
+        '''
+        Casts a value read from the device to the parameter type, caches it
+        and returns it including the offset.
+        '''
+        p = self._parameters[name]
         if 'type' in p and value is not None:
             try:
                 if p['type'] == bytes or p['type'] == type(None):
@@ -585,6 +612,7 @@ class Instrument(object):
                 logging.warning('Unable to cast value "%s" to %s', value, p['type'])
 
         p['value'] = value
+        self._stale.discard(name)
         return self._offset(name,value,+1)
 
     def get(self, name, query=True, fast=False, **kwargs):
@@ -603,8 +631,9 @@ class Instrument(object):
         '''
         if type(name) in (list, tuple):
             result = {}
+            fetched = self._get_multiple([key for key in name if self._needs_query(key, query)], **kwargs)
             for key in name:
-                val = self._get_value(key, query, **kwargs)
+                val = self._get_value(key, query and key not in fetched, **kwargs)
                 if val is not None:
                     result[key] = val
         else:
@@ -612,6 +641,30 @@ class Instrument(object):
         qkit.flow.sleep()
         return result
 
+    def _needs_query(self, name, query):
+        '''
+        Returns whether getting the parameter name reads it from the device.
+        '''
+        p = self._parameters.get(name)
+        if p is None or not p['flags'] & self.FLAG_GET or p['flags'] & self.FLAG_SOFTGET:
+            return False
+        return query or 'value' not in p or name in self._stale
+
+    def _get_multiple(self, names, **kwargs):
+        '''
+        Reads the parameters names with the driver's _do_get_multiple, if 
+        available, and caches the values.
+
+        Output: set of the names that were read
+        '''
+        if not names or not hasattr(self, '_do_get_multiple'):
+            return set()
+        with self._io_lock:
+            values = self._do_get_multiple(list(names), **kwargs)
+        for key, value in values.items():
+            self._store_value(key, value)
+        return set(values.keys())
+
     def get_threaded(self, *args, **kwargs):
         logging.error('Using threading functions is not supported. Redirecting to normal get')
         return self.get(*args, **kwargs)
@@ -643,16 +696,15 @@ class Instrument(object):
 
         return value
 
-    def _set_value(self, name, value, **kwargs):
+    def _check_set_value(self, name, value):
         '''
-        Private wrapper function to set a value.
+        Removes the offset from a value to be set, casts it to the parameter
+        type and checks the bounds.
 
         Input:  (1) name of parameter (string)
-                (2) value of parameter (whatever type the parameter supports).
-                    Type casting is performed if necessary.
-                (3) Optional keyword args that will be passed on.
-        Output: Value returned by the _do_set_<name> function,
-                or result of get in FLAG_GET_AFTER_SET specified.
+                (2) value of parameter
+        Output: (settable, value), settable is False if the parameter 
+                does not support setting.
         '''
         if name in self._parameters:
             p = self._parameters[name]
@@ -661,10 +713,7 @@ class Instrument(object):
 
         if not p['flags'] & Instrument.FLAG_SET:
             print('Instrument does not support setting of %s' % name)
-            return None
-
-        if 'channel' in p and 'channel' not in kwargs:
-            kwargs['channel'] = p['channel']
+            return False, None
 
         value = self._offset(name, value, -1)
 
@@ -682,20 +731,34 @@ class Instrument(object):
                 raise qkit.instruments.InstrumentBoundsError('Cannot set %s.%s to %g: With offset %g, %s at %s would be %g, which is too large (Maximum: '
                                                              '%g)' % (self._name, name, value+self._offsets[name],self._offsets[name],name,self._name,value, p['maxval']))
             raise qkit.instruments.InstrumentBoundsError('Cannot set %s.%s to %s: value too large (Maximum: %g)' % (self._name, name, value, p['maxval']))
+        return True, value
 
-        func = p['set_func']
-        if 'maxstep' in p and p['maxstep'] is not None:
-            curval = p['value']
-            if curval is None:
-                logging.warning('Current value not available, ignoring maxstep')
-                curval = value + 0.01 * p['maxstep']
+    def _set_value(self, name, value, **kwargs):
+        '''
+        Private wrapper function to set a value.
 
-            sign = np.sign(value - curval)
-            for v in np.arange(curval, value, sign * np.abs(p['maxstep'])):
-                func(v, **kwargs)  # execute the set function
-                time.sleep(p.get('stepdelay', 50) / 1000.)
+        Input:  (1) name of parameter (string)
+                (2) value of parameter (whatever type the parameter supports).
+                    Type casting is performed if necessary.
+                (3) Optional keyword args that will be passed on.
+        Output: Value returned by the _do_set_<name> function,
+                or result of get in FLAG_GET_AFTER_SET specified.
+        '''
+        settable, value = self._check_set_value(name, value)
+        if not settable:
+            return None
+        p = self._parameters[name]
 
-        func(value, **kwargs)  # execute the set function to get the final value
+        if 'channel' in p and 'channel' not in kwargs:
+            kwargs['channel'] = p['channel']
+
+        func = p['set_func']
+        if 'maxstep' in p and p['maxstep'] is not None:
+            # stepwise, see qkit.core.lib.ramp
+            self._start_ramp(name, value, inline=self._ramp_inline(), **kwargs).wait()
+        else:
+            with self._io_lock:
+                func(value, **kwargs)  # execute the set function
 
         if p['flags'] & self.FLAG_GET_AFTER_SET:
             newvalue = self._offset(name,self._get_value(name, **kwargs),-1)
@@ -704,9 +767,91 @@ class Instrument(object):
             value = newvalue
 
         p['value'] = value
+        self._stale.discard(name)
         return value
 
-    def set(self, name, value=None, fast=False, **kwargs):
+    def _ramp_inline(self):
+        '''
+        True if a ramp has to be stepped in the calling thread: the ramp engine
+        can not run it while the caller is a step of the engine itself or holds
+        the io lock, which every step takes.
+        '''
+        return ramp_engine.engine.in_engine_thread() or self._io_lock._is_owned()
+
+    def _start_ramp(self, name, value, inline=False, **kwargs):
+        '''
+        Starts a stepwise ramp of parameter name to value (already checked
+        and converted, see _check_set_value) in the ramp engine, or steps it
+        in the calling thread with inline=True.
+        A running ramp of the same parameter is stopped first, the new ramp
+        starts at the value it reached.
+
+        Output: Ramp handle
+        '''
+        p = self._parameters[name]
+        func = p['set_func']
+        stepdelay = p.get('stepdelay', 50)
+
+        def step(v):
+            with self._io_lock:
+                func(v, **kwargs)  # execute the set function
+            p['value'] = v
+
+        # the io lock is held during the steps of the ramps, so a running step is finished first
+        with self._io_lock:
+            running = self._ramps.get(name)
+            if running is not None and not running.done():
+                logging.info("%s.%s: ramp to %s stopped at %s for the new ramp to %s" % (self._name, name, running._values[-1], running.stop(), value))
+            curval = p.get('value', None)
+            if curval is None:
+                logging.warning('Current value not available, ignoring maxstep')
+                curval = value + 0.01 * p['maxstep']
+            # the current value is not set again
+            values = list(np.arange(curval, value, np.sign(value - curval) * np.abs(p['maxstep']))[1:]) if value != curval else []
+            ramp = ramp_engine.Ramp('%s.%s' % (self._name, name), values + [value], stepdelay / 1000., step, lock=self._io_lock)
+            self._ramps[name] = ramp
+        if hasattr(self, '_do_ramp'):
+            def native():
+                with self._io_lock:
+                    self._do_ramp(name, value, p['maxstep'], stepdelay, **kwargs)
+                p['value'] = value
+            return ramp_engine.engine.submit_native(ramp, native, inline=inline)
+        return ramp_engine.engine.submit(ramp, inline=inline)
+
+    def ramp(self, name, value, **kwargs):
+        '''
+        Set a parameter without waiting for its ramp.
+
+        Parameters with a rate (maxstep, see set_parameter_rate) are ramped
+        in the background; ramps of several parameters and instruments run
+        in parallel. Other parameters, and parameters read back after setting
+        (FLAG_GET_AFTER_SET), are set before ramp returns.
+
+        Input:
+            name (string): parameter to set
+            value (any): the value to set
+            kwargs: Optional keyword args that will be passed on.
+
+        Output: Ramp handle, use wait() or result() to wait for the ramp,
+            or qkit.core.lib.ramp.wait_all(<list of handles>).
+            None if the parameter can not be set.
+        '''
+        settable, checked = self._check_set_value(name, value)
+        if not settable:
+            return None
+        p = self._parameters[name]
+        if 'channel' in p and 'channel' not in kwargs:
+            kwargs['channel'] = p['channel']
+        if p.get('maxstep') is None or p['flags'] & self.FLAG_GET_AFTER_SET:
+            ramp = ramp_engine.Ramp('%s.%s' % (self._name, name), [], 0, None)
+            ramp.value = self._set_value(name, value, **kwargs)
+            ramp._finish()
+            return ramp
+        ramp = self._start_ramp(name, checked, inline=self._ramp_inline(), **kwargs)
+        self._stale.discard(name)
+        return ramp
+
+    def set(self, name, value=None, fast=False, wait=True, **kwargs):
         '''
         Set one or more Instrument parameter values.
 
@@ -719,6 +864,8 @@ class Instrument(object):
             value (any): the value to set
             fast (bool): if True perform as fast as possible, e.g. don't
                 emit a signal to update the GUI.
+            wait (bool): only for dicts: wait for the ramps of parameters 
+                with a rate, which run in parallel (default True)
             kwargs: Optional keyword args that will be passed on.
 
         Output: True or False whether the operation succeeded.
@@ -728,12 +875,29 @@ class Instrument(object):
         result = True
         changed = {}
         if type(name) == dict:
-            for key, val in name.items():
+            values = dict(name)
+            for key, val in self._set_multiple(values, **kwargs).items():
+                changed[key] = val
+                del values[key]
+            # parameters with a rate are ramped in parallel
+            ramps = []
+            for key, val in list(values.items()):
+                p = self._parameters.get(key)
+                if p is not None and p.get('maxstep') is not None and not self._ramp_inline():
+                    ramp = self.ramp(key, val, **kwargs)
+                    if ramp is None:
+                        result = False
+                    else:
+                        ramps.append(ramp)
+                    del values[key]
+            for key, val in values.items():
                 val = self._set_value(key, val, **kwargs)
                 if val is not None:
                     changed[key] = val
                 else:
                     result = False
+            if wait:
+                ramp_engine.wait_all(ramps)
 
         else:
             val = self._set_value(name, value, **kwargs)
@@ -745,6 +909,33 @@ class Instrument(object):
         qkit.flow.sleep()
         return result
 
+    def _set_multiple(self, values, **kwargs):
+        '''
+        Sets the parameters in values with the driver's _do_set_multiple, if
+        available. Parameters that ramp (maxstep) or are read back after 
+        setting (FLAG_GET_AFTER_SET) are left to _set_value.
+
+        Output: dict of the parameters set -> set value
+        '''
+        if not hasattr(self, '_do_set_multiple'):
+            return {}
+        batch = {}
+        for key, val in values.items():
+            p = self._parameters.get(key)
+            if p is None or not p['flags'] & self.FLAG_SET or p.get('maxstep') is not None or p['flags'] & self.FLAG_GET_AFTER_SET:
+                continue
+            settable, val = self._check_set_value(key, val)
+            if settable:
+                batch[key] = val
+        if len(batch) < 2:
+            return {}
+        with self._io_lock:
+            self._do_set_multiple(batch, **kwargs)
+        for key, val in batch.items():
+            self._parameters[key]['value'] = val
+            self._stale.discard(key)
+        return batch
+
     def get_argspec_dict(self, a):
         return dict(args=a[0], varargs=a[1], keywords=a[2], defaults=a[3])
 
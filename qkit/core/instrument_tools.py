@@ -21,6 +21,9 @@ import inspect
 import os
 import logging
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import qkit.core.instrument_base as instrument
 
 import importlib
@@ -66,6 +69,7 @@ class Insttools(object):
         self._instruments = {}
         self._instruments_info = {}
         self._tags = []
+        self._lock = threading.RLock()  # instruments can be created in several threads, see create_many
         self._instdir       = qkit.cfg.get('instruments_dir')
         self._user_instdir  = qkit.cfg.get('user_instruments_dir')
 
@@ -85,16 +89,17 @@ class Insttools(object):
         Output: None
         '''
 
-        self._instruments[ins.get_name()] = ins
+        with self._lock:
+            self._instruments[ins.get_name()] = ins
 
-        info = {'create_args': create_args}
-        self._instruments_info[ins.get_name()] = info
+            info = {'create_args': create_args}
+            self._instruments_info[ins.get_name()] = info
 
-        newtags = []
-        for tag in ins.get_tags():
-            if tag not in self._tags:
-                self._tags.append(tag)
-                newtags.append(tag)
+            newtags = []
+            for tag in ins.get_tags():
+                if tag not in self._tags:
+                    self._tags.append(tag)
+                    newtags.append(tag)
 
     def get(self, name):
         '''
@@ -201,18 +206,46 @@ class Insttools(object):
         self.add(ins, create_args=kwargs)
         return self.get(name)
 
-    def create(self, name, instype, **kwargs):
+    prefetch_modes = ['all', 'background', 'none']
+
+    def create(self, name, instype, reload_driver=None, prefetch=None, **kwargs):
         '''
         Create an instrument called 'name' of type 'type'.
 
         Input:  (1) name of the newly created instrument (string)
                 (2) type of instrument (string)
-                (3) optional: keyword arguments.
+                (3) optional: reload_driver (bool), reload the driver module 
+                    even if it was imported before, 
+                    default: qkit.cfg['instruments_reload'] or False
+                (4) optional: prefetch, how the parameters are read from the
+                    device after the creation:
+                    'all': all gettable parameters are read before create
+                        returns. This ensures that all get functions work.
+                    'background': the parameters are read in a background
+                        thread. Until then, their cached values are stale and
+                        get(query=False) reads them from the device.
+                        Only get/set of parameters wait for the thread, direct
+                        driver calls (ask, write, get_tracedata, ...) are not
+                        synchronized with it; use them under ins._io_lock
+                        until the prefetch is done.
+                    'none': parameters are read on the first get.
+                    default: qkit.cfg['instruments_prefetch'] or 'all'
+                (5) optional: keyword arguments.
                     (1) tags, array of strings representing tags
                     (2) many instruments require address=<address>
 
         Output: Instrument object (Proxy)
+        
+        The time needed for the driver import, the initialization, the 
+        prefetch and the *IDN? query is logged and kept, see get_create_times.
         '''
+        if reload_driver is None:
+            reload_driver = qkit.cfg.get('instruments_reload', False)
+        if prefetch is None:
+            prefetch = qkit.cfg.get('instruments_prefetch', 'all')
+        if prefetch not in self.prefetch_modes:
+            logging.error('Unknown prefetch mode %s, use one of %s', prefetch, self.prefetch_modes)
+            raise ValueError
 
         if not self.type_exists(instype):
             logging.error('Instrument type %s not supported', instype)
@@ -222,22 +255,36 @@ class Insttools(object):
             logging.warning('Instrument "%s" already exists, removing', name)
             self.remove(name)
 
-        module = _get_driver_module(instype)
+        times = {}
+        t0 = time.time()
+        module = _get_driver_module(instype, do_reload=reload_driver)
         if module is None:
             return self._create_invalid_ins(name, instype, **kwargs)
-            
-        reload(module)
 
         insclass = getattr(module, instype, None)
         if insclass is None:
             logging.error('Driver does not contain instrument class')
             return self._create_invalid_ins(name, instype, **kwargs)
+        times['driver'] = time.time() - t0
 
         try:
+            t = time.time()
             ins = insclass(name, **kwargs)
-            for param_name in ins.get_parameter_names():
-                if ins.get_parameter_options(param_name)['flags'] & ins.FLAG_GET: # do not query non-get or softget parameters
+            times['init'] = time.time() - t
+            t = time.time()
+            # do not query non-get or softget parameters
+            param_names = [param_name for param_name in ins.get_parameter_names()
+                           if ins.get_parameter_options(param_name)['flags'] & ins.FLAG_GET
+                           and not ins.get_parameter_options(param_name)['flags'] & ins.FLAG_SOFTGET]
+            if prefetch == 'all':
+                for param_name in param_names:
                     ins.get(param_name)  # Get all device parameters. This ensures that all get functions are working.
+            elif prefetch == 'background':
+                ins._stale.update(param_names)
+                thread = threading.Thread(target=self._prefetch_parameters, args=(ins, param_names), name='prefetch_%s' % name)
+                thread.daemon = True
+                thread.start()
+            times['prefetch'] = time.time() - t
         except Exception as e:
             TB()
             logging.error('Error creating instrument %s: %s', name,e)
@@ -246,18 +293,96 @@ class Insttools(object):
         self.add(ins, create_args=kwargs)
         
         # Create a file where all created instruments with all parameters are stored once
+        t = time.time()
         try:
-            idn = ins.ask("*IDN?").strip()
+            # the prefetch thread might query the device at the same time
+            with ins._io_lock:
+                idn = ins.ask("*IDN?").strip()
         except:
             idn = "__none__"
+        times['idn'] = time.time() - t
         descr = str(name)+"#"+str(instype)+"#"+idn+"#"+str(kwargs)+"\r\n"
         fname = os.path.join(qkit.cfg['datadir'], "instrument.txt")  # save to datadir, because this is synced to backup server
-        open(fname, "a").close() #create file if not existing
-        with open(fname, "r+") as f:
-            if not descr.strip() in [r.strip() for r in f.readlines()]:
-                f.write(descr)
+        with self._lock:
+            open(fname, "a").close() #create file if not existing
+            with open(fname, "r+") as f:
+                if not descr.strip() in [r.strip() for r in f.readlines()]:
+                    f.write(descr)
+        times['total'] = time.time() - t0
+        self._instruments_info[name]['create_times'] = times
+        logging.info('Created instrument %s in %.2fs (driver %.2fs, init %.2fs, prefetch %.2fs, IDN %.2fs)',
+                     name, times['total'], times['driver'], times['init'], times['prefetch'], times['idn'])
         return self.get(name)
 
+    @staticmethod
+    def _prefetch_parameters(ins, param_names):
+        '''
+        Reads the parameters from the device, used as background thread by 
+        create(prefetch='background'). Parameters read in the meantime by 
+        the user are skipped.
+        '''
+        for param_name in param_names:
+            if param_name not in ins._stale:
+                continue
+            try:
+                ins._get_value(param_name)
+            except Exception as e:
+                logging.warning('Prefetch of %s.%s failed: %s', ins.get_name(), param_name, e)
+
+    def create_many(self, instruments, max_workers=None, **kwargs):
+        '''
+        Create several instruments concurrently in a thread pool.
+
+        The instruments have to be independent of each other. Instruments 
+        that use other instruments (e.g. virtual instruments) have to be 
+        created afterwards.
+
+        Input:  (1) list of (name, type) or (name, type, {keyword arguments})
+                (2) optional: number of threads, default: one per instrument
+                (3) optional: keyword arguments for create() common to all
+                    instruments, e.g. prefetch='background'
+        Output: dict of name -> Instrument object
+
+        Example:
+            qkit.instruments.create_many([('vna', 'Keysight_VNA_E5071C', {'address': 'TCPIP0::...'}),
+                                          ('mw_src', 'Anritsu_MG37022', {'address': 'GPIB::3'})])
+        '''
+        jobs = []
+        for entry in instruments:
+            create_args = dict(kwargs)
+            if len(entry) > 2:
+                create_args.update(entry[2])
+            jobs.append((entry[0], entry[1], create_args))
+        names = [name for name, _, _ in jobs]
+        if len(set(names)) != len(names):
+            logging.error('create_many: instrument names are not unique: %s', names)
+            raise ValueError
+
+        t0 = time.time()
+        created = {}
+        with ThreadPoolExecutor(max_workers=max_workers or max(1, len(jobs))) as pool:
+            futures = [(name, pool.submit(self.create, name, instype, **create_args)) for name, instype, create_args in jobs]
+            for name, future in futures:
+                try:
+                    created[name] = future.result()
+                except Exception as e:
+                    logging.error('Error creating instrument %s: %s', name, e)
+                    created[name] = None
+        logging.info('Created %d instruments in %.2fs, slowest: %s', len(jobs), time.time() - t0,
+                     ', '.join('%s %.2fs' % (name, t) for name, t in
+                               sorted(((name, times['total']) for name, times in self.get_create_times().items() if name in created),
+                                      key=lambda x: -x[1])[:3]))
+        return created
+
+    def get_create_times(self):
+        '''
+        Return the times needed to create the instruments.
+
+        Output: dict of name -> {'driver', 'init', 'prefetch', 'idn', 'total'}
+            in seconds, for all instruments created by create()
+        '''
+        return {name: info['create_times'] for name, info in self._instruments_info.items() if 'create_times' in info}
+
     def reload_module(self, instype):
         module = _get_driver_module(instype, do_reload=True)
         return module is not None
@@ -328,9 +453,10 @@ class Insttools(object):
         Input:  (1) instrument name
         Output: None
         '''
-        if name in self._instruments:
-            del self._instruments[name]
-            del self._instruments_info[name]
+        with self._lock:
+            if name in self._instruments:
+                del self._instruments[name]
+                del self._instruments_info[name]
 
     class InstrumentBoundsError(ValueError):
         "Base Error to raise when instrument is out of bounds"
@@ -40,12 +40,15 @@ class info_service(object):
             logging.warning("Not starting info service.")
             
         #zmq.ZMQError.errno
-        # wait until zmq is settled
-        time.sleep(0.3)
+        # zmq needs a moment until the subscribers are connected. Instead of
+        # blocking the startup, the first message waits for the rest of it.
+        self._settled = time.time() + 0.3
     
         
     def dist(self,topic, message = ""):
         "distribute a message"
+        # the deadline can pass between the check and the sleep
+        time.sleep(max(0, self._settled - time.time()))
         if SIGNALS.has_key(topic):
             sig = SIGNALS.get(topic)
             self.socket.send("%d:%s" % (sig, message))
@@ -19,6 +19,21 @@ fid_scan_hdf     = False
     This will open every h5 file found and extract attributes.
 fid_init_viewer  = True
     Make a database out of the dictionary of h5 files.
+fid_full_scan    = False
+    Inspect every file at startup. By default, only directories which changed 
+    since the last start are scanned.
+fid_scan_pool = 'process', fid_scan_workers = 8, fid_scan_timeout = 30
+    With fid_scan_hdf, new and changed h5 files are read in parallel on a 
+    pool of processes (or threads). Files taking longer than the timeout 
+    (in seconds) are skipped and read again at the next start.
+fid_watch        = 'auto'
+    After startup, a watcher feeds new, changed and deleted files into the 
+    databases: 'inotify' (Linux), 'poll' or 'auto'. False disables the 
+    watcher, new files of this session are then added after 20 s.
+    Use 'poll' for data directories on network shares, inotify does not see 
+    files written by other machines.
+fid_watch_interval = None
+    Seconds between two updates, default: 2 (inotify), 30 (poll).
 
 
 databases
@@ -71,6 +86,13 @@ qkit.fid.view(file_id)
 qkit.fid.get_uuid(time)
 qkit.fid.get_time(uuid)
 qkit.fid.get_date(uuid)
+qkit.fid.query(user='...', since='2024-01-01', rating=10)
+
+
+file index
+==========
+The file infos are kept in an SQLite index in qkit.cfg['logdir'] (fid_index.sqlite),
+which is updated incrementally, see file_info_index.py.
 """
 
 
@@ -181,11 +203,11 @@ class fid(file_system_service):
             Deletes all cached database files and rescans the whole directory tree.
             Use this if your database looks strange.
         '''
+        self.stop_watcher()
         self.h5_db = {}
         self.set_db = {}
         self.measure_db = {}
         self.h5_info_db = {}
-        self._h5_n_mtime = {}
         
         self._remove_cache_files()
         self.create_database()
@@ -195,14 +217,26 @@ class fid(file_system_service):
         """
         self.update_file_db()
         self.update_grid_db()
+        if qkit.cfg.get('fid_scan_datadir', True):
+            self.start_watcher()
 
-    def update_grid_db(self):
+    def update_grid_db(self, incremental=False):
+        """
+        updates the data frame of the grid viewer. 
+        With incremental=True, only the rows of files changed since the last 
+        update are replaced, otherwise the data frame is created from scratch.
+        """
         with self.lock:
+            changed, removed = self._changed_uuids, self._removed_uuids
+            self._changed_uuids, self._removed_uuids = set(), set()
             if qkit.cfg.get('fid_init_viewer',qkit.module_available['pandas']):  # Pandas ist needed here, so if fid_init_viewer is not set, we make it dependent on pandas
                 qkit.cfg['fid_init_viewer'] = True
                 if not qkit.module_available['pandas']:
                     raise ImportError("pandas not found. Pandas is needed for the fid viewer.\nInstall pandas or set qkit.cfg['fid_init_viewer']=False")
-                self._initiate_basic_df()
+                if incremental and getattr(self, 'df', None) is not None:
+                    self._update_basic_df(changed, removed)
+                else:
+                    self._initiate_basic_df()
             else:
                 qkit.cfg['fid_init_viewer'] = False
     
@@ -253,16 +287,31 @@ class fid(file_system_service):
                 self.df = pd.DataFrame(columns=['datetime', 'name', 'run', 'user'])
             else:
                 self.df = pd.DataFrame(self.h5_info_db).T
-        
+            self.df = self._format_df(self.df)
+
+        def _update_basic_df(self, changed, removed):
+            """
+            Replaces the rows of changed and removed files instead of 
+            creating the whole data frame again.
+            """
+            df = self.df.drop([u for u in set(changed) | set(removed) if u in self.df.index])
+            new = {u: self.h5_info_db[u] for u in changed if u in self.h5_info_db}
+            if new:
+                df = pd.concat([df, self._format_df(pd.DataFrame(new).T)], sort=False)
+                df.fillna("", inplace=True)
+            self.df = df
+
+        def _format_df(self, df):
             if qkit.cfg.get('fid_scan_hdf', False):
-                # self.df = self.df[['datetime', 'name', 'run', 'user', 'comment', 'fit_time', 'fit_freq', 'rating']]
+                # df = df[['datetime', 'name', 'run', 'user', 'comment', 'fit_time', 'fit_freq', 'rating']]
                 for key in ['rating', 'fit_time', 'fit_freq']:
-                    if key in self.df.keys():
-                        self.df[key] = pd.to_numeric(self.df[key], errors='coerce')
+                    if key in df.keys():
+                        df[key] = pd.to_numeric(df[key], errors='coerce')
             else:
-                self.df = self.df[['datetime', 'name', 'run', 'user']]
-            self.df['datetime'] = pd.to_datetime(self.df['datetime'], errors='coerce')
-            self.df.fillna("", inplace=True)  # Replace NAs with empty string to be able to detect changes
+                df = df[['datetime', 'name', 'run', 'user']].copy()
+            df['datetime'] = pd.to_datetime(df['datetime'], errors='coerce')
+            df.fillna("", inplace=True)  # Replace NAs with empty string to be able to detect changes
+            return df
         
         def _get_settings_column(self, device, setting, uid=None, update_hdf=False):
             dfsetting = pd.DataFrame()
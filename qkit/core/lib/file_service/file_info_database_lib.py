@@ -6,13 +6,76 @@ import logging
 import time
 import json
 import numpy as np
+import itertools
+import multiprocessing
+import concurrent.futures
 import qkit.storage.hdf_DateTimeGenerator as dtg
 import h5py
 
-try:
-    import cPickle as pickle
-except:
-    import pickle
+from qkit.core.lib.file_service.file_info_index import file_info_index
+from qkit.core.lib.file_service.file_watcher import create_watcher
+
+def read_hdf_info(path):
+    """
+    reads comment, fit values, measurement infos and the analysis0 attributes
+    of a h5 file for the h5_info_db.
+
+    This is a module level function, so that it can run on a process pool.
+    Returns the info dict and an error message (or None).
+    """
+    h5_info_db = {'rating':10}
+    error = None
+    try:
+        with h5py.File(path,'r') as h5f:
+            if "comment" in  h5f['/entry/data0'].attrs:
+                h5_info_db.update({'comment': h5f['/entry/data0'].attrs['comment']})
+            if "dr_values" in h5f['/entry/analysis0']:
+                try:
+                    # this is legacy and should be removed at some point
+                    # please use the entry/analysis0 attributes instead.
+                    fit_comment = h5f['/entry/analysis0/dr_values'].attrs.get('comment',"").split(', ')
+                    comm_begin = [i[0] for i in fit_comment]
+                    try:
+                        h5_info_db.update({'fit_freq': float(h5f['/entry/analysis0/dr_values'][comm_begin.index('f')])})
+                    except (ValueError, IndexError):
+                        pass
+                    try:
+                        h5_info_db.update({'fit_time': float(h5f['/entry/analysis0/dr_values'][comm_begin.index('T')])})
+                    except (ValueError, IndexError):
+                        pass
+                except (KeyError, AttributeError):
+                    pass
+            if "measurement" in h5f['/entry/data0']:
+                try:
+                    mmt = json.loads(h5f['/entry/data0/measurement'][0])
+                    h5_info_db.update(
+                            {arg: mmt[arg] for arg in ['run_id', 'user', 'rating', 'smt'] if mmt.has_key(arg)}
+                    )
+                except(AttributeError, KeyError):
+                    pass
+            try:
+                h5_info_db.update(dict(h5f['/entry/analysis0'].attrs))
+            except(AttributeError, KeyError):
+                pass
+    except KeyError as e:
+        logging.debug("fid could not index file {}, probably it is just new and empty. Original message: {}".format(path,e))
+    except IOError as e:
+        error = "fid {}:{}".format(path,e)
+    return h5_info_db, error
+
+
+def _terminate_pool(executor):
+    """
+    shuts a pool down without waiting for it. The worker processes are 
+    terminated, so that workers stuck on a file do not block the interpreter 
+    at exit. The threads of a thread pool can not be stopped and are left behind.
+    """
+    processes = list((getattr(executor, '_processes', None) or {}).values())
+    executor.shutdown(wait=False)
+    for p in processes:
+        if p.is_alive():
+            p.terminate()
+
 
 class UUID_base(object):
     _alphabet = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
@@ -67,50 +130,40 @@ class file_system_service(UUID_base):
     measure_db = {}
     h5_info_db = {}
 
-    _h5_n_mtime = {}
-    
+    _index = None
+    _index_path = os.path.join(qkit.cfg['logdir'],"fid_index.sqlite")
+    # cache files of older qkit versions, replaced by the index
     _h5_mtime_db_path   = os.path.join(qkit.cfg['logdir'],"h5_mtime.db")
     _h5_info_cache_path = os.path.join(qkit.cfg['logdir'],"h5_info_cache.db")
 
+    _extensions = {'.h5': 'h5', '.set': 'set', '.measurement': 'measurement'}
+
+    # live updates, see start_watcher()
+    _watcher = None
+    _recent_files = {}
+    # uuids changed since the last update_grid_db()
+    _changed_uuids = set()
+    _removed_uuids = set()
+
     lock = threading.Lock()
     
     def _remove_cache_files(self):
         """
-            remove cached files to recreate the database
+            remove the index and cached files to recreate the database
         """
-        for f in [self._h5_mtime_db_path,self._h5_info_cache_path]:
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+        for f in [self._index_path,self._h5_mtime_db_path,self._h5_info_cache_path]:
             if os.path.isfile(f):
                 os.remove(f)
 
-    def _load_cache_files(self):
-        """ to speed up things, try to load the h5 
-            information from previous runs. 
-        """
-        self._new_cache = False
-        self._h5_mtime_db = {}
-        self._h5_info_cache_db = {}
-        self._n_mtime = {}
-        try:
-            with open(self._h5_mtime_db_path,'rb') as f:
-                self._h5_mtime_db = pickle.load(f)
-            with open(self._h5_info_cache_path,'rb') as f:
-                self._h5_info_cache_db = pickle.load(f)
-        except IOError as e:
-            logging.info("m_time_db not found. Not using cached files for now. %s"%e)
-            self._new_cache = True
-
-    def _store_cache_files(self):
-        """ writes the cached files on disk, 
-        qkit.cfg['logdir'] is used by default.
-
-        exeptions are not handled ... if something fails here 
-        there is a severe general problem, e.g. the disk is full.
+    def _open_index(self):
+        """ opens the persistent file index in qkit.cfg['logdir'].
         """
-        write_protocol = 2 # For Python 2 compatibility 0=text, 1...x binary, -1 highest binary. 
-        with open(self._h5_mtime_db_path,'wb+') as f:
-            pickle.dump(self._h5_n_mtime,f,protocol=write_protocol)
-        with open(self._h5_info_cache_path,'wb+') as f:
-            pickle.dump(self.h5_info_db,f,protocol=write_protocol)
+        if self._index is None:
+            self._index = file_info_index(self._index_path)
+        return self._index
 
     def _get_datadir(self):
         if qkit.cfg.get('fid_restrict_to_userdir',False):
@@ -118,23 +171,246 @@ class file_system_service(UUID_base):
         else:
             return qkit.cfg['datadir']
 
-    def update_file_db(self):
+    def update_file_db(self, full_scan=None, progress=None):
+        """
+        updates the persistent file index and loads h5_db, set_db, measure_db 
+        and h5_info_db from it.
+
+        Directories whose modification time did not change since the last 
+        scan are skipped, their content is taken from the index. Files changed 
+        in place by other programs are only found with full_scan=True 
+        (default: qkit.cfg['fid_full_scan']) or after recreate_database().
+        
+        With qkit.cfg['fid_scan_hdf'], the attributes of new and changed h5 
+        files are read on a worker pool, see _harvest_hdf_infos(). 
+        progress(done, total) is called for every file read.
+        """
         with self.lock:
             start_time = time.time()
-            self._load_cache_files()
+            self._open_index()
+            datadir = self._get_datadir()
             if qkit.cfg.get('fid_scan_datadir',True):
                 qkit.cfg['fid_scan_datadir'] = True
+                if full_scan is None:
+                    full_scan = qkit.cfg.get('fid_full_scan', False)
                 logging.debug("file info database: Start to update database.")
-                for root, _ , files in os.walk(self._get_datadir()): # root, dirs, files
-                    for f in files:
-                        self._inspect_and_add_Leaf(f,root)
+                self._scan_dir(datadir, full_scan)
+                if qkit.cfg.get('fid_scan_hdf', False):
+                    # new and changed files as well as files indexed while fid_scan_hdf was off
+                    self._harvest_hdf_infos(self._index.get_unscanned_h5_files(datadir), progress)
+                self._index.commit()
                 logging.debug("file info database: Updating database done.")
-            self._store_cache_files()
+            h5_db, set_db, measure_db, h5_info_db = self._index.load(datadir)
+            for db, new in [(self.h5_db, h5_db), (self.set_db, set_db), (self.measure_db, measure_db), (self.h5_info_db, h5_info_db)]:
+                db.clear()
+                db.update(new)
             print ("Initialized the file info database (qkit.fid) in %.3f seconds."%(time.time()-start_time))
 
+    def _scan_dir(self, datadir, full_scan=False):
+        """
+        walks through datadir and updates the index.
+
+        Only directories with a changed modification time are listed and 
+        only files with a changed modification time or size are inspected.
+        """
+        dir_mtimes, children = self._index.get_dirs()
+        stack = [(datadir, os.path.dirname(datadir))]
+        while stack:
+            path, parent = stack.pop()
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                self._remove_dir(path)
+                continue
+            if not full_scan and dir_mtimes.get(path) == mtime:
+                stack += [(d, path) for d in children.get(path, [])]
+                continue
+            known_files = self._index.get_files(path)
+            subdirs = []
+            try:
+                entries = list(os.scandir(path))
+            except OSError as e:
+                logging.error("fid could not scan directory {}: {}".format(path, e))
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif os.path.splitext(entry.name)[1] in self._extensions:
+                    st = entry.stat()
+                    if known_files.pop(entry.path, None) != (st.st_mtime, st.st_size):
+                        # the h5 attributes are read afterwards in parallel
+                        self._index_file(entry.path, st, read_hdf=False)
+            for f in known_files:
+                self._remove_file(f)
+            for d in set(children.get(path, [])) - set(subdirs):
+                self._remove_dir(d)
+            self._index.set_dir(path, parent, mtime)
+            stack += [(d, path) for d in subdirs]
+
+    def _index_file(self, fqpath, st, hdf_scanned=None, read_hdf=True):
+        """
+        adds a .h5, .set or .measurement file to the index.
+        The infos of h5 files are collected by _collect_info(), with 
+        read_hdf=False only the infos from the file path are stored.
+        Files with hdf_scanned=False are inspected again at the next 
+        update_file_db() if qkit.cfg['fid_scan_hdf'] is set.
+        """
+        scan_hdf = read_hdf and qkit.cfg.get('fid_scan_hdf', False)
+        if hdf_scanned is None:
+            hdf_scanned = scan_hdf
+        fname = os.path.basename(fqpath)
+        uuid = fname[:6]
+        ext = self._extensions[os.path.splitext(fname)[1]]
+        info = None
+        if ext == 'h5':
+            info = self._collect_info(uuid, fqpath, scan_hdf) # collect_info is expensive.
+        self._index.set_file(fqpath, uuid, ext, st.st_mtime, st.st_size, info, hdf_scanned=hdf_scanned)
+        {'h5': self.h5_db, 'set': self.set_db, 'measurement': self.measure_db}[ext][uuid] = fqpath
+        if ext == 'h5':
+            self._changed_uuids.add(uuid)
+            if self._watcher is not None:
+                self._recent_files.setdefault(fqpath, time.time())
+
+    def _remove_file(self, path):
+        """
+        removes a file from the index and the databases.
+        """
+        self._index.remove_file(path)
+        uuid = os.path.basename(path)[:6]
+        ext = self._extensions.get(os.path.splitext(path)[1])
+        db = {'h5': self.h5_db, 'set': self.set_db, 'measurement': self.measure_db}.get(ext)
+        if db is not None and db.get(uuid) == path:
+            del db[uuid]
+            if ext == 'h5':
+                self.h5_info_db.pop(uuid, None)
+                self._removed_uuids.add(uuid)
+
+    def _remove_dir(self, path):
+        for f in self._index.remove_dir(path):
+            self._remove_file(f)
+
+    def _harvest_hdf_infos(self, files, progress=None):
+        """
+        reads the h5 attributes of files [(uuid, path)] and merges them into 
+        h5_info_db and the index as they arrive.
+
+        The files are read on a pool of qkit.cfg['fid_scan_workers'] processes 
+        (qkit.cfg['fid_scan_pool'] = 'process', default) or threads ('thread').
+        The processes are spawned, not forked, as this runs on a background 
+        thread of the fid. A file that takes longer than 
+        qkit.cfg['fid_scan_timeout'] seconds is skipped and retried at the 
+        next start, so a corrupt or locked file does not stall the scan. 
+        Small numbers of files are read directly.
+
+        At most one file per worker is submitted at a time, so every file 
+        starts right away and its deadline counts from the submission. On a 
+        timeout, the workers of the pool are terminated and the files that 
+        were still being read go to a new pool together with the remaining 
+        ones. If twice as many files as there are workers time out in a row 
+        (e.g. an unreachable network drive), the remaining files are skipped 
+        as well.
+        """
+        total = len(files)
+        if not total:
+            return
+        workers = int(qkit.cfg.get('fid_scan_workers', min(8, os.cpu_count() or 1)))
+        timeout = float(qkit.cfg.get('fid_scan_timeout', 30))
+        done_count = 0
+
+        def merge(uuid, path, hdf_info, error, hdf_scanned=True):
+            info = self._collect_info(uuid, path, scan_hdf=False)
+            info.update(hdf_info)
+            if error:
+                logging.error(error)
+            try:
+                st = os.stat(path)
+            except OSError:
+                return
+            self._index.set_file(path, uuid, 'h5', st.st_mtime, st.st_size, info, hdf_scanned=hdf_scanned)
+            self._changed_uuids.add(uuid)
+
+        if workers <= 1 or total < 2 * workers:
+            for uuid, path in files:
+                merge(uuid, path, *read_hdf_info(path))
+                done_count += 1
+                if progress:
+                    progress(done_count, total)
+            return
+
+        logging.info("file info database: reading {} h5 files on {} workers.".format(total, workers))
+        def new_executor():
+            if qkit.cfg.get('fid_scan_pool', 'process') == 'thread':
+                return concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+            return concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+        executor = new_executor()
+        todo = iter(files)
+        running = {}  # future: (uuid, path, deadline)
+        timeouts_in_row = 0
+        try:
+            while True:
+                while len(running) < workers:
+                    try:
+                        uuid, path = next(todo)
+                    except StopIteration:
+                        break
+                    running[executor.submit(read_hdf_info, path)] = (uuid, path, time.time() + timeout)
+                if not running:
+                    break
+                done, not_done = concurrent.futures.wait(list(running), timeout=min(1., timeout), return_when=concurrent.futures.FIRST_COMPLETED)
+                now = time.time()
+                finished = [(f, True) for f in done] + [(f, False) for f in not_done if now > running[f][2]]
+                broken = False
+                for f, completed in finished:
+                    uuid, path, deadline = running.pop(f)
+                    if completed:
+                        timeouts_in_row = 0
+                        try:
+                            merge(uuid, path, *f.result())
+                        except concurrent.futures.BrokenExecutor:
+                            # a worker died (e.g. a crash of the hdf library), the file is retried at the next start
+                            broken = True
+                            logging.warning("fid: a worker died while reading {}, skipped for now.".format(path))
+                            merge(uuid, path, {}, None, hdf_scanned=False)
+                        except Exception as e:
+                            merge(uuid, path, {}, "fid {}:{}".format(path, e))
+                    else:
+                        timeouts_in_row += 1
+                        logging.warning("fid: reading {} took longer than {} s, skipped for now.".format(path, timeout))
+                        merge(uuid, path, {}, None, hdf_scanned=False)
+                    done_count += 1
+                    if progress:
+                        progress(done_count, total)
+                if not broken and all(completed for f, completed in finished):
+                    continue
+                # the workers of the skipped files are stuck, the files still being read start again in a new pool
+                retry = [(uuid, path) for uuid, path, deadline in running.values()]
+                for f in running:
+                    f.cancel()
+                running = {}
+                _terminate_pool(executor)
+                todo = itertools.chain(retry, todo)
+                if timeouts_in_row < 2 * workers:
+                    executor = new_executor()
+                    continue
+                logging.warning("fid: {} files in a row took longer than {} s, the remaining files are read at the next start.".format(timeouts_in_row, timeout))
+                for uuid, path in todo:
+                    merge(uuid, path, {}, None, hdf_scanned=False)
+                    done_count += 1
+                    if progress:
+                        progress(done_count, total)
+        finally:
+            if running:
+                for f in running:
+                    f.cancel()
+                _terminate_pool(executor)
+            else:
+                executor.shutdown()
+
     def _inspect_and_add_Leaf(self,fname,root):
         """
         inspect the filenames if .h5, .set or .measurement
+        and add them to the index and the databases.
 
         to speed up things, the files are only scanned 
         if something has changed (os.stat.m_time) on disk. 
@@ -145,35 +421,24 @@ class file_system_service(UUID_base):
 
         # take the prefix ...
         uuid = fname[:6]
-
-        # ... and check the suffix
-        if fqpath[-3:] == '.h5':
-
+        ext = self._extensions.get(os.path.splitext(fname)[1])
+        if ext is None:
+            return
+        st = os.stat(fqpath)
+        if self._open_index().get_files(root).get(fqpath) != (st.st_mtime, st.st_size):
+            # the file might still be written, its attributes are read again at the next start
+            self._index_file(fqpath, st, hdf_scanned=False)
+        if ext == 'h5':
             # save the path using uuids as an index
             # Note: All path entries with the same uuid are 
             # overwritten with the last found uuid indexed file
             self.h5_db[uuid] = fqpath
-
-            # we only care about the mtime of .h5 files 
-            mtime = os.stat(fqpath).st_mtime
-
-            # store the file's modification time 
-            self._h5_n_mtime[uuid] = mtime
-
-            if mtime == self._h5_mtime_db.get(uuid,0):
-                if self._h5_info_cache_db.get(uuid,0):
-                    self.h5_info_db[uuid] = self._h5_info_cache_db.get(uuid)
-                else:
-                    self._collect_info(uuid, fqpath) # collect_info is expensive.
-            else:
-                self._collect_info(uuid, fqpath) # collect_info is expensive. 
-
-        elif fqpath[-3:] == 'set':
+        elif ext == 'set':
             self.set_db[uuid] = fqpath
-        elif fqpath[-3:] == 'ent':
+        elif ext == 'measurement':
             self.measure_db[uuid] = fqpath
 
-    def _collect_info(self,uuid,path):
+    def _collect_info(self,uuid,path,scan_hdf=None):
             tm = ""
             dt = ""
             j_split = (path.replace('/', '\\')).split('\\')
@@ -201,52 +466,101 @@ class file_system_service(UUID_base):
                 run = None
             h5_info_db = {'time': tm, 'datetime': dt, 'run': run, 'name': name, 'user': user}
             
-            if qkit.cfg.get('fid_scan_hdf', False):
-                h5_info_db.update({'rating':10})
-                try:
-                    h5f=h5py.File(path,'r')
-                    if "comment" in  h5f['/entry/data0'].attrs:
-                        h5_info_db.update({'comment': h5f['/entry/data0'].attrs['comment']})
-                    if "dr_values" in h5f['/entry/analysis0']:
-                        try:
-                            # this is legacy and should be removed at some point
-                            # please use the entry/analysis0 attributes instead.
-                            fit_comment = h5f['/entry/analysis0/dr_values'].attrs.get('comment',"").split(', ')
-                            comm_begin = [i[0] for i in fit_comment]
-                            try:
-                                h5_info_db.update({'fit_freq': float(h5f['/entry/analysis0/dr_values'][comm_begin.index('f')])})
-                            except (ValueError, IndexError):
-                                pass
-                            try:
-                                h5_info_db.update({'fit_time': float(h5f['/entry/analysis0/dr_values'][comm_begin.index('T')])})
-                            except (ValueError, IndexError):
-                                pass
-                        except (KeyError, AttributeError):
-                            pass
-                    if "measurement" in h5f['/entry/data0']:
-                        try:
-                            mmt = json.loads(h5f['/entry/data0/measurement'][0])
-                            h5_info_db.update(
-                                    {arg: mmt[arg] for arg in ['run_id', 'user', 'rating', 'smt'] if mmt.has_key(arg)}
-                            )
-                        except(AttributeError, KeyError):
-                            pass
-                    try:
-                        h5_info_db.update(dict(h5f['/entry/analysis0'].attrs))
-                    except(AttributeError, KeyError):
-                        pass
-                except KeyError as e:
-                    logging.debug("fid could not index file {}, probably it is just new and empty. Original message: {}".format(path,e))
-                except IOError as e:
-                    logging.error("fid {}:{}".format(path,e))
-                finally:
-                    h5f.close()
+            if scan_hdf is None:
+                scan_hdf = qkit.cfg.get('fid_scan_hdf', False)
+            if scan_hdf:
+                hdf_info, error = read_hdf_info(path)
+                h5_info_db.update(hdf_info)
+                if error:
+                    logging.error(error)
 
             self.h5_info_db[uuid] = h5_info_db
+            return h5_info_db
     
     def add_h5_file(self, h5_filename):
         if qkit.cfg['fid_scan_datadir']:
-            threading.Timer(20, function=self._add, kwargs={'h5_filename':h5_filename}).start()
+            if self._watcher is not None and self._watcher.running():
+                # picked up with the next batch of the watcher, later changes are followed by the watcher
+                self._watcher.add(h5_filename)
+            else:
+                threading.Timer(20, function=self._add, kwargs={'h5_filename':h5_filename}).start()
+
+    def start_watcher(self, backend=None, interval=None):
+        """
+        Starts a watcher on the data directory, which feeds created, changed 
+        and deleted files into the database in batches. This keeps qkit.fid 
+        up to date with files written by other processes without rescans.
+
+        Args:
+            backend (str): 'auto' (default), 'inotify' (Linux) or 'poll'. 
+                Default: qkit.cfg['fid_watch'], False disables the watcher.
+            interval (float): seconds between two batches, 
+                default: qkit.cfg['fid_watch_interval']
+        """
+        self.stop_watcher()
+        if backend is None:
+            backend = qkit.cfg.get('fid_watch', 'auto')
+        if not backend:
+            return
+        if backend is True:
+            backend = 'auto'
+        datadir = self._get_datadir()
+        dir_mtimes, _ = self._open_index().get_dirs()
+        dirs = [d for d in dir_mtimes if file_info_index._in_root(d, datadir)]
+        self._watcher = create_watcher(datadir, self._on_file_events, backend,
+                                       interval or qkit.cfg.get('fid_watch_interval', None), dirs)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+
+    def _on_file_events(self, paths):
+        """
+        callback of the watcher: updates the index and the databases for 
+        created, changed or deleted files and directories.
+        """
+        with self.lock:
+            for path in paths:
+                if os.path.isdir(path):
+                    self._scan_dir(path)
+                elif os.path.isfile(path):
+                    if os.path.splitext(path)[1] not in self._extensions:
+                        continue
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    if self._index.get_files(os.path.dirname(path)).get(path) != (st.st_mtime, st.st_size):
+                        self._index_file(path, st, read_hdf=False)
+                elif self._index.is_dir(path):
+                    self._remove_dir(path)
+                else:
+                    self._remove_file(path)
+            self._check_recent_files()
+            if qkit.cfg.get('fid_scan_hdf', False):
+                self._harvest_hdf_infos(self._index.get_unscanned_h5_files(self._get_datadir()))
+            self._index.commit()
+        self.update_grid_db(incremental=True)
+
+    def _check_recent_files(self):
+        """
+        h5 files written recently can still change without changing their 
+        directory, which the polling watcher would miss. 
+        They are followed for qkit.cfg['fid_watch_recent'] seconds (default 1 h).
+        """
+        now = time.time()
+        for path, t in list(self._recent_files.items()):
+            try:
+                if now - t > qkit.cfg.get('fid_watch_recent', 3600):
+                    raise OSError
+                st = os.stat(path)
+            except OSError:
+                del self._recent_files[path]
+                continue
+            if self._index.get_files(os.path.dirname(path)).get(path) != (st.st_mtime, st.st_size):
+                self._index_file(path, st, read_hdf=False)
         
     def _add(self, h5_filename):
         """
@@ -269,31 +583,50 @@ class file_system_service(UUID_base):
             if os.path.isfile(h5_filename[:-2] + 'measurement'):
                 logging.debug("Store_db: Adding manually measurement: " + basename + 'measurement')
                 self._inspect_and_add_Leaf(basename + 'measurement', dirname)
-        self.update_grid_db()
+            self._index.commit()
+        self.update_grid_db(incremental=True)
 
 
     def _set_hdf_attribute(self,UUID,attribute,value):
         h5_filepath = self.h5_db[UUID]
         h = h5py.File(h5_filepath,'r+')['entry']
+        remove = value==""
         try:
             if not 'analysis0' in h:
                 h.create_group('analysis0')
-            if value=="":
+            if not remove and qkit.module_available['pandas']:
+                import pandas as pd
+                remove = pd.isnull(value)
+            if remove:
                 if attribute in h['analysis0'].attrs:
                     del h['analysis0'].attrs[attribute]
             else:
-                if qkit.module_available['pandas']:
-                    import pandas as pd
-                    if pd.isnull(value):
-                        if attribute in h['analysis0'].attrs:
-                            del h['analysis0'].attrs[attribute]
-                    else:
-                        h['analysis0'].attrs[attribute] = value
-                else:
-                    h['analysis0'].attrs[attribute] = value
+                h['analysis0'].attrs[attribute] = value
         finally:
             h.file.close()
         self.h5_info_db[UUID].update({attribute:value})
+        index = self._open_index()
+        if remove:
+            index.remove_attribute(h5_filepath, attribute)
+        else:
+            index.set_attribute(h5_filepath, attribute, value)
+        index.commit()
+
+    def query(self, user=None, run=None, name=None, since=None, until=None, **attributes):
+        """
+        Returns the sorted UUIDs of all h5 files matching all given conditions.
+        The search runs on the indexed file infos and does not open any file.
+
+        Args:
+            user, run, name (str): as in the file path
+            since, until (str): compared to the datetime 'YYYY-MM-DD HH:MM:SS', 
+                e.g. since='2024-01-15' 
+            attributes: further h5 file attributes (qkit.cfg['fid_scan_hdf']),
+                e.g. rating=10
+        """
+        self.wait()
+        return self._open_index().query(root=self._get_datadir(), user=user, run=run, name=name,
+                                        since=since, until=until, **attributes)
         
     def wait(self):
         with self.lock:
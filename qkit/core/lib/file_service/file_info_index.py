@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+persistent index of the measurement files for the file info database (fid)
+
+The index is a SQLite database (by default in qkit.cfg['logdir']) and replaces
+the pickled h5_mtime.db and h5_info_cache.db files. It is updated
+incrementally: directories whose modification time did not change since the
+last scan are not listed again, files are only inspected again if their
+modification time or size changed.
+
+tables
+======
+dirs:       path, parent, mtime of every scanned directory
+files:      path, dir, uuid, ext, mtime, size and the basic file infos
+            (time, datetime, run, name, user) of .h5, .set and .measurement files
+attributes: additional infos of h5 files (fid_scan_hdf), one row per key
+"""
+
+import os
+import sqlite3
+import logging
+import threading
+
+try:
+    import cPickle as pickle
+except:
+    import pickle
+
+import numpy as np
+
+basic_info_keys = ['time', 'datetime', 'run', 'name', 'user']
+
+
+class file_info_index(object):
+    _schema = """
+        CREATE TABLE IF NOT EXISTS dirs (
+            path TEXT PRIMARY KEY,
+            parent TEXT,
+            mtime REAL);
+        CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+        CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY,
+            dir TEXT,
+            uuid TEXT,
+            ext TEXT,
+            mtime REAL,
+            size INTEGER,
+            hdf_scanned INTEGER DEFAULT 0,
+            time, datetime TEXT, run TEXT, name TEXT, user TEXT);
+        CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+        CREATE INDEX IF NOT EXISTS files_uuid ON files (uuid);
+        CREATE INDEX IF NOT EXISTS files_user ON files (user);
+        CREATE INDEX IF NOT EXISTS files_run ON files (run);
+        CREATE INDEX IF NOT EXISTS files_datetime ON files (datetime);
+        CREATE TABLE IF NOT EXISTS attributes (
+            path TEXT,
+            key TEXT,
+            value,
+            pickled INTEGER DEFAULT 0,
+            PRIMARY KEY (path, key));
+        CREATE INDEX IF NOT EXISTS attributes_key_value ON attributes (key, value);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # the fid uses the index from its background threads, access is
+        # serialized with the fid lock and our own lock.
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(self._schema)
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def commit(self):
+        with self._lock:
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.executescript("DELETE FROM dirs; DELETE FROM files; DELETE FROM attributes;")
+            self._db.commit()
+
+    """
+    directories
+    """
+    def get_dirs(self):
+        """returns {path: mtime} and {parent: [subdirectories]} of all indexed directories"""
+        mtimes = {}
+        children = {}
+        with self._lock:
+            for path, parent, mtime in self._db.execute("SELECT path, parent, mtime FROM dirs"):
+                mtimes[path] = mtime
+                children.setdefault(parent, []).append(path)
+        return mtimes, children
+
+    def set_dir(self, path, parent, mtime):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO dirs (path, parent, mtime) VALUES (?, ?, ?)", (path, parent, mtime))
+
+    def is_dir(self, path):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM dirs WHERE path = ?", (path,)).fetchone() is not None
+
+    def remove_dir(self, path):
+        """removes a directory including all subdirectories and files from the index.
+        Returns the paths of the removed files."""
+        removed = []
+        with self._lock:
+            subdirs = [path]
+            while subdirs:
+                d = subdirs.pop()
+                subdirs += [row[0] for row in self._db.execute("SELECT path FROM dirs WHERE parent = ?", (d,))]
+                for row in self._db.execute("SELECT path FROM files WHERE dir = ?", (d,)).fetchall():
+                    self.remove_file(row[0])
+                    removed.append(row[0])
+                self._db.execute("DELETE FROM dirs WHERE path = ?", (d,))
+        return removed
+
+    """
+    files
+    """
+    def get_files(self, dirpath):
+        """returns {path: (mtime, size)} of all indexed files in dirpath"""
+        with self._lock:
+            return {path: (mtime, size) for path, mtime, size in
+                    self._db.execute("SELECT path, mtime, size FROM files WHERE dir = ?", (dirpath,))}
+
+    def set_file(self, path, uuid, ext, mtime, size, info=None, hdf_scanned=False):
+        """adds or updates a file; info is the dict of the fid h5_info_db"""
+        info = info or {}
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO files (path, dir, uuid, ext, mtime, size, hdf_scanned, time, datetime, run, name, user) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             [path, os.path.dirname(path), uuid, ext, mtime, size, int(hdf_scanned)] +
+                             [self._to_sql(info.get(k))[0] for k in basic_info_keys])
+            self._db.execute("DELETE FROM attributes WHERE path = ?", (path,))
+            for key, value in info.items():
+                if key not in basic_info_keys:
+                    self.set_attribute(path, key, value)
+
+    def set_attribute(self, path, key, value):
+        with self._lock:
+            value, pickled = self._to_sql(value)
+            self._db.execute("INSERT OR REPLACE INTO attributes (path, key, value, pickled) VALUES (?, ?, ?, ?)",
+                             (path, key, value, pickled))
+
+    def remove_attribute(self, path, key):
+        with self._lock:
+            self._db.execute("DELETE FROM attributes WHERE path = ? AND key = ?", (path, key))
+
+    def remove_file(self, path):
+        with self._lock:
+            self._db.execute("DELETE FROM files WHERE path = ?", (path,))
+            self._db.execute("DELETE FROM attributes WHERE path = ?", (path,))
+
+    def get_unscanned_h5_files(self, root):
+        """returns [(uuid, path)] of h5 files whose attributes were never read"""
+        with self._lock:
+            return [(uuid, path) for uuid, path, d in
+                    self._db.execute("SELECT uuid, path, dir FROM files WHERE ext = 'h5' AND hdf_scanned = 0")
+                    if self._in_root(d, root)]
+
+    def load(self, root):
+        """returns the dicts h5_db, set_db, measure_db and h5_info_db of all files below root.
+
+        If several files share the same uuid, the newest one is used.
+        """
+        h5_db, set_db, measure_db, h5_info_db = {}, {}, {}, {}
+        dbs = {'h5': h5_db, 'set': set_db, 'measurement': measure_db}
+        with self._lock:
+            for row in self._db.execute("SELECT path, dir, uuid, ext, time, datetime, run, name, user FROM files ORDER BY mtime"):
+                if not self._in_root(row[1], root):
+                    continue
+                path, uuid, ext = row[0], row[2], row[3]
+                dbs[ext][uuid] = path
+                if ext == 'h5':
+                    h5_info_db[uuid] = dict(zip(basic_info_keys, row[4:]))
+            uuid_of_path = {path: uuid for uuid, path in h5_db.items()}
+            for path, key, value, pickled in self._db.execute("SELECT path, key, value, pickled FROM attributes"):
+                uuid = uuid_of_path.get(path)
+                if uuid is not None:
+                    h5_info_db[uuid][key] = self._from_sql(value, pickled)
+        return h5_db, set_db, measure_db, h5_info_db
+
+    def query(self, root=None, user=None, run=None, name=None, since=None, until=None, **attributes):
+        """returns the sorted uuids of all h5 files matching all given conditions.
+
+        since and until are compared to the datetime string 'YYYY-MM-DD HH:MM:SS',
+        e.g. since='2024-01' returns all files from January 2024 on.
+        Further keyword arguments are compared to the h5 file attributes.
+        """
+        conditions = ["ext = 'h5'"]
+        args = []
+        for column, value in (('user', user), ('run', run), ('name', name)):
+            if value is not None:
+                conditions.append("%s = ?" % column)
+                args.append(value)
+        if since is not None:
+            conditions.append("datetime >= ?")
+            args.append(since)
+        if until is not None:
+            conditions.append("datetime <= ?")
+            args.append(until)
+        for key, value in attributes.items():
+            conditions.append("path IN (SELECT path FROM attributes WHERE key = ? AND value = ?)")
+            args += [key, self._to_sql(value)[0]]
+        with self._lock:
+            rows = self._db.execute("SELECT uuid, dir FROM files WHERE " + " AND ".join(conditions), args).fetchall()
+        return sorted(set(uuid for uuid, d in rows if root is None or self._in_root(d, root)))
+
+    @staticmethod
+    def _in_root(path, root):
+        return path == root or path.startswith(os.path.join(root, ''))
+
+    @staticmethod
+    def _to_sql(value):
+        """converts a value to a type SQLite can store and compare, everything else is pickled"""
+        if isinstance(value, np.generic):
+            value = value.item()
+        if isinstance(value, bytes):
+            value = value.decode('utf-8', 'replace')
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return value, 0
+        return sqlite3.Binary(pickle.dumps(value, protocol=2)), 1
+
+    @staticmethod
+    def _from_sql(value, pickled):
+        if pickled:
+            try:
+                return pickle.loads(bytes(value))
+            except Exception as e:
+                logging.debug("fid index: could not unpickle value: {}".format(e))
+                return None
+        return value
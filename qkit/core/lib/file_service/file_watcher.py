@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+file system watchers for the file info database (fid)
+
+A watcher observes the data directory and passes the paths of created,
+modified and deleted files and directories to a callback. The events are
+collected and handed over in batches every 'interval' seconds.
+
+backends
+========
+inotify:  event driven, Linux only (via ctypes, no additional package).
+          Note: inotify does not see changes made on other machines on
+          network shares. Directories beyond the inotify watch limit
+          (fs.inotify.max_user_watches) are polled instead.
+poll:     passes the data directory to the callback every 'interval'
+          seconds, the fid then rescans the changed directories.
+
+usage:
+watcher = create_watcher(root, callback, backend='auto', interval=2, dirs=[...])
+watcher.start()
+watcher.add(path)  # report a path manually
+watcher.stop()
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import logging
+import threading
+import ctypes
+import ctypes.util
+
+
+class file_watcher(object):
+    """
+    base class: collects paths and hands them to the callback in batches.
+    """
+    def __init__(self, root, callback, interval=2.):
+        self.root = root
+        self.callback = callback
+        self.interval = interval
+        self._paths = set()
+        self._paths_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._stop.clear()
+        self._start_thread(self._dispatch, 'fid_watcher_dispatch')
+
+    def stop(self):
+        self._stop.set()
+        for t in self._threads:
+            if t is not threading.current_thread():
+                t.join(timeout=5)
+        self._threads = []
+
+    def running(self):
+        return any(t.is_alive() for t in self._threads)
+
+    def add(self, path):
+        """reports a path to be updated with the next batch"""
+        with self._paths_lock:
+            self._paths.add(path)
+
+    def _start_thread(self, target, name):
+        t = threading.Thread(name=name, target=target)
+        t.daemon = True
+        t.start()
+        self._threads.append(t)
+
+    def _dispatch(self):
+        while not self._stop.wait(self.interval):
+            self._flush()
+
+    def _flush(self):
+        """hands the collected paths to the callback"""
+        with self._paths_lock:
+            paths, self._paths = self._paths, set()
+        if paths:
+            try:
+                self.callback(sorted(paths))
+            except Exception as e:
+                logging.error("fid watcher: updating the database failed: {}".format(e))
+
+
+class polling_watcher(file_watcher):
+    """
+    reports the root directory every interval. The callback only needs to
+    look at directories whose modification time changed.
+    """
+    def _dispatch(self):
+        while not self._stop.wait(self.interval):
+            self.add(self.root)
+            self._flush()
+
+
+class inotify_watcher(file_watcher):
+    """
+    event driven watcher based on the Linux inotify interface.
+
+    Once the inotify watch limit is reached, no further watches are added.
+    The directories left without a watch are reported every poll_interval
+    seconds instead, like the polling watcher does with the root directory.
+    """
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+
+    _mask = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR
+    _event = struct.Struct("iIII")
+
+    def __init__(self, root, callback, interval=2., dirs=None, poll_interval=30.):
+        file_watcher.__init__(self, root, callback, interval)
+        self.poll_interval = poll_interval
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._fd = self._libc.inotify_init()
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init failed")
+        self._wd = {}
+        self._limit_reached = False
+        self._unwatched = set()  # directories beyond the watch limit, polled
+        if dirs is None:
+            dirs = [d for d, _, _ in os.walk(root)]
+        for d in dirs:
+            self._add_watch(d)
+        self._add_watch(root)
+
+    def _add_watch(self, path):
+        if self._limit_reached:
+            # the watch limit was reached before, poll the directory
+            with self._paths_lock:
+                self._unwatched.add(path)
+            return
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), self._mask)
+        if wd >= 0:
+            self._wd[wd] = path
+            return
+        error = ctypes.get_errno()
+        if error == errno.ENOSPC:
+            self._limit_reached = True
+            logging.warning("fid watcher: inotify watch limit reached after {} directories (see "
+                            "fs.inotify.max_user_watches), the remaining directories are polled every {} s."
+                            .format(len(self._wd), self.poll_interval))
+            with self._paths_lock:
+                self._unwatched.add(path)
+        else:
+            logging.warning("fid watcher: can not watch {}: {}".format(path, os.strerror(error)))
+
+    def start(self):
+        file_watcher.start(self)
+        self._start_thread(self._read_events, 'fid_watcher_inotify')
+
+    def stop(self):
+        file_watcher.stop(self)
+        os.close(self._fd)
+
+    def _dispatch(self):
+        last_poll = time.time()
+        while not self._stop.wait(self.interval):
+            if self._unwatched and time.time() - last_poll >= self.poll_interval:
+                last_poll = time.time()
+                with self._paths_lock:
+                    # deleted directories are reported a last time, the callback removes them
+                    self._paths.update(self._unwatched)
+                    self._unwatched = set(d for d in self._unwatched if os.path.isdir(d))
+            self._flush()
+
+    def _read_events(self):
+        while not self._stop.is_set():
+            if not select.select([self._fd], [], [], 1.)[0]:
+                continue
+            try:
+                buf = os.read(self._fd, 64 * 1024)
+            except OSError:
+                return
+            pos = 0
+            while pos < len(buf):
+                wd, mask, cookie, length = self._event.unpack_from(buf, pos)
+                pos += self._event.size
+                name = buf[pos:pos + length].rstrip(b'\0')
+                pos += length
+                self._handle(wd, mask, os.fsdecode(name))
+
+    def _handle(self, wd, mask, name):
+        if mask & self.IN_Q_OVERFLOW:
+            # events got lost, let the fid check the whole tree
+            self.add(self.root)
+            return
+        directory = self._wd.get(wd)
+        if directory is None:
+            return
+        if mask & self.IN_IGNORED:
+            del self._wd[wd]
+            return
+        if mask & self.IN_DELETE_SELF:
+            self.add(directory)
+            return
+        path = os.path.join(directory, name)
+        if mask & self.IN_ISDIR and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+            # watch new directories, files created before the watch are found by the scan of the directory
+            for d, _, _ in os.walk(path):
+                self._add_watch(d)
+        self.add(path)
+
+
+def create_watcher(root, callback, backend='auto', interval=None, dirs=None):
+    """
+    returns a watcher for root.
+
+    Args:
+        root: directory to watch
+        callback: function called with a list of paths
+        backend: 'inotify', 'poll' or 'auto' (inotify on Linux, else poll)
+        interval: seconds between two batches, default: 2 for inotify, 30 for poll
+        dirs: optional list of all directories below root (saves a walk through root)
+    """
+    if backend == 'auto':
+        backend = 'inotify' if sys.platform.startswith('linux') else 'poll'
+    if backend == 'inotify':
+        try:
+            return inotify_watcher(root, callback, interval or 2., dirs)
+        except (OSError, AttributeError) as e:
+            logging.warning("fid watcher: inotify not available ({}), polling instead.".format(e))
+            backend = 'poll'
+    if backend == 'poll':
+        return polling_watcher(root, callback, interval or 30.)
+    raise ValueError("fid watcher: unknown backend '{}'. Use 'auto', 'inotify' or 'poll'.".format(backend))
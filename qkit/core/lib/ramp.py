@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+ramp engine for stepwise parameter changes (instrument parameters with maxstep)
+
+All ramps run in one background thread on a shared timeline. Every ramp
+keeps its own step delay, the steps of different ramps are interleaved, so
+ramping several sources together takes as long as the longest ramp instead
+of the sum of all ramps. The steps are scheduled on absolute times, counted
+from the start of the previous step: the duration of the set command counts
+as part of the step delay, but two steps of a ramp are never closer than the
+step delay.
+
+Drivers with a native sweep or slew rate feature can implement
+    _do_ramp(name, value, stepsize, stepdelay, **kwargs)
+(stepdelay in ms, as in set_parameter_rate). It is called in an own thread
+instead of stepping and returns when the device reached the value.
+
+A qkit.flow abort (stop button) cancels all running ramps after the
+current step; the parameter keeps the last value that was set.
+
+Instruments run one ramp per parameter: a new ramp stops the running one
+(Ramp.stop) and starts from the value it reached.
+
+A ramp started from the engine thread itself (e.g. the step of a virtual
+instrument sets another parameter with a rate) can not wait for the
+engine, it is stepped in the calling thread instead (submit(inline=True)).
+
+usage:
+r = ins.ramp('voltage', 1.)         # returns a Ramp handle immediately
+r.wait()                            # handles qkit.flow events while waiting
+wait_all([ins1.ramp('voltage', 1.), ins2.ramp('voltage', -1.)])
+"""
+
+import heapq
+import logging
+import threading
+import time
+
+import qkit
+
+
+class RampCancelled(Exception):
+    "raised by Ramp.wait if the ramp was cancelled or aborted"
+    pass
+
+
+class RampTimeout(Exception):
+    "raised by Ramp.result if the ramp is not done within the timeout"
+    pass
+
+
+class Ramp(object):
+    """
+    handle of a ramp, similar to a future.
+
+    The steps are executed by the RampEngine, step_func(value) sets one
+    value. finish_func() is called in the engine thread after the last step.
+    lock is held during every step, see stop(). Instruments pass their io
+    lock, so that a ramp can be stopped by a thread that holds it.
+    """
+    def __init__(self, name, values, stepdelay, step_func, finish_func=None, lock=None):
+        self.name = name
+        self.stepdelay = stepdelay
+        self.value = None
+        self._values = list(values)
+        self._index = 0
+        self._step_func = step_func
+        self._finish_func = finish_func
+        self._cancelled = False
+        self._error = None
+        self._done = threading.Event()
+        self._lock = lock if lock is not None else threading.RLock()
+
+    def __repr__(self):
+        state = 'done' if self.done() else 'running'
+        return "Ramp(%s, %d/%d steps, %s)" % (self.name, self._index, len(self._values), state)
+
+    def done(self):
+        return self._done.is_set()
+
+    def cancel(self):
+        "stops the ramp before its next step"
+        self._cancelled = True
+
+    def stop(self):
+        """
+        Cancels the ramp and returns the last value set, after a step in
+        progress is done. Waiters get RampCancelled right away. A native
+        device ramp can not be interrupted, it is waited for.
+        """
+        self.cancel()
+        with self._lock:
+            self._finish()
+        return self.value
+
+    def wait(self, timeout=None):
+        """
+        Waits until the ramp is done and handles qkit.flow events meanwhile.
+        An abort in qkit.flow cancels the ramp.
+
+        Returns False if the timeout (in s) expired, else True.
+        Raises the error of a failed step or RampCancelled.
+        """
+        start = time.time()
+        try:
+            while not self._done.wait(0.02):
+                if getattr(qkit, 'flow', None) is not None:
+                    qkit.flow.sleep()
+                if timeout is not None and time.time() - start > timeout:
+                    return False
+        except BaseException:
+            self.cancel()
+            raise
+        if self._error is not None:
+            raise self._error
+        return True
+
+    def result(self, timeout=None):
+        "waits for the ramp and returns the final value, raises RampTimeout if the timeout expired"
+        if not self.wait(timeout):
+            raise RampTimeout("Ramp of %s not done after %s s, at %s" % (self.name, timeout, self.value))
+        return self.value
+
+    def _step(self):
+        "sets the next value, returns False after the last one or if the ramp was stopped"
+        with self._lock:
+            if self._cancelled:
+                return False
+            v = self._values[self._index]
+            self._step_func(v)
+            self.value = v
+            self._index += 1
+            return self._index < len(self._values)
+
+    def _finish(self, error=None):
+        if self._done.is_set():
+            # already finished by stop()
+            return
+        if error is None and self._cancelled:
+            error = RampCancelled("Ramp of %s cancelled at %s" % (self.name, self.value))
+        if error is None and self._finish_func is not None:
+            try:
+                self._finish_func()
+            except Exception as e:
+                error = e
+        self._error = error
+        self._done.set()
+
+
+class RampEngine(object):
+    """
+    runs the steps of all ramps in one thread, ordered by their due time.
+    The thread is started with the first ramp and ends when no ramp is left.
+    """
+    def __init__(self):
+        self._queue = []  # heap of (due time, sequence number, ramp)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def in_engine_thread(self):
+        "True if called from a step of a ramp"
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, ramp, inline=False):
+        """
+        queues the steps of ramp. With inline=True, the steps are executed
+        in the calling thread before submit returns.
+        """
+        if inline:
+            return self._run_inline(ramp)
+        with self._cond:
+            heapq.heappush(self._queue, (time.time(), self._seq, ramp))
+            self._seq += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='qkit_ramp_engine')
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify()
+        return ramp
+
+    def _run_inline(self, ramp):
+        due = time.time()
+        more = True
+        while more:
+            flow = getattr(qkit, 'flow', None)
+            if flow is not None and flow.abort_requested():
+                ramp.cancel()
+            if ramp._cancelled:
+                ramp._finish()
+                return ramp
+            time.sleep(max(0, due - time.time()))
+            due = time.time() + ramp.stepdelay
+            try:
+                more = ramp._step()
+            except Exception as e:
+                logging.error("Ramp of %s failed at step %d: %s" % (ramp.name, ramp._index, e))
+                ramp._finish(e)
+                return ramp
+        ramp._finish()
+        return ramp
+
+    def submit_native(self, ramp, func, inline=False):
+        "runs func (a native device ramp) in an own thread, or in the calling thread with inline=True"
+        def run():
+            with ramp._lock:
+                if ramp._cancelled:
+                    ramp._finish()
+                    return
+                try:
+                    func()
+                except Exception as e:
+                    ramp._finish(e)
+                    return
+                ramp.value = ramp._values[-1]
+                ramp._index = len(ramp._values)
+                ramp._finish()
+        if inline:
+            run()
+            return ramp
+        t = threading.Thread(target=run, name='qkit_ramp_%s' % ramp.name)
+        t.daemon = True
+        t.start()
+        return ramp
+
+    def running(self):
+        "returns the ramps that are not done"
+        with self._cond:
+            return [r for _, _, r in self._queue if not r.done()]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._queue:
+                    self._thread = None
+                    return
+                due, seq, ramp = self._queue[0]
+                now = time.time()
+                if due > now:
+                    self._cond.wait(due - now)
+                    continue
+                heapq.heappop(self._queue)
+            if ramp.done():
+                # stopped
+                continue
+            flow = getattr(qkit, 'flow', None)
+            if flow is not None and flow.abort_requested():
+                ramp.cancel()
+            if ramp._cancelled:
+                ramp._finish()
+                continue
+            # the next step is due one step delay after this one started
+            due = time.time() + ramp.stepdelay
+            try:
+                more = ramp._step()
+            except Exception as e:
+                logging.error("Ramp of %s failed at step %d: %s" % (ramp.name, ramp._index, e))
+                ramp._finish(e)
+                continue
+            if more:
+                with self._cond:
+                    heapq.heappush(self._queue, (due, seq, ramp))
+            else:
+                ramp._finish()
+
+
+engine = RampEngine()
+
+
+def wait_all(ramps, timeout=None):
+    """
+    Waits for several ramps (handling qkit.flow events). If one of them
+    fails or an abort is requested, all are cancelled.
+    """
+    try:
+        for r in ramps:
+            if r is not None and not r.wait(timeout):
+                return False
+    except BaseException:
+        for r in ramps:
+            if r is not None:
+                r.cancel()
+        raise
+    return True
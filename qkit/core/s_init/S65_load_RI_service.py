@@ -5,15 +5,17 @@ Start remote interface service (RIS)
 """
 import qkit
 import logging
+from qkit.core.startup import run_in_background
 
 
 def _load_ri_service():
     logging.info(__file__+": loading remote interface service")
     from qkit.core.lib.com.ri_service import RISThread
-    qkit.ris = RISThread()
+    return RISThread()
 
 if qkit.cfg.get('load_ri_service',False):
     qkit.cfg['load_ri_service']=True
-    _load_ri_service()
+    # importing zerorpc is slow, RISThread runs in its own thread anyway
+    run_in_background('ris', _load_ri_service)
 else:
     qkit.cfg['load_ri_service']=False
\ No newline at end of file
@@ -4,6 +4,7 @@
 """
 import qkit
 import logging
+import threading
 from pkgutil import find_loader
 
 
@@ -51,8 +52,28 @@ class DummyVisa(object):
     def __getattr__(self,name):
         raise qkit.QkitCfgError("Please set qkit.cfg['load_visa'] = True if you need visa.")
 
+class LazyVisa(object):
+    """
+    creating the ResourceManager takes a while, so with qkit.cfg['startup_lazy']
+    this happens on the first access to qkit.visa, e.g. when the first instrument is created.
+    Special attributes are not forwarded (so that e.g. copy or IPython do not load visa),
+    except for those set by _load_visa.
+    """
+    _lock = threading.Lock()
+    _forwarded = ('__version__',)
+    def __getattr__(self,name):
+        if name.startswith('__') and name not in self._forwarded:
+            raise AttributeError(name)
+        with self._lock:
+            if qkit.visa is self:
+                _load_visa()
+        return getattr(qkit.visa, name)
+
 if qkit.cfg.get('load_visa',False):
-    _load_visa()
+    if qkit.cfg.get('startup_lazy',True):
+        qkit.visa = LazyVisa()
+    else:
+        _load_visa()
 else:
     qkit.visa = DummyVisa()
 
@@ -4,13 +4,16 @@
 """
 import qkit
 import logging
-from qkit.core.lib.file_service.file_info_database import fid
+from qkit.core.startup import run_in_background
 
 
 def _load_file_service():
     logging.info("loading service: file info database (fid)")
-    qkit.fid = fid()
+    # importing the fid pulls in pandas and the plot modules, with
+    # qkit.cfg['startup_lazy'] this runs in the background.
+    from qkit.core.lib.file_service.file_info_database import fid
+    return fid()
     #info: qkit.store_db does not exist anymore: use qkit.fid instead.
 
 if qkit.cfg.get('fid_scan_datadir', True):
-    _load_file_service()
+    run_in_background('fid', _load_file_service)
@@ -1,27 +1,207 @@
-# This file brings QKIT around: init 
+# This file brings QKIT around: init
 # YS@KIT/2017
 # HR@kit/2017
+"""
+The init stages in core/s_init (S*.py) are imported in alphabetical order.
+
+startup profile
+===============
+The time of every stage, of the background services and the import time
+of heavy modules (inclusive the modules they import themselves) is recorded
+in qkit.core.startup.profile. qkit.core.startup.report() prints it, with
+qkit.cfg['startup_profile'] = True it is printed after every start.
+For a complete picture of all imports use 'python -X importtime'.
+
+lazy startup
+============
+With qkit.cfg['startup_lazy'] = True (default), services which are not
+needed for analysis-only sessions do not block the start:
+ - the file info database (qkit.fid) and the remote interface service are
+   created in background threads,
+ - the VISA resource manager (qkit.visa) is created on first access.
+Accessing qkit.fid before it is ready waits for the background thread.
+"""
 import qkit
 import os
+import sys
 import importlib
 import logging
+import threading
 from time import time
 
+try:
+    import builtins
+except ImportError:
+    import __builtin__ as builtins
+
+# modules whose import time is worth a line in the startup profile
+HEAVY_MODULES = ['numpy', 'scipy', 'h5py', 'zmq', 'zerorpc', 'pandas', 'qgrid', 'matplotlib',
+                 'pyqtgraph', 'PyQt5', 'PyQt4', 'IPython', 'ipywidgets', 'pyvisa', 'visa']
+
+# list of (stage, seconds, kind) with kind 'stage', 'import' or 'background'
+profile = []
+_profile_lock = threading.Lock()
+_background = {}
+
+
+def _record(stage, seconds, kind):
+    with _profile_lock:
+        profile.append((stage, seconds, kind))
+
+
+class _ImportTimer(object):
+    """
+    wraps builtins.__import__ during the start and records the duration of
+    the first import of the HEAVY_MODULES.
+    """
+    def __init__(self):
+        self._import = builtins.__import__
+
+    def __enter__(self):
+        builtins.__import__ = self
+        return self
+
+    def __exit__(self, *args):
+        builtins.__import__ = self._import
+
+    def __call__(self, name, *args, **kwargs):
+        top = name.partition('.')[0]
+        if top not in HEAVY_MODULES or top in sys.modules:
+            return self._import(name, *args, **kwargs)
+        starttime = time()
+        try:
+            return self._import(name, *args, **kwargs)
+        finally:
+            if top in sys.modules:
+                _record(top, time() - starttime, 'import')
+
+
+class BackgroundService(object):
+    """
+    placeholder for a service that is created in a background thread.
+
+    loader() returns the service object, it is assigned to qkit.<name> as
+    soon as it is ready. Until then, this placeholder forwards every access
+    to the service and waits for the thread if necessary.
+    """
+    def __init__(self, name, loader):
+        self._name = name
+        self._loader = loader
+        self._service = None
+        self._error = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._load, name='qkit_start_' + name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _load(self):
+        starttime = time()
+        try:
+            self._service = self._loader()
+            setattr(qkit, self._name, self._service)
+        except Exception as e:
+            self._error = e
+            logging.error("Loading qkit.%s in the background failed: %s" % (self._name, e))
+        finally:
+            _record(self._name, time() - starttime, 'background')
+            self._ready.set()
+
+    def ready(self):
+        return self._ready.is_set()
+
+    def wait(self, timeout=None):
+        "waits for the service and returns it, raises the error of the loader"
+        if not self._ready.wait(timeout):
+            return None
+        if self._error is not None:
+            raise self._error
+        return self._service
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.wait(), name)
+
+    def __getitem__(self, key):
+        return self.wait()[key]
+
+    def __repr__(self):
+        if self.ready():
+            return repr(self._service)
+        return "<qkit.%s: loading in the background>" % self._name
+
+
+def run_in_background(name, loader):
+    """
+    creates qkit.<name> = loader() in a background thread, if
+    qkit.cfg['startup_lazy'] is set. Otherwise, the service is created right away.
+    """
+    if not qkit.cfg.get('startup_lazy', True):
+        setattr(qkit, name, loader())
+        return getattr(qkit, name)
+    service = BackgroundService(name, loader)
+    _background[name] = service
+    setattr(qkit, name, service)
+    return service
+
+
+def wait_for_services(timeout=None):
+    "waits until all background services are loaded, returns False on timeout"
+    starttime = time()
+    for service in list(_background.values()):
+        remaining = None if timeout is None else max(0, timeout - (time() - starttime))
+        if not service._ready.wait(remaining):
+            return False
+    return True
+
+
+def report(show=True):
+    """
+    returns (and prints) the startup profile: time per init stage,
+    import time of heavy modules and time of the background services.
+    """
+    with _profile_lock:
+        entries = list(profile)
+    lines = []
+    titles = [('stage', 'init stages'), ('import', 'imports of heavy modules (inclusive)'),
+              ('background', 'background services')]
+    for kind, title in titles:
+        selected = [(stage, seconds) for stage, seconds, k in entries if k == kind]
+        if not selected:
+            continue
+        lines.append(title + ":")
+        for stage, seconds in selected:
+            lines.append("  {:<32s} {:7.3f}s".format(stage, seconds))
+    total = sum(seconds for stage, seconds, k in entries if k == 'stage')
+    lines.append("  {:<32s} {:7.3f}s".format('qkit.start() total', total))
+    pending = [name for name, service in _background.items() if not service.ready()]
+    if pending:
+        lines.append("still loading: " + ", ".join(pending))
+    text = "\n".join(lines)
+    if show:
+        print(text)
+    return text
+
+
 def start(silent=False):
     #print('Starting the core of the Qkit framework...')
     initdir_name = 's_init'
     initdir = os.path.join(qkit.cfg.get('coredir'),initdir_name)
     filelist = os.listdir(initdir)
     filelist.sort()
-    
+
     # load all modules starting with a 'S' character
-    for module in filelist:
-        starttime = time()
-        if not module.startswith('S') or module[-3:] != '.py':
-            continue
-        if not silent:
-            print("Loading module ... "+module)
-        importlib.import_module("."+module[:-3],package='qkit.core.'+initdir_name)
-        logging.debug("Loading module "+str(module)+" took  {:.1f}s.".format(time()-starttime))
-    del module,starttime
-    
\ No newline at end of file
+    with _ImportTimer():
+        for module in filelist:
+            if not module.startswith('S') or module[-3:] != '.py':
+                continue
+            if not silent:
+                print("Loading module ... "+module)
+            starttime = time()
+            importlib.import_module("."+module[:-3],package='qkit.core.'+initdir_name)
+            _record(module[:-3], time()-starttime, 'stage')
+            logging.debug("Loading module "+str(module)+" took  {:.3f}s.".format(time()-starttime))
+
+    logging.info("qkit startup profile:\n" + report(show=False))
+    if qkit.cfg.get('startup_profile', False):
+        report()
@@ -2,6 +2,93 @@ from abc import ABC, abstractmethod
 from qkit.core.instrument_base import Instrument
 import numpy as np
 
+
+class VNATrace(object):
+    """
+    One VNA trace, transferred once as complex data.
+
+    amp, pha, real and imag are computed from the same buffer on first access,
+    so measurement code recording several representations needs only one
+    transfer per trace. In cw mode, the trace is reduced to its mean value.
+    Every trace owns its buffer, it can be handed to another thread.
+    """
+    def __init__(self, data, cw=False):
+        data = np.asarray(data)
+        if not np.iscomplexobj(data):
+            data = data.astype(np.complex128)
+        if cw:
+            data = np.atleast_1d(np.mean(data))
+        self.data = data
+        self.cw = cw
+        self._amp = None
+        self._pha = None
+        self._real = None
+        self._imag = None
+
+    @classmethod
+    def from_interleaved(cls, data, cw=False):
+        """
+        creates the trace from the binary SDATA format (real, imag, real, imag, ...)
+        without copying the values into separate lists.
+        """
+        data = np.ascontiguousarray(data, dtype=np.float64)
+        return cls(data.view(np.complex128), cw=cw)
+
+    @classmethod
+    def from_iq(cls, real, imag, cw=False):
+        return cls(np.asarray(real) + 1j * np.asarray(imag), cw=cw)
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def amp(self):
+        if self._amp is None:
+            self._amp = np.abs(self.data)
+        return self._amp
+
+    @property
+    def pha(self):
+        if self._pha is None:
+            self._pha = np.angle(self.data)
+        return self._pha
+
+    @property
+    def real(self):
+        if self._real is None:
+            self._real = np.ascontiguousarray(self.data.real)
+        return self._real
+
+    @property
+    def imag(self):
+        if self._imag is None:
+            self._imag = np.ascontiguousarray(self.data.imag)
+        return self._imag
+
+    def get(self, format='AmpPha'):
+        """
+        returns (amp, pha) for format 'AmpPha' or (real, imag) for 'RealImag',
+        like get_tracedata(format).
+        """
+        if format == 'AmpPha':
+            return self.amp, self.pha
+        if format == 'RealImag':
+            return self.real, self.imag
+        raise ValueError('VNATrace: Format must be AmpPha or RealImag')
+
+
+def get_vna_trace(vna):
+    """
+    returns a VNATrace of the current trace of the vna. Drivers without
+    get_trace are read with two get_tracedata calls.
+    """
+    if hasattr(vna, 'get_trace'):
+        return vna.get_trace()
+    trace = VNATrace.from_iq(*vna.get_tracedata('RealImag'))
+    trace._amp, trace._pha = vna.get_tracedata()
+    return trace
+
+
 class AbstractVNA(ABC):
     """
     This Abstract Base Class defines all the methods required and optionally available for VNA measurements.
@@ -13,6 +100,7 @@ class AbstractVNA(ABC):
         assert isinstance(self, Instrument)
         self.add_function('get_freqpoints')
         self.add_function('get_tracedata')
+        self.add_function('get_trace')
         self.add_function('get_sweeptime')
         self.add_function('get_sweeptime_averages')
         self.add_function('pre_measurement')
@@ -45,6 +133,14 @@ class AbstractVNA(ABC):
         """
         pass
 
+    def get_trace(self) -> VNATrace:
+        """
+        Returns the resulting data as VNATrace, which provides amplitude, phase,
+        I and Q from one transfer. Override this if the device can transfer
+        the complex data directly, the default is built from the (I, Q)-Data.
+        """
+        return VNATrace.from_iq(*self.get_tracedata(RealImag=True))
+
     @abstractmethod
     def get_sweeptime(self, query=True):
         """
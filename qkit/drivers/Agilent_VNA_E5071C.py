@@ -17,6 +17,7 @@
 import qkit
 from qkit.core.instrument_base import Instrument
 from qkit import visa
+from qkit.drivers.AbstractVNA import VNATrace
 import logging
 from time import sleep
 import numpy
@@ -54,6 +55,7 @@ class Agilent_VNA_E5071C(Instrument):
             self._visainstrument.read_termination = idn[len(idn.strip()):]
         
         self._zerospan = False
+        self._data_format = None # last FORM:DATA sent, see _set_data_format
         self._freqpoints = 0
         self._ci = channel_index 
         self._start = 0
@@ -133,6 +135,7 @@ class Agilent_VNA_E5071C(Instrument):
         # Implement functions
         self.add_function('get_freqpoints')
         self.add_function('get_tracedata')
+        self.add_function('get_trace')
         self.add_function('init')
         self.add_function('avg_clear')
         #self.add_function('avg_status')
@@ -229,47 +232,36 @@ class Agilent_VNA_E5071C(Instrument):
             self.hold(True)
             sleep(float(self.ask('SENS1:SWE:TIME?')))
         
+        if format not in ('AmpPha', 'RealImag'):
+          raise ValueError('get_tracedata(): Format must be AmpPha or RealImag')
+        trace = self.get_trace()
+        if format == 'RealImag' and self._zerospan:
+          return trace.real[0], trace.imag[0]
+        return trace.get(format)
+
+    def _set_data_format(self, data_format):
+        '''
+        Sets the binary transfer format (FORM:DATA) only if it differs from
+        the last one sent. The byte order is sent with the first format.
+        '''
+        if data_format == self._data_format:
+            return
+        if self._data_format is None:
+            self.write('FORM:BORD SWAPPED')
+        self.write('FORM:DATA %s' % data_format)
+        self._data_format = data_format
+
+    def get_trace(self):
+        '''
+        Transfers the complex data of the current trace once (binary REAL)
+
+        Output:
+            VNATrace with amp, pha, real and imag of the trace, averaged in zerospan mode
+        '''
         sleep(0.1) # required to avoid timing issues    MW August 2013   ???
-            
-        #self.write(':FORMAT REALform; FORMat:BORDer SWAP;')
-        #data = self.ask_for_values( "CALCulate:DATA? SDATA",format = visa.single)
-        #data = self.ask_for_values(':FORMAT REAL,32;*CLS;CALC1:DATA:NSW? SDAT,1;*OPC',format=1)
-        #data = self.ask_for_values('FORM:DATA REAL; FORM:BORD SWAPPED; CALC%i:SEL:DATA:SDAT?'%(self._ci), format = visa.double)
-        self.write('FORM:DATA REAL')
-        self.write('FORM:BORD SWAPPED') #SWAPPED
-        #data = self.ask_for_values('CALC%d:SEL:DATA:SDAT?'%(self._ci), format = visa.double)
+        self._set_data_format('REAL')
         data = self.ask_for_values('CALC%i:SEL:DATA:SDAT?'%(self._ci), fmt = 3)
-        data_size = numpy.size(data)
-        datareal = numpy.array(data[0:data_size:2])
-        dataimag = numpy.array(data[1:data_size:2])
-          
-        if format == 'RealImag':
-          if self._zerospan:
-            return numpy.mean(datareal), numpy.mean(dataimag)
-          else:
-            return datareal, dataimag
-        elif format == 'AmpPha':
-          if self._zerospan:
-            datareal = numpy.mean(datareal)
-            dataimag = numpy.mean(dataimag)
-            dataamp = numpy.sqrt(datareal*datareal+dataimag*dataimag)
-            for i in arange(len(datareal)):    #added MW July 2013
-                if datareal[i]>=0 and dataimag[i] >=0:   #1. quadrant
-                    datapha.append(arctan(dataimag[i]/datareal[i]))
-                elif  datareal[i] <0 and dataimag[i] >=0:  #2. quadrant
-                    data.pha.append(arctan(dataimag[i]/datareal[i])+ pi)
-                elif  datareal[i] <0 and dataimag[i] <0:  #3. quadrant
-                    datapha.append(arctan(dataimag[i]/datareal[i])- pi)
-                elif  datareal[i] >=0 and dataimag[i]<0:   #4. quadrant
-                    datapha.append(arctan(dataimag[i]/datareal[i]))   
-
-            return dataamp, datapha
-          else:
-            dataamp = numpy.sqrt(datareal*datareal+dataimag*dataimag)
-            datapha = numpy.arctan2(dataimag,datareal)
-            return dataamp, datapha
-        else:
-          raise ValueError('get_tracedata(): Format must be AmpPha or RealImag') 
+        return VNATrace.from_interleaved(data, cw=self._zerospan)
       
     def get_freqpoints(self, query = False):      
       if query == True:        
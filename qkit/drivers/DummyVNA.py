@@ -16,6 +16,7 @@
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
 from qkit.core.instrument_base import Instrument
+from qkit.drivers.AbstractVNA import VNATrace
 import numpy as np
 
 
@@ -40,6 +41,7 @@ class DummyVNA(Instrument):
         self.add_parameter('power', type=float, minval=-85, maxval=10, units='dBm',offset=True,flags=Instrument.FLAG_GET_AFTER_SET|Instrument.FLAG_GETSET)
         self.add_function('get_freqpoints')
         self.add_function('get_tracedata')
+        self.add_function('get_trace')
         self.add_function('get_sweeptime_averages')
         self.add_function('pre_measurement')
         self.add_function('start_measurement')
@@ -107,7 +109,7 @@ class DummyVNA(Instrument):
     def get_Average(self):
         return False
 
-    def get_tracedata(self, RealImag=None):
+    def get_trace(self):
 
         def S21_notch(f, fr, Ql, Qc):
             return 1. - Ql / Qc / (1. + 2j * Ql * (f - fr) / fr)
@@ -117,15 +119,10 @@ class DummyVNA(Instrument):
         fr = np.random.normal((self.stopfreq + self.startfreq) / 2, self.span / 8)
         Ql = Qi * Qc / (Qi + Qc)
         S21_data = S21_notch(self.get_freqpoints(), fr, Ql, Qi) + np.random.normal(0., 0.01, self.nop)
+        return VNATrace(S21_data)
 
-        if not RealImag:
-            amp = np.abs(S21_data)
-            pha = np.angle(S21_data)
-            return amp, pha
-        else:
-            I = S21_data.real
-            Q = S21_data.imag
-            return I, Q
+    def get_tracedata(self, RealImag=None):
+        return self.get_trace().get('RealImag' if RealImag else 'AmpPha')
 
     def get_all(self):
         pass
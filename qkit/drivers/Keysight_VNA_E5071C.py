@@ -18,6 +18,7 @@
 import qkit
 from qkit.core.instrument_base import Instrument
 from qkit import visa
+from qkit.drivers.AbstractVNA import VNATrace
 import types
 import logging
 from time import sleep
@@ -53,6 +54,7 @@ class Keysight_VNA_E5071C(Instrument):
             self._visainstrument.read_termination = idn[len(idn.strip()):]
             
         self._zerospan = False
+        self._data_format = None # last FORM:DATA sent, see _set_data_format
         self._freqpoints = 0
         self._ci = channel_index
         self._pi = 2 # port_index, similar to self._ci
@@ -98,6 +100,7 @@ class Keysight_VNA_E5071C(Instrument):
         # Implement functions
         self.add_function('get_freqpoints')
         self.add_function('get_tracedata')
+        self.add_function('get_trace')
         self.add_function('init')
         self.add_function('avg_clear')
         self.add_function('avg_status')
@@ -189,33 +192,39 @@ class Keysight_VNA_E5071C(Instrument):
         
         #sleep(0.1) # required to avoid timing issues    MW August 2013   ???
         
-        self.write('FORM:DATA REAL')
-        self.write('FORM:BORD SWAPPED')
-        data = self.ask_for_values('CALC%i:SEL:DATA:SDAT?'%(self._ci), fmt = 3)
-        data_size = numpy.size(data)
-        datareal = numpy.array(data[0:data_size:2])
-        dataimag = numpy.array(data[1:data_size:2])
-        
-        if format == 'RealImag':
-          if self._zerospan:
-            return numpy.mean(datareal), numpy.mean(dataimag)
-          else:
-            return datareal, dataimag
-        elif format == 'AmpPha':
-          if self._zerospan or self.get_cw(False):
-            datacomplex = [numpy.mean(datareal + 1j*dataimag)]
-            dataamp = numpy.abs(datacomplex)
-            datapha = numpy.angle(datacomplex)
-          else:
-            dataamp = numpy.sqrt(datareal*datareal+dataimag*dataimag)
-            datapha = numpy.arctan2(dataimag,datareal)
-          return dataamp, datapha
-        else:
+        if format not in ('AmpPha', 'RealImag'):
           raise ValueError('get_tracedata(): Format must be AmpPha or RealImag')
+        trace = self.get_trace()
+        if format == 'RealImag' and self._zerospan:
+          return trace.real[0], trace.imag[0]
+        return trace.get(format)
+
+    def _set_data_format(self, data_format):
+        '''
+        Sets the binary transfer format (FORM:DATA) only if it differs from
+        the last one sent. The byte order is sent with the first format.
+        '''
+        if data_format == self._data_format:
+            return
+        if self._data_format is None:
+            self.write('FORM:BORD SWAPPED')
+        self.write('FORM:DATA %s' % data_format)
+        self._data_format = data_format
+
+    def get_trace(self):
+        '''
+        Transfers the complex data of the current trace once (binary REAL)
+
+        Output:
+            VNATrace with amp, pha, real and imag of the trace, averaged in zerospan or cw mode
+        '''
+        self._set_data_format('REAL')
+        data = self.ask_for_values('CALC%i:SEL:DATA:SDAT?'%(self._ci), fmt = 3)
+        return VNATrace.from_interleaved(data, cw=self._zerospan or self.get_cw(False))
       
     def get_freqpoints(self, query = False):
       if query:
-           self.write("FORM:DATA REAL; FORM:BORD SWAPPED;")
+           self._set_data_format('REAL')
            self._freqpoints = self.ask_for_values(':SENS%i:FREQ:DATA?'%(self._ci), format = visa.double)
       elif self.get_cw():
            self._freqpoints = numpy.atleast_1d(self.get_cwfreq())
@@ -19,6 +19,7 @@
 import qkit
 from qkit.core.instrument_base import Instrument
 from qkit import visa
+from qkit.drivers.AbstractVNA import VNATrace
 import logging
 import numpy
 
@@ -45,6 +46,7 @@ class Keysight_VNA_E5080B(Instrument):
         Instrument.__init__(self, name, tags=['physical'])
 
         self._address = address
+        self._data_format = None # last FORM:DATA sent, see _set_data_format
         self.reconnect()
         self._freqpoints = 0
         self._ci = channel_index 
@@ -164,6 +166,7 @@ class Keysight_VNA_E5080B(Instrument):
         # Implement functions
         self.add_function('get_freqpoints')
         self.add_function('get_tracedata')
+        self.add_function('get_trace')
         self.add_function('avg_clear')
         self.add_function('avg_status')
         self.add_function('get_hold')
@@ -208,6 +211,7 @@ class Keysight_VNA_E5080B(Instrument):
         Creates a S11 measurement named "CH1_S11_1".
         """
         self._visainstrument.write('SYST:PRES')
+        self._data_format = None
     
     def hold(self, status):
         if status:
@@ -225,9 +229,32 @@ class Keysight_VNA_E5080B(Instrument):
     def avg_status(self):
         return 0 == (int(self._visainstrument.query('STAT:OPER:COND?')) & (1<<4))
 
+    def _set_data_format(self, data_format):
+        """
+        Sets the binary transfer format (FORM:DATA) only if it differs from
+        the last one sent. The byte order is sent once after a (re)connect or preset.
+        """
+        if data_format == self._data_format:
+            return
+        if self._data_format is None:
+            self._visainstrument.write('FORM:BORD SWAPPED')
+        self._visainstrument.write('FORM:DATA %s' % data_format)
+        self._data_format = data_format
+
+    def get_trace(self):
+        """
+        Transfers the complex data of the current trace once (binary REAL,32)
+
+        Output:
+            VNATrace with amp, pha, real and imag of the trace
+        """
+        self._set_data_format('REAL,32')
+        data = self._visainstrument.query_binary_values('CALC%i:MEAS%i:DATA:SDAT?' % (self._ci, self._active_trace), container=numpy.array)
+        return VNATrace.from_interleaved(data, cw=self.get_cw())
+
     def get_tracedata(self, format='AmpPha', single=False, averages=None):
         """
-        Get the data of the current trace
+        Get the data of the current trace. Use get_trace to get both formats with one transfer.
 
         Input:
             format (string) : 'AmpPha': Amp in dB and Phase, 'RealImag',
@@ -241,34 +268,16 @@ class Keysight_VNA_E5080B(Instrument):
 
             print('Average parameter no longer supported.')
 
-        self._visainstrument.write('FORM:DATA REAL,32')
-        self._visainstrument.write('FORM:BORD SWAPPED') #SWAPPED
-        data = self._visainstrument.query_binary_values('CALC%i:MEAS%i:DATA:SDAT?' %( self._ci,self._active_trace))
-        data_size = numpy.size(data)
-        datareal = numpy.array(data[0:data_size:2])
-        dataimag = numpy.array(data[1:data_size:2])
-          
-        if format == 'RealImag':
-            if self.get_cw():
-                return numpy.mean(datareal), numpy.mean(dataimag)
-            else:
-                return datareal, dataimag
-        elif format == 'AmpPha':
-            if self.get_cw():
-                datacomplex = [numpy.mean(datareal + 1j*dataimag)]
-                dataamp = numpy.abs(datacomplex)
-                datapha = numpy.angle(datacomplex)
-            else:
-                dataamp = numpy.sqrt(datareal*datareal+dataimag*dataimag)
-                datapha = numpy.arctan2(dataimag, datareal)
-            return dataamp, datapha
-        else:
+        if format not in ('AmpPha', 'RealImag'):
             raise ValueError('get_tracedata(): Format must be AmpPha or RealImag')
+        trace = self.get_trace()
+        if format == 'RealImag' and trace.cw:
+            return trace.real[0], trace.imag[0]
+        return trace.get(format)
     
     def get_segments(self):
         if self.get_sweep_type(query=False) == "SEGM":
-            self._visainstrument.write('FORM:DATA REAL,64')
-            self._visainstrument.write('FORM:BORD SWAPPED')
+            self._set_data_format('REAL,64')
             segments =  [0]
             for x in numpy.reshape(self._visainstrument.query_binary_values("sense:segment:list? SSTOP",datatype="d"),(-1,8)):
                 if x[0]>0.5: #the segment is active
@@ -279,8 +288,7 @@ class Keysight_VNA_E5080B(Instrument):
       
     def get_freqpoints(self, query=False):
         if self.get_sweep_type(query=False) == "SEGM":
-            self._visainstrument.write('FORM:DATA REAL,64')
-            self._visainstrument.write('FORM:BORD SWAPPED')
+            self._set_data_format('REAL,64')
             freqs = numpy.array([])
             for x in numpy.reshape(self._visainstrument.query_binary_values("sense:segment:list? SSTOP",datatype="d"),(-1,8)):
                 if x[0]>0.5: #the segment is active
@@ -935,6 +943,7 @@ class Keysight_VNA_E5080B(Instrument):
     
     def reconnect(self):
         self._visainstrument = visa.instrument(self._address)
+        self._data_format = None
 
     def add_segment(self,center,span,nop,power):
         self.write("SENS:SEGM1:ADD")
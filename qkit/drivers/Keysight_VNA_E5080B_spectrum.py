@@ -123,8 +123,7 @@ class Keysight_VNA_E5080B_spectrum(Keysight_VNA_E5080B.Keysight_VNA_E5080B):
         
     def get_tracedata(self, trace=1):
         if self.get_measurement_class() == 'Spectrum Analyzer':
-            self._visainstrument.write('FORM:DATA REAL,32')
-            self._visainstrument.write('FORM:BORD SWAPPED') #SWAPPED
+            self._set_data_format('REAL,32')
             data = self._visainstrument.query_binary_values('CALC%i:MEAS%i:DATA:SDAT?' %( self._ci, trace))
             return np.array(data)[::2]
         else:
@@ -20,13 +20,14 @@ from ctypes import *
 from _Spectrum_M2i2030.errors import errors as _spcm_errors
 from _Spectrum_M2i2030.regs import regs as _spcm_regs
 from qkit.core.instrument_base import Instrument
+from qkit.drivers.Spectrum_dma import SpectrumDMA, scale_to_float
 import pickle
 from time import sleep, time
 import types
 import logging
 import numpy
 
-class Spectrum_M2i2030(Instrument):
+class Spectrum_M2i2030(Instrument, SpectrumDMA):
     '''
     This is the driver for the Spectrum M2i2030 data acquisition card
 
@@ -44,7 +45,9 @@ class Spectrum_M2i2030(Instrument):
     7) fix handling of timeout! (not enough triggers detected) (error nr 263)
     '''
 
-    def __init__(self, name):
+    _regs = _spcm_regs
+
+    def __init__(self, name, dll=None):
         '''
         Initializes the dataacquisition card, and communicates with the wrapper.
 
@@ -58,6 +61,7 @@ class Spectrum_M2i2030(Instrument):
 
         Input:
             name (string) : name of the instrument
+            dll (object)  : stand-in for the spcm dll (e.g. Spectrum_dma.SpcmStandIn), default: load the dll
 
         Output:
             None
@@ -68,7 +72,7 @@ class Spectrum_M2i2030(Instrument):
 
         # Load dll and open connection
         self._card_is_open = False
-        self._load_dll()
+        self._load_dll(dll)
         self._open()
 
         # add parameters
@@ -137,16 +141,19 @@ class Spectrum_M2i2030(Instrument):
 ### init related functions
 ###########################
 
-    def _load_dll(self):
+    def _load_dll(self, dll=None):
         '''
         Loads the functions from spcm_win32.dll
 
         Input:
-            None
+            dll : use this object instead of the dll (for tests without a card)
 
         Output:
             None
         '''
+        if dll is not None:
+            self._spcm_win32 = dll
+            return
         logging.debug(__name__ + ' : Loading spcm_win32.dll')
         self._spcm_win32 = windll.LoadLibrary('C:\\WINDOWS\\System32\\spcm_win32')
 
@@ -1116,40 +1123,24 @@ class Spectrum_M2i2030(Instrument):
 
     def readout_raw_buffer(self, nr_of_channels=1):
         '''
-        Reads out the buffer, and returns a list with the size of the
-        buffer. Contains only data if the channel is triggered.
+        Waits for the end of the data transfer and returns the buffer.
+        Contains only data if the channel is triggered.
+
+        The data is a view of the DMA ring, it is overwritten by a later
+        acquisition (after dma_blocks acquisitions). Copy it if you keep it.
 
         Input:
             None
 
         Output:
-            data (int[memsize]): The data of the buffer
+            data (int8[memsize*channels]): The data of the buffer
         '''
         logging.debug(__name__ + ' : Readout raw buffer')
         lMemsize = self.get_memsize()
         lBufsize = lMemsize * nr_of_channels
 
-        a = (c_int8 * lBufsize)()
-        p_data = pointer(a)
-
-        # setup buffer
-        err = self._spcm_win32.DefTransfer64(self._spcm_win32.handel, _spcm_regs.SPCM_BUF_DATA, 1,
-            0, p_data, c_int64(0), c_int64(lBufsize))
-        if (err!=0):
-            logging.error(__name__ + ' : Error setting up buffer')
-            self._get_error()
-            raise ValueError('Error communicating with device')
-
-        # readout data
-        err = self._spcm_win32.SetParam32(self._spcm_win32.handel, _spcm_regs.SPC_M2CMD,
-            _spcm_regs.M2CMD_DATA_STARTDMA | _spcm_regs.M2CMD_DATA_WAITDMA)
-        if (err!=0):
-            logging.error(__name__ + ' : Error during read, error nr: %i' % err)
-            self._get_error()
-            raise ValueError('Error communicating with device')
-
-        data = p_data.contents[:]
-        return data
+        self._dma_start(lBufsize)
+        return self._dma_wait()
 
     def readout_singlechannel_singlemode_bin(self):
         '''
@@ -1167,14 +1158,14 @@ class Spectrum_M2i2030(Instrument):
         data = self.readout_raw_buffer()
         return data
 
-    def readout_singlechannel_singlemode_float(self):
+    def readout_singlechannel_singlemode_float(self, out=None):
         '''
         Reads out the buffer, and converts the data to the actual input voltage.
         Returns a list with the size of the buffer.
         Contains only data if the channel is triggered.
 
         Input:
-            None
+            out (float32[memsize]) : optional array the result is written to
 
         Output:
             dataout (float[memsize]): The data of the buffer
@@ -1185,81 +1176,65 @@ class Spectrum_M2i2030(Instrument):
         offset = float(self.get_input_offset_ch0())
 
         data = self.readout_raw_buffer()
-        if data == 'timeout':
-            return data
-        data = numpy.array(data, numpy.float32)
-        data = []
-        data = 2.0 * amp * (data / 255.0) + offset
-        return data
+        return scale_to_float(data, amp, offset, out)
 
     def readout_singlechannel_multimode_bin(self):
         lMemsize = self.get_memsize()
         lSegsize = self.get_segmentsize()
 
-        lnumber_of_samples = lMemsize / lSegsize
+        lnumber_of_segments = int(lMemsize / lSegsize)
 
         data = self.readout_raw_buffer()
-        if data == 'timeout':
-            return data
-        data = numpy.array(data, numpy.int8)
-        data = numpy.reshape(data, (lnumber_of_samples, lSegsize))
+        data = numpy.reshape(data, (lnumber_of_segments, lSegsize))
         return data
 
-    def readout_singlechannel_multimode_float(self):
+    def readout_singlechannel_multimode_float(self, out=None):
         lMemsize = self.get_memsize()
         lSegsize = self.get_segmentsize()
         amp = float(self.get_input_amp_ch0())
         offset = float(self.get_input_offset_ch0())
 
-        lnumber_of_samples = lMemsize / lSegsize
+        lnumber_of_segments = int(lMemsize / lSegsize)
 
         data = self.readout_raw_buffer()
-        if data == 'timeout':
-            return data
-        data = numpy.array(data, numpy.float32)
-        data = numpy.reshape(data, (lnumber_of_samples, lSegsize))
-        data = 2.0 * amp * (data / 255.0) + offset
-        return data
+        data = numpy.reshape(data, (lnumber_of_segments, lSegsize))
+        return scale_to_float(data, amp, offset, out)
 
     def readout_doublechannel_multimode_bin(self):
         lMemsize = self.get_memsize()
         lSegsize = self.get_segmentsize()
 
-        lnumber_of_samples = lMemsize / lSegsize
+        lnumber_of_segments = int(lMemsize / lSegsize)
 
         data = self.readout_raw_buffer(nr_of_channels=2)
-        if data == 'timeout':
-            return data
-        data = numpy.array(data, numpy.int8)
-        data = numpy.reshape(data, (lMemsize, 2))
-        data0 = data[:,0]
-        data1 = data[:,1]
-        data0 = numpy.reshape(data0, (lnumber_of_samples, lSegsize))
-        data1 = numpy.reshape(data1, (lnumber_of_samples, lSegsize))
-        return (data0, data1)
-
-    def readout_doublechannel_multimode_float(self):
+        data = numpy.reshape(data, (lnumber_of_segments, lSegsize, 2))
+        return (data[:, :, 0], data[:, :, 1])
+
+    def readout_doublechannel_multimode_float(self, out=None):
+        '''
+        Reads out both channels and converts them to the input voltage.
+
+        Input:
+            out (float32[2, segments, segmentsize]) : optional array the result is written to
+
+        Output:
+            (data0, data1) (float[segments, segmentsize])
+        '''
         lMemsize = self.get_memsize()
         lSegsize = self.get_segmentsize()
         amp0 = float(self.get_input_amp_ch0())
-        offset0 = float(self.get_input_offset_ch1())
-        amp1 = float(self.get_input_amp_ch0())
+        offset0 = float(self.get_input_offset_ch0())
+        amp1 = float(self.get_input_amp_ch1())
         offset1 = float(self.get_input_offset_ch1())
 
-        lnumber_of_samples = lMemsize / lSegsize
+        lnumber_of_segments = int(lMemsize / lSegsize)
 
-        data = self.readout_raw_buffer(nr_of_channels=2)
-        if data == 'timeout':
-            return data
-        data = numpy.array(data, numpy.int8)
-        data = numpy.reshape(data, (lMemsize, 2))
-        data0 = data[:,0]
-        data1 = data[:,1]
-        data0 = numpy.reshape(data0, (lnumber_of_samples, lSegsize))
-        data1 = numpy.reshape(data1, (lnumber_of_samples, lSegsize))
-        data0 = 2.0 * amp0 * (data0 / 255.0) + offset0
-        data1 = 2.0 * amp1 * (data1 / 255.0) + offset1
-        return (data0, data1)
+        data = self.readout_doublechannel_multimode_bin()
+        if out is None:
+            out = numpy.empty((2, lnumber_of_segments, lSegsize), numpy.float32)
+        scale_to_float(data[0], amp0, offset0, out[0])
+        scale_to_float(data[1], amp1, offset1, out[1])
+        return (out[0], out[1])
 
 
 ### test run
@@ -23,6 +23,7 @@ from ctypes import *
 from _Spectrum_M4i2211.errors import errors as _spcm_errors
 from _Spectrum_M4i2211.regs import regs as _spcm_regs
 from qkit.core.instrument_base import Instrument
+from qkit.drivers.Spectrum_dma import SpectrumDMA, scale_to_float
 import pickle
 from time import sleep, time
 import types
@@ -30,7 +31,7 @@ import logging
 import numpy
 import platform
 
-class Spectrum_M4i2211(Instrument):
+class Spectrum_M4i2211(Instrument, SpectrumDMA):
     '''
     This is the driver for the Spectrum M3i2132 data acquisition card
 
@@ -48,7 +49,9 @@ class Spectrum_M4i2211(Instrument):
     7) fix handling of timeout! (not enough triggers detected) (error nr 263)
     '''
 
-    def __init__(self, name):
+    _regs = _spcm_regs
+
+    def __init__(self, name, dll=None):
         '''
         Initializes the dataacquisition card, and communicates with the wrapper.
 
@@ -62,6 +65,7 @@ class Spectrum_M4i2211(Instrument):
 
         Input:
             name (string) : name of the instrument
+            dll (object)  : stand-in for the spcm dll (e.g. Spectrum_dma.SpcmStandIn), default: load the dll
 
         Output:
             None
@@ -72,7 +76,7 @@ class Spectrum_M4i2211(Instrument):
 
         # Load dll and open connection
         self._card_is_open = False
-        self._load_dll()
+        self._load_dll(dll)
         self._open()
 
         # add parameters
@@ -152,16 +156,19 @@ class Spectrum_M4i2211(Instrument):
 ### init related functions
 ###########################
 
-    def _load_dll(self):
+    def _load_dll(self, dll=None):
         '''
         Loads the functions from spcm_win32.dll
 
         Input:
-            None
+            dll : use this object instead of the dll (for tests without a card)
 
         Output:
             None
         '''
+        if dll is not None:
+            self._spcm_win32 = dll
+            return
         if platform.architecture()[0] == '64bit':
             pf_64Bit = True
             drv_handle= POINTER(c_uint64)
@@ -1286,69 +1293,32 @@ class Spectrum_M4i2211(Instrument):
 
     def _buffer_setup(self):
         '''
-        create a new data buffer
-        (assuming the old one is now owned by another part of the program)
+        defines the next block of the DMA ring as data buffer and starts the
+        DMA transfer. The ring is allocated once, see Spectrum_dma.
         '''
         self.invalidate_buffer()
         logging.debug(__name__ + ' : _buffer_setup')
         lMemsize = self.get_memsize()
         lBufsize = lMemsize * self._numchannels
-
-        # setup buffer
-        #if hasattr(self, '_pbuffer') and (len(self._pbuffer.contents) == lBufsize):
-        #	pass
-            # tell the card that the buffer is now available again
-            #err = self._spcm_win32.SetParam32(self._spcm_win32.handel, _spcm_regs.SPC_DATA_AVAIL_CARD_LEN,
-            #	lBufsize)
-            #if (err!=0):
-            #	self._get_error()
-            #	raise ValueError('Error communicating with device')
-        #else:
-        a = (c_int8 * lBufsize)()
-        p_data = pointer(a)
-
-        # tell card to use buffer
-        err = self._spcm_win32.DefTransfer64(self._spcm_win32.handel, _spcm_regs.SPCM_BUF_DATA, 1,
-            0, p_data, c_int64(0), c_int64(lBufsize))
-        if (err!=0):
-            logging.error(__name__ + ' : Error setting up buffer')
-            self._get_error()
-            raise ValueError('Error communicating with device')
-
-        # start DMA transfers
-        err = self._spcm_win32.SetParam32(self._spcm_win32.handel, _spcm_regs.SPC_M2CMD,
-            _spcm_regs.M2CMD_DATA_STARTDMA)
-        if (err!=0):
-            logging.error(__name__ + ' : Error starting DMA transfer, error nr: %i' % err)
-            self._get_error()
-            raise ValueError('Error communicating with device')
-
-        # save new buffer possibly freeing old one, will break if DMA is in progress
-        self._pbuffer = p_data
+        self._dma_start(lBufsize)
 
 
     def readout_raw_buffer(self, nr_of_channels=1):
         '''
-        Reads out the buffer, and returns a list with the size of the
-        buffer. Contains only data if the channel is triggered.
+        Waits for the end of the data transfer and returns the buffer.
+        Contains only data if the channel is triggered.
+
+        The data is a view of the DMA ring, it is overwritten by a later
+        acquisition (after dma_blocks acquisitions). Copy it if you keep it.
 
         Input:
             None
 
         Output:
-            data (int[memsize]): The data of the buffer
+            data (int8[memsize*channels]): The data of the buffer
         '''
         logging.debug(__name__ + ' : Readout raw buffer')
-
-        # wait for end of data transfer
-        err = self._spcm_win32.SetParam32(self._spcm_win32.handel, _spcm_regs.SPC_M2CMD,
-            _spcm_regs.M2CMD_DATA_WAITDMA)# | _spcm_regs.M2CMD_CARD_WAITREADY)
-        if (err!=0):
-            logging.error(__name__ + ' : Error during read, error nr: %i' % err)
-            self._get_error()
-            raise ValueError('Error communicating with device')
-
-        return self._pbuffer.contents # [:]
+        return self._dma_wait()
 
     def readout_singlechannel_singlemode_bin(self):
         '''
@@ -1366,14 +1336,14 @@ class Spectrum_M4i2211(Instrument):
         data = self.readout_raw_buffer()
         return data
 
-    def readout_singlechannel_singlemode_float(self):
+    def readout_singlechannel_singlemode_float(self, out=None):
         '''
         Reads out the buffer, and converts the data to the actual input voltage.
         Returns a list with the size of the buffer.
         Contains only data if the channel is triggered.
 
         Input:
-            None
+            out (float32[memsize]) : optional array the result is written to
 
         Output:
             dataout (float[memsize]): The data of the buffer
@@ -1384,11 +1354,7 @@ class Spectrum_M4i2211(Instrument):
         offset = float(self.get_input_offset_ch0())
 
         data = self.readout_raw_buffer()
-        if data == 'timeout':
-            return data
-        data = numpy.array(data, numpy.float32)
-        data = 2.0 * amp * (data / 255.0) + offset
-        return data
+        return scale_to_float(data, amp, offset, out)
 
     def readout_singlechannel_multimode_bin(self):
         lMemsize = self.get_memsize()
@@ -1397,13 +1363,10 @@ class Spectrum_M4i2211(Instrument):
         lnumber_of_segments = int(lMemsize / lSegsize)
 
         data = self.readout_raw_buffer()
-        if data == 'timeout':
-            return data
-        data = numpy.frombuffer(data, numpy.int8)
         data = numpy.reshape(data, (1, lnumber_of_segments, lSegsize))
         return data
 
-    def readout_singlechannel_multimode_float(self):
+    def readout_singlechannel_multimode_float(self, out=None):
         lMemsize = self.get_memsize()
         lSegsize = self.get_segmentsize()
         amp = float(self.get_input_amp_ch0())
@@ -1412,12 +1375,8 @@ class Spectrum_M4i2211(Instrument):
         lnumber_of_segments = int(lMemsize / lSegsize)
 
         data = self.readout_raw_buffer()
-        if data == 'timeout':
-            return data
-        data = numpy.array(data, numpy.float32)
         data = numpy.reshape(data, (lnumber_of_segments, lSegsize))
-        data = 2.0 * amp * (data / 255.0) + offset
-        return data
+        return scale_to_float(data, amp, offset, out)
 
     def readout_doublechannel_singlemode_bin(self):
         '''
@@ -1435,10 +1394,6 @@ class Spectrum_M4i2211(Instrument):
         lMemsize = self.get_memsize()
 
         data = self.readout_raw_buffer(nr_of_channels=2)
-        if data == 'timeout':
-            return data
-
-        data = numpy.array(data, numpy.int8)
         data = numpy.reshape(data, (lMemsize, 2))
         return data
 
@@ -1449,35 +1404,35 @@ class Spectrum_M4i2211(Instrument):
         lnumber_of_segments = int(lMemsize / lSegsize)
 
         data = self.readout_raw_buffer(nr_of_channels=2)
-        if data == 'timeout':
-            return data
-        data = numpy.frombuffer(data, numpy.int8, 2*lMemsize)
-        data = numpy.reshape(data, (lnumber_of_segments, lSegsize, 2))#(lMemsize, 2))
+        data = numpy.reshape(data[:2*lMemsize], (lnumber_of_segments, lSegsize, 2))#(lMemsize, 2))
         data = numpy.rollaxis(data, 2) # channel, segment, sample
         return data
 
-    def readout_doublechannel_multimode_float(self):
+    def readout_doublechannel_multimode_float(self, out=None):
+        '''
+        Reads out both channels and converts them to the input voltage.
+
+        Input:
+            out (float32[2, segments, segmentsize]) : optional array the result is written to
+
+        Output:
+            (data0, data1) (float[segments, segmentsize])
+        '''
         lMemsize = self.get_memsize()
         lSegsize = self.get_segmentsize()
         amp0 = float(self.get_input_amp_ch0())
-        offset0 = float(self.get_input_offset_ch1())
-        amp1 = float(self.get_input_amp_ch0())
+        offset0 = float(self.get_input_offset_ch0())
+        amp1 = float(self.get_input_amp_ch1())
         offset1 = float(self.get_input_offset_ch1())
 
         lnumber_of_segments = int(lMemsize / lSegsize)
 
-        data = self.readout_raw_buffer(nr_of_channels=2)
-        if data == 'timeout':
-            return data
-        data = numpy.array(data, numpy.int8)
-        data = numpy.reshape(data, (lMemsize, 2))
-        data0 = data[:,0]
-        data1 = data[:,1]
-        data0 = numpy.reshape(data0, (lnumber_of_segments, lSegsize))
-        data1 = numpy.reshape(data1, (lnumber_of_segments, lSegsize))
-        data0 = 2.0 * amp0 * (data0 / 255.0) + offset0
-        data1 = 2.0 * amp1 * (data1 / 255.0) + offset1
-        return (data0, data1)
+        data = self.readout_doublechannel_multimode_bin()
+        if out is None:
+            out = numpy.empty((2, lnumber_of_segments, lSegsize), numpy.float32)
+        scale_to_float(data[0], amp0, offset0, out[0])
+        scale_to_float(data[1], amp1, offset1, out[1])
+        return (out[0], out[1])
 
 
 ### test run
@@ -0,0 +1,311 @@
+# Spectrum_dma.py: DMA buffer handling shared by the Spectrum M2i/M3i/M4i drivers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+'''
+DMA readout for the Spectrum digitizer drivers.
+
+The card writes into a page aligned ring of blocks which is allocated once and
+reused for all acquisitions. The data is handed out as numpy views of the ring
+(no copy); the float readouts scale these views in place into (optionally
+preallocated) float32 arrays.
+
+Standard mode (start/readout_*):
+    every acquisition uses the next block of the ring. A binary readout is a
+    view of its block and stays valid for 'dma_blocks'-1 further acquisitions.
+    Copy it if you need it longer.
+
+FIFO mode (fifo_segments):
+    the whole ring is one continuous DMA buffer, the card hands it over in
+    blocks of segments. The generator yields one block per iteration, the block
+    is given back to the card when the loop continues.
+
+    for block in card.fifo_segments(segments_per_block=256):
+        avg += block.sum(axis=1)   # block: channel, segment, sample
+
+For tests without hardware, the drivers accept a stand-in for the spcm dll:
+    card = qkit.instruments.create('card', 'Spectrum_M4i2211', dll=SpcmStandIn())
+'''
+
+import logging
+from ctypes import c_void_p, c_int8, c_int64, cast
+
+import numpy
+
+PAGE_SIZE = 4096
+TIMEOUT_ERROR = 263
+
+
+def aligned_empty(nbytes, dtype=numpy.int8, alignment=PAGE_SIZE):
+    '''
+    Returns an uninitialized array of nbytes whose data starts at a multiple
+    of alignment. The array keeps its underlying allocation alive.
+    '''
+    raw = numpy.empty(nbytes + alignment, numpy.uint8)
+    offset = (-raw.ctypes.data) % alignment
+    return raw[offset:offset + nbytes].view(dtype)
+
+
+def scale_to_float(data, amp, offset, out=None):
+    '''
+    Converts the binary data (8 bit) of a channel to the input voltage in mV:
+    2*amp*data/255 + offset. The result is written into out (float32) if given.
+    '''
+    if out is None:
+        out = numpy.empty(data.shape, numpy.float32)
+    numpy.multiply(data, 2.0 * amp / 255.0, out=out, casting='unsafe')
+    out += offset
+    return out
+
+
+class DMABufferRing(object):
+    '''
+    page aligned ring of 'blocks' equally sized DMA blocks.
+    The memory is only reallocated if a larger block is requested.
+    '''
+    def __init__(self, blocks=2, dtype=numpy.int8):
+        self.blocks = max(1, int(blocks))
+        self.dtype = numpy.dtype(dtype)
+        self.buffer = None
+        self.blocksize = 0
+        self._index = -1
+
+    def resize(self, nbytes, blocks=None):
+        "makes sure that every block holds at least nbytes, returns the block size"
+        if blocks is not None and int(blocks) != self.blocks:
+            self.blocks = max(1, int(blocks))
+            self.buffer = None
+        blocksize = -(-int(nbytes) // PAGE_SIZE) * PAGE_SIZE
+        if self.buffer is None or blocksize > self.blocksize:
+            self.buffer = aligned_empty(blocksize * self.blocks, self.dtype)
+            self.blocksize = blocksize
+            self._index = -1
+        return self.blocksize
+
+    def address(self, byte_offset=0):
+        return self.buffer.ctypes.data + byte_offset
+
+    def block(self, index, nbytes=None):
+        "view of block index, optionally only the first nbytes"
+        start = index * self.blocksize // self.dtype.itemsize
+        stop = start + (self.blocksize if nbytes is None else nbytes) // self.dtype.itemsize
+        return self.buffer[start:stop]
+
+    def next(self, nbytes):
+        "returns (index, view) of the next block for nbytes"
+        self.resize(nbytes)
+        self._index = (self._index + 1) % self.blocks
+        return self._index, self.block(self._index, nbytes)
+
+
+class SpectrumDMA(object):
+    '''
+    mixin for the Spectrum drivers, expects the driver attributes
+    _spcm_win32 (dll with handel), _regs (register definitions),
+    _set_param, _get_param and _get_error.
+    '''
+    dma_blocks = 2
+
+    def _dma_ring(self):
+        if getattr(self, '_dma', None) is None:
+            self._dma = DMABufferRing(self.dma_blocks)
+        return self._dma
+
+    def _dma_check(self, err, action):
+        if err != 0:
+            logging.error(__name__ + ' : Error %s, error nr: %i' % (action, err))
+            self._get_error()
+            raise ValueError('Error communicating with device')
+
+    def _dma_define(self, address, nbytes, notify=0):
+        "defines the data transfer of the card into nbytes at address"
+        err = self._spcm_win32.DefTransfer64(self._spcm_win32.handel, self._regs.SPCM_BUF_DATA,
+            self._regs.SPCM_DIR_CARDTOPC, notify, c_void_p(address), c_int64(0), c_int64(nbytes))
+        self._dma_check(err, 'setting up buffer')
+
+    def _dma_start(self, nbytes):
+        '''
+        defines the next block of the ring as buffer for nbytes and starts the
+        DMA transfer. The blocks of the previous acquisitions are left alone.
+        '''
+        ring = self._dma_ring()
+        index, self._dma_view = ring.next(nbytes)
+        self._dma_define(ring.address(index * ring.blocksize), nbytes)
+        err = self._spcm_win32.SetParam32(self._spcm_win32.handel, self._regs.SPC_M2CMD,
+            self._regs.M2CMD_DATA_STARTDMA)
+        self._dma_check(err, 'starting DMA transfer')
+        return self._dma_view
+
+    def _dma_wait(self):
+        "waits for the end of the DMA transfer and returns the view of the data"
+        err = self._spcm_win32.SetParam32(self._spcm_win32.handel, self._regs.SPC_M2CMD,
+            self._regs.M2CMD_DATA_WAITDMA)
+        self._dma_check(err, 'during read')
+        return self._dma_view
+
+    def _dma_channel_scaling(self, channel):
+        "(amp, offset) of a channel, used to convert to mV"
+        return (float(self.get('input_amp_ch%d' % channel)),
+                float(self.get('input_offset_ch%d' % channel)))
+
+    def fifo_segments(self, segments_per_block, segments=0, channels=None, blocks=8, scaled=False):
+        '''
+        Continuous acquisition in FIFO multiple recording mode.
+        Segment size, post trigger, channels, amplitudes and the trigger
+        have to be set up before (e.g. init_channel01_multiple_recording).
+
+        Input:
+            segments_per_block (int) : segments handed over at once. A block
+                                       has to be a multiple of 4096 bytes.
+            segments (int)           : total number of segments, 0 runs until the loop is left
+            channels (int)           : number of active channels, default: as selected
+            blocks (int)             : number of blocks in the DMA ring
+            scaled (bool)            : yield mV (float32) instead of the binary data
+
+        Output (generator):
+            array (channel, segment, sample) per block. The binary block is a
+            view of the DMA ring, the scaled block is overwritten by the next one.
+        '''
+        if channels is None:
+            channels = getattr(self, '_numchannels', 1)
+        segsize = int(self.get('segmentsize'))
+        notify = segments_per_block * segsize * channels * self._dma_ring().dtype.itemsize
+        if notify % PAGE_SIZE:
+            logging.error(__name__ + ' : FIFO block of %d bytes is not a multiple of %d bytes. Change segments_per_block.' % (notify, PAGE_SIZE))
+            raise ValueError
+        ring = self._dma_ring()
+        ring.resize(notify, blocks)
+        total = ring.blocksize * ring.blocks
+        itemsize = ring.dtype.itemsize
+
+        self._set_param(self._regs.SPC_CARDMODE, self._regs.SPC_REC_FIFO_MULTI)
+        self._set_param(self._regs.SPC_LOOPS, segments)
+        self._dma_define(ring.address(), total, notify)
+        err = self._spcm_win32.SetParam32(self._spcm_win32.handel, self._regs.SPC_M2CMD,
+            self._regs.M2CMD_CARD_START | self._regs.M2CMD_CARD_ENABLETRIGGER | self._regs.M2CMD_DATA_STARTDMA)
+        self._dma_check(err, 'starting FIFO acquisition')
+
+        out = numpy.empty((channels, segments_per_block, segsize), numpy.float32) if scaled else None
+        scaling = [self._dma_channel_scaling(ch) for ch in range(channels)] if scaled else None
+        acquired = 0
+        try:
+            while segments == 0 or acquired < segments:
+                err = self._spcm_win32.SetParam32(self._spcm_win32.handel, self._regs.SPC_M2CMD,
+                    self._regs.M2CMD_DATA_WAITDMA)
+                if err == TIMEOUT_ERROR:
+                    logging.error(__name__ + ' : Timeout in FIFO acquisition after %d segments' % acquired)
+                    return
+                self._dma_check(err, 'during FIFO read')
+                available = self._get_param(self._regs.SPC_DATA_AVAIL_USER_LEN)
+                position = self._get_param(self._regs.SPC_DATA_AVAIL_USER_POS)
+                while available >= notify:
+                    data = ring.buffer[position // itemsize:(position + notify) // itemsize]
+                    # samples of the channels are interleaved
+                    data = numpy.rollaxis(numpy.reshape(data, (segments_per_block, segsize, channels)), 2)
+                    if scaled:
+                        for ch in range(channels):
+                            scale_to_float(data[ch], scaling[ch][0], scaling[ch][1], out[ch])
+                        yield out
+                    else:
+                        yield data
+                    self._set_param(self._regs.SPC_DATA_AVAIL_CARD_LEN, notify)
+                    position = (position + notify) % total
+                    available -= notify
+                    acquired += segments_per_block
+                    if segments and acquired >= segments:
+                        break
+        finally:
+            self._spcm_win32.SetParam32(self._spcm_win32.handel, self._regs.SPC_M2CMD,
+                self._regs.M2CMD_CARD_STOP | self._regs.M2CMD_DATA_STOPDMA)
+
+
+class SpcmStandIn(object):
+    '''
+    stand-in for the spcm dll to run the Spectrum drivers without a card.
+    Registers are stored, data transfers are filled with signal(n), which
+    returns n int8 values (default: a sawtooth).
+    '''
+    SPC_M2CMD = 100
+    M2CMD_DATA_STARTDMA = 0x00010000
+    M2CMD_DATA_WAITDMA = 0x00020000
+    M2CMD_DATA_STOPDMA = 0x00040000
+    M2CMD_CARD_STOP = 0x00000040
+    SPC_DATA_AVAIL_USER_LEN = 200
+    SPC_DATA_AVAIL_USER_POS = 201
+    SPC_DATA_AVAIL_CARD_LEN = 202
+
+    def __init__(self, signal=None):
+        self.registers = {}
+        self.signal = signal or (lambda n: (numpy.arange(n) % 256 - 128).astype(numpy.int8))
+        self.handel = None
+        self._transfer = None
+        self._available = 0
+        self._position = 0
+
+    def open(self, name):
+        return 1
+
+    def close(self, handle):
+        pass
+
+    def SetParam32(self, handle, reg, value):
+        value = getattr(value, 'value', value)
+        if reg == self.SPC_M2CMD:
+            self._command(value)
+        elif reg == self.SPC_DATA_AVAIL_CARD_LEN:
+            self._position = (self._position + value) % self._transfer[2]
+            self._available -= value
+        self.registers[reg] = value
+        return 0
+    SetParam64 = SetParam32
+
+    def GetParam32(self, handle, reg, p_value):
+        if reg == self.SPC_DATA_AVAIL_USER_LEN:
+            value = self._available
+        elif reg == self.SPC_DATA_AVAIL_USER_POS:
+            value = self._position
+        else:
+            value = self.registers.get(reg, 0)
+        p_value.contents.value = value
+        return 0
+    GetParam64 = GetParam32
+
+    def DefTransfer64(self, handle, buftype, direction, notify, p_data, offset, length):
+        address = cast(p_data, c_void_p).value
+        self._transfer = (address, int(getattr(notify, 'value', notify)), int(getattr(length, 'value', length)))
+        self._available = 0
+        self._position = 0
+        return 0
+
+    def InValidateBuf(self, handle, buftype):
+        self._transfer = None
+        return 0
+
+    def GetErrorInfo(self, handle, p_reg, p_value, text):
+        return 0
+
+    def _fill(self, start, n):
+        data = numpy.ascontiguousarray(self.signal(n), numpy.int8)
+        view = numpy.ctypeslib.as_array((c_int8 * n).from_address(self._transfer[0] + start))
+        view[:] = data
+
+    def _command(self, cmd):
+        if self._transfer is None:
+            return
+        address, notify, length = self._transfer
+        if cmd & self.M2CMD_DATA_STARTDMA and not notify:
+            self._fill(0, length)
+        if cmd & self.M2CMD_DATA_WAITDMA and notify and self._available < length:
+            self._fill((self._position + self._available) % length, notify)
+            self._available += notify
@@ -413,6 +413,19 @@ class Tabor_WX1284C(Instrument):
         for idx in range(self._choff+1,self._numchannels + 1):
             self.write(':INST%i; :TRAC:DEL:ALL'%idx)
 
+    def delete_segment(self, seg, channel=1):
+        '''
+        Deletes a single segment from the memory of a channel pair.
+        Input:
+            seg (int)     : # of the data segment
+            channel (int) : channels are paired (1&2, 3&4) selecting either of one pair is fine
+        Output:
+            None
+        '''
+        channel += self._choff
+        logging.debug(__name__ + ' : Delete segment %i of channel %i' % (seg, channel))
+        self.write(':INST%i; :TRAC:DEL %i' % (channel, seg))
+
     def run(self):
         '''
         Initiates the output of a waveform or a sequence. This is equivalent to pressing
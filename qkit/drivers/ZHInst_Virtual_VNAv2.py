@@ -1,5 +1,5 @@
 from qkit.core.instrument_basev2 import ModernInstrument, QkitFunction
-from qkit.drivers.AbstractVNA import AbstractVNA
+from qkit.drivers.AbstractVNA import AbstractVNA, VNATrace
 from qkit.drivers.ZHInst_SHFSG import ZHInst_SHFSG
 from qkit.drivers.ZHInst_UHFQA import ZHInst_UHFQA
 
@@ -72,6 +72,10 @@ class ZHInst_Virtual_VNAv2(ModernInstrument, AbstractVNA):
         else:
             return self._i_q_data[:, 0], self._i_q_data[:, 1]
 
+    @QkitFunction
+    def get_trace(self) -> VNATrace:
+        return VNATrace.from_iq(self._i_q_data[:, 0], self._i_q_data[:, 1])
+
     @QkitFunction
     def _get_shfsg_frequencies(self) -> tuple((float, float)):
         """
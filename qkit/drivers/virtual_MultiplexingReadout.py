@@ -149,6 +149,12 @@ class virtual_MultiplexingReadout(Instrument):
         # lowpass_delay = (lowpass_order / 2) / freqs
         # a lowpass of order N delays the signal by N/2 samples
 
+        # number of segments demodulated in one matrix product, None: all at once
+        self.decode_chunk_size = None
+        # demodulation matrices and lowpass filters, cleared when tones or LO change
+        self._basis_cache = {}
+        self._lowpass_cache = {}
+
     def get_all(self):
         self.get_LO()
 
@@ -221,6 +227,8 @@ class virtual_MultiplexingReadout(Instrument):
         """
         self.sample.readout_mw_src.set_frequency(frequency)
         self._LO = frequency
+        self._basis_cache = {}
+        self._lowpass_cache = {}
 
     def do_get_LO(self):
         return self._LO
@@ -233,6 +241,8 @@ class virtual_MultiplexingReadout(Instrument):
 
     def do_set_tone_freq(self, freqs):
         self._tone_freq = np.array(freqs)
+        self._basis_cache = {}
+        self._lowpass_cache = {}
 
     def do_get_tone_freq(self):
         return self._tone_freq
@@ -293,22 +303,11 @@ class virtual_MultiplexingReadout(Instrument):
         :return:
         """
         Is, Qs = self._acquire_IQ()
+        # in segmented mode, all segments (columns of Is, Qs) are processed at once
         if ddc is None:
-            if len(Is.shape) == 2:
-                sig_amp = np.zeros((Is.shape[1], len(self._tone_freq)))
-                sig_pha = np.zeros((Is.shape[1], len(self._tone_freq)))
-                for idx in range(Is.shape[1]):
-                    sig_amp[idx, :], sig_pha[idx, :] = self.IQ_decode(Is[:, idx], Qs[:, idx])
-            else:
-                sig_amp, sig_pha = self.IQ_decode(Is, Qs)
+            sig_amp, sig_pha = self.IQ_decode(Is, Qs)
         else:
-            if len(Is.shape) == 2:
-                sig_amp = np.zeros((Is.shape[1],Is.shape[0], len(self._tone_freq)))
-                sig_pha = np.zeros((Is.shape[1],Is.shape[0], len(self._tone_freq)))
-                for idx in range(Is.shape[1]):
-                    sig_amp[idx,:, :], sig_pha[idx,:, :] = self.digital_down_conversion(Is[:, idx], Qs[:, idx])
-            else:
-                sig_amp, sig_pha = self.digital_down_conversion(Is, Qs)
+            sig_amp, sig_pha = self.digital_down_conversion(Is, Qs)
         if timeTrace:
             return sig_amp, sig_pha, Is, Qs
         else:
@@ -350,60 +349,109 @@ class virtual_MultiplexingReadout(Instrument):
             return amplitude and phase of requested frequency components
 
             Input:
-                I, Q       - signal acquired at rate samplerate
+                I, Q       - signal acquired at rate samplerate, 
+                             2D arrays (samples, segments) for segmented acquisitions
                 freqs      - interesting frequency components
                 samplerate - rate at which I and Q were sampled
                 phase      - apply additional rotation to I+1j*Q
 
             Output:
                 two vectors: amplitude and phase of each fft point
+                (arrays of shape (segments, len(freqs)) for segmented acquisitions)
         """
         if samplerate is None: samplerate = self.get_adc_clock()
         if freqs is None: freqs = self._tone_freq
         if phase is None: phase = self._phase
-        freqs = abs(np.array(freqs)-self._LO)
-
-        sig_t = (np.array(I) + 1j*np.array(Q))*np.exp(1j*phase)
-        return self.fourieranalysis(sig_t, freqs, samplerate)
+        freqs = abs(np.atleast_1d(freqs)-self._LO)
+        I, Q = np.asarray(I), np.asarray(Q)
+
+        if I.ndim == 1:
+            sig_t = (I + 1j*Q)*np.exp(1j*phase)
+            return self.fourieranalysis(sig_t, freqs, samplerate)
+        # segments are decoded in chunks of decode_chunk_size to limit the memory
+        chunk = int(self.decode_chunk_size or I.shape[1])
+        sig_amp = np.empty((I.shape[1], len(freqs)))
+        sig_pha = np.empty((I.shape[1], len(freqs)))
+        for start in range(0, I.shape[1], chunk):
+            s = slice(start, start + chunk)
+            sig_t = (I[:, s] + 1j*Q[:, s])*np.exp(1j*phase)
+            sig_amp[s], sig_pha[s] = self.fourieranalysis(sig_t, freqs, samplerate)
+        return sig_amp, sig_pha
 
     def fourieranalysis(self, signal_t, freqs, samplerate):
         """
         useful for only a few samples and freqs because no interpolation is needed
-        :param signal_t: The complex waveform to be analyzed
+        :param signal_t: The complex waveform to be analyzed, or a 2D array (samples, segments) of waveforms
         :param freqs: Float or array of Floats of frequencies
         :param samplerate:
-        :return: [amplitudes, phases], each of them being an array over len(freqs)
+        :return: [amplitudes, phases], each of them being an array over len(freqs) (2D: segments x len(freqs))
         """
-        freqs = np.atleast_1d(freqs)
-        w = np.array([np.exp(-2 * np.pi * 1j * f * np.arange(len(signal_t)) / samplerate) for f in freqs])
-        f_signal = np.sum(w * signal_t, axis=1) / len(signal_t)
+        w = self._get_basis('decode', freqs, len(signal_t), samplerate)
+        f_signal = w.dot(signal_t)
+        if f_signal.ndim == 2:
+            f_signal = f_signal.T
         sig_amp = np.abs(f_signal)
         sig_pha = np.angle(f_signal)
         return sig_amp, sig_pha
 
+    def _get_basis(self, kind, freqs, samples, samplerate):
+        """
+        Returns the matrix (len(freqs), samples) of exp(-2 pi i f t)/samples for the fourier analysis ('decode')
+        or exp(2 pi i f t) for the digital down conversion ('ddc').
+        The matrices are cached until tone_freq or LO change.
+        """
+        freqs = np.atleast_1d(freqs)
+        key = (kind, tuple(freqs), samples, samplerate)
+        w = self._basis_cache.get(key)
+        if w is None:
+            if len(self._basis_cache) > 8:
+                self._basis_cache = {}
+            if kind == 'decode':
+                w = np.exp(-2 * np.pi * 1j * np.outer(freqs, np.arange(samples) / samplerate)) / samples
+            else:
+                w = np.exp(2 * np.pi * 1j * np.outer(freqs, np.linspace(0, float(samples) / samplerate, samples)))
+            self._basis_cache[key] = w
+        return w
+
+    def _get_lowpass(self, f, samplerate):
+        key = (f, samplerate, self.lowpass_order, self.cut_off_freq_ratio)
+        if key not in self._lowpass_cache:
+            cut_off_freq = self.cut_off_freq_ratio * np.abs(f) / (samplerate / 2)
+            self._lowpass_cache[key] = signal.butter(self.lowpass_order, cut_off_freq, 'low')  # design the filter
+        return self._lowpass_cache[key]
+
     def digital_down_conversion(self, I, Q, freqs=None):
         """
         performs a digital down conversion to get rid of the carrier frequency.
         Useful for timetrace readout, when only envelope is needed.
-        :param I:
+        :param I: time trace, or 2D array (samples, segments)
         :param Q:
         :param freqs:
-        :return:
+        :return: amplitude and phase (samples, len(freqs)), for 2D input (segments, samples, len(freqs))
         """
         if freqs is None:
             freqs = np.array(self._tone_freq) - self._LO
+        freqs = np.atleast_1d(freqs)
         samplerate = self.get_adc_clock()
-        sig_amp = np.zeros((len(freqs), len(I)))
-        sig_pha = np.zeros((len(freqs), len(I)))
-        t = np.linspace(0, float(len(I)) / samplerate, len(I))
-        for i, f in enumerate(freqs):
-            cut_off_freq = self.cut_off_freq_ratio * np.abs(f) / (samplerate / 2)
-            b, a = signal.butter(self.lowpass_order, cut_off_freq, 'low')  # design the filter
-            signal_down = (I+1j*Q)*np.exp(1j*2*np.pi*f*t)
-            signal_down_lp = scipy.signal.lfilter(b, a, signal_down)
-            sig_amp[i, :] = np.abs(signal_down_lp)
-            sig_pha[i, :] = np.angle(signal_down_lp)
-        return sig_amp.T, sig_pha.T  # transform because readout expects the data this way
+        I, Q = np.asarray(I), np.asarray(Q)
+        mixer = self._get_basis('ddc', freqs, len(I), samplerate)
+        # segments x samples, the filters run along the last axis for all segments at once
+        segmented = I.ndim == 2
+        I, Q = np.atleast_2d(I.T), np.atleast_2d(Q.T)
+        sig_amp = np.zeros(I.shape + (len(freqs),))
+        sig_pha = np.zeros(I.shape + (len(freqs),))
+        chunk = int(self.decode_chunk_size or len(I))
+        for start in range(0, len(I), chunk):
+            s = slice(start, start + chunk)
+            sig_t = I[s] + 1j*Q[s]
+            for i, f in enumerate(freqs):
+                b, a = self._get_lowpass(f, samplerate)
+                signal_down_lp = scipy.signal.lfilter(b, a, sig_t * mixer[i], axis=-1)
+                sig_amp[s, :, i] = np.abs(signal_down_lp)
+                sig_pha[s, :, i] = np.angle(signal_down_lp)
+        if not segmented:
+            return sig_amp[0], sig_pha[0]
+        return sig_amp, sig_pha
 
     # +++++ DAC (AWG) settings ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
         
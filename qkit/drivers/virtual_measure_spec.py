@@ -323,7 +323,9 @@ class virtual_measure_spec(Instrument):
         self._acquire_multimode_prepare()
         for i in range(self._blocks):
             # retrieve current block
-            dat_block = self._acquire_multimode_extract(blocking=True, averaged=False)
+            # the block is summed up before the card writes to its DMA block again (dma_blocks > 1)
+            dat_block = self._acquire_multimode_extract(blocking=True, averaged=False,
+                                                        copy=getattr(self._dacq, 'dma_blocks', 1) < 2)
             if dat_block is None:
                 raise ValueError("dat_block is empty")
             # background-measure next block
@@ -368,11 +370,13 @@ class virtual_measure_spec(Instrument):
         # self._dacq.start_with_trigger_and_waitready()
         if (self._gate_func): self._gate_func(True)
 
-    def _acquire_multimode_extract(self, blocking=True, averaged=True):
+    def _acquire_multimode_extract(self, blocking=True, averaged=True, copy=True):
         '''
         return averaged traces acquired in multiple recording mode.
 
         blocking - if False, return to the main program if acquisition is not complete yet
+        copy - if False, the traces (averaged=False) are a view of the DMA buffer of the card,
+               which is overwritten by later acquisitions
         '''
         if (blocking):
             err = self._dacq.waitready()
@@ -402,6 +406,8 @@ class virtual_measure_spec(Instrument):
             if (averaged):
                 # two times faster than numpy.mean
                 dat = self._multimode_average(dat)
+        if (copy and not averaged):
+            dat = numpy.array(dat)
         return dat
 
     def _multimode_average1(self, dat):
@@ -4,6 +4,13 @@ import os
 import numpy as np
 import logging
 import json
+import pickle
+import hashlib
+import importlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 from numpy.core.multiarray import ndarray
 
@@ -89,10 +96,24 @@ def plot(h5_filepath, datasets=[], refresh = 2, live = True, echo = False):
 
 
 # this is for saving plots
+_pool = None
+_pool_lock = threading.Lock()
+_queue = None
+_queued_files = set()
+
+
 def save_plots(h5_filepath, comment='', save_pdf=False):
     """
     Saves plots of all datasets with default settings.
     
+    The datasets are rendered in a pool of cfg['save_plots_processes'] 
+    worker processes, so the plotting does not compete with the next 
+    measurement for the GIL. The call returns when all plots are saved. 
+    Datasets whose content did not change since their last plot are 
+    skipped. Datasets that fail in a worker are plotted again in this 
+    process. With cfg['save_plots_processes'] = 0, the plots are rendered 
+    in this process.
+    
     Args:
         h5_filepath: String, absolute filepath.
         comment: Optional comment for the plots to be added to the filenames.
@@ -100,7 +121,111 @@ def save_plots(h5_filepath, comment='', save_pdf=False):
         save_pdf: Optional boolean setting for the output file type.
             default: False
     """
-    h5plot(h5_filepath, comment=comment, save_pdf=save_pdf)
+    processes = qkit.cfg.get('save_plots_processes', 2)
+    preview_points = qkit.cfg.get('save_plots_preview_points', None)
+    if not processes or not plot_enable or not qkit.cfg.get('save_png', True):
+        h5plot(h5_filepath, comment=comment, save_pdf=save_pdf, preview_points=preview_points)
+        return
+    _save_plots_in_pool(h5_filepath, comment, save_pdf, processes, preview_points)
+
+
+def _get_pool(processes):
+    """Returns the worker pool and the queue semaphore, both created on first use.
+    
+    The workers are spawned, not forked from the (threaded) measurement 
+    process. _init_worker hands them the current qkit.cfg and the results 
+    of qkit.module_available.
+    """
+    global _pool, _queue
+    with _pool_lock:
+        if _pool is None:
+            cfg = {}
+            for k, v in qkit.cfg.items():
+                try:
+                    pickle.dumps(v)
+                    cfg[k] = v
+                except Exception:
+                    pass
+            module_available = getattr(qkit, 'module_available', None)
+            available_modules = dict(module_available.available_modules) if module_available is not None else {}
+            _pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_init_worker, initargs=(cfg, available_modules))
+            _queue = threading.BoundedSemaphore(qkit.cfg.get('save_plots_queue', 4))
+        return _pool, _queue
+
+
+def _init_worker(cfg, available_modules):
+    """Sets up qkit in a spawned worker process, which only ran the plain 'import qkit'."""
+    qkit.cfg.update(cfg)
+    if not hasattr(qkit, 'module_available'):
+        # sets qkit.module_available
+        importlib.import_module('qkit.core.s_init.S16_available_modules')
+    qkit.module_available.available_modules.update(available_modules)
+
+
+def _save_plots_in_pool(h5_filepath, comment, save_pdf, processes, preview_points):
+    global _pool
+    key = (os.path.abspath(h5_filepath), comment, save_pdf)
+    with _pool_lock:
+        if key in _queued_files:
+            # the plots of this file are already being saved
+            return
+        _queued_files.add(key)
+    try:
+        pool, queue = _get_pool(processes)
+        with queue:
+            image_dir = os.path.join(os.path.dirname(os.path.abspath(h5_filepath)), 'images')
+            if not os.path.isdir(image_dir):
+                # created here, before the workers would race for it
+                os.mkdir(image_dir)
+            hash_file = os.path.join(image_dir, '.plot_hashes.json')
+            try:
+                with open(hash_file) as f:
+                    known_hashes = json.load(f)
+            except (IOError, ValueError):
+                known_hashes = {}
+            hf = store.Data(h5_filepath)
+            try:
+                keys = ['/entry/' + pentry + '/' + centry for pentry in hf['/entry'].keys() for centry in hf['/entry/' + pentry].keys()]
+            finally:
+                hf.close()
+            futures = [pool.submit(_plot_worker, h5_filepath, k, comment, save_pdf, known_hashes.get(comment + k), preview_points) for k in keys]
+            failed = []
+            for k, future in zip(keys, futures):
+                try:
+                    known_hashes[comment + k] = future.result()
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    logging.warning("Plotting {} of {} in a worker process failed ({}), plotting here.".format(k, h5_filepath, e))
+                    failed.append(k)
+            if failed:
+                plot = h5plot(h5_filepath, comment=comment, save_pdf=save_pdf, datasets=failed,
+                              known_hashes={k: known_hashes.get(comment + k) for k in failed}, preview_points=preview_points)
+                for k in failed:
+                    known_hashes[comment + k] = plot.hashes.get(k)
+            try:
+                with open(hash_file, 'w') as f:
+                    json.dump({k: v for k, v in known_hashes.items() if v}, f)
+            except IOError as e:
+                logging.warning("Could not save the plot hashes: {}".format(e))
+        print('Plots saved in ' + image_dir)
+    except Exception as e:
+        if isinstance(e, BrokenProcessPool):
+            with _pool_lock:
+                _pool = None
+        logging.warning("Saving plots in worker processes failed ({}), plotting here.".format(e))
+        h5plot(h5_filepath, comment=comment, save_pdf=save_pdf, preview_points=preview_points)
+    finally:
+        with _pool_lock:
+            _queued_files.discard(key)
+
+
+def _plot_worker(h5_filepath, key, comment, save_pdf, known_hash, preview_points):
+    """Plots a single dataset in a worker process and returns its content hash."""
+    plot = h5plot(h5_filepath, comment=comment, save_pdf=save_pdf, datasets=[key],
+                  known_hashes={key: known_hash}, preview_points=preview_points)
+    return plot.hashes.get(key)
 
 
 class h5plot(object):
@@ -113,10 +238,17 @@ class h5plot(object):
     """
     y_data = None  # type: ndarray
 
-    def __init__(self,h5_filepath, comment='', save_pdf=False):
+    def __init__(self,h5_filepath, comment='', save_pdf=False, datasets=None, known_hashes=None, preview_points=None):
         """Inits h5plot with a h5_filepath (string, absolute path), optional 
         comment string, and optional save_pdf boolean.
+        
+        datasets optionally restricts the plots to a list of dataset urls.
+        If known_hashes ({url: hash}) is given, the content hash of every 
+        dataset is stored in self.hashes and datasets with an unchanged hash
+        and an existing image are skipped.
+        preview_points limits the points per axis of matrix and box plots.
         """
+        self.hashes = {}
         if not plot_enable or not qkit.module_available("matplotlib"):
             logging.warning("matplotlib not installed. I can not save your measurement files as png. I will disable this function.")
             qkit.cfg['save_png'] = False
@@ -125,16 +257,17 @@ class h5plot(object):
         self.comment = comment
         self.save_pdf = save_pdf
         self.path = h5_filepath
+        self.preview_points = preview_points
 
         filepath = os.path.abspath(self.path)   #put filepath to platform standards
         self.filedir  = os.path.dirname(filepath)   #return directory component of the given pathname, here filepath
 
         self.image_dir = os.path.join(self.filedir,'images')
-        try:
-            os.mkdir(self.image_dir)
-        except OSError:
-            logging.warning('Error creating image directory.')
-            pass
+        if not os.path.isdir(self.image_dir):
+            try:
+                os.mkdir(self.image_dir)
+            except OSError:
+                logging.warning('Error creating image directory.')
 
         # open the h5 file and get the hdf_lib object
         self.hf = store.Data(self.path)
@@ -145,16 +278,24 @@ class h5plot(object):
             for j, centry in enumerate(self.hf[key].keys()):
                 try:
                     self.key='/entry/'+pentry+"/"+centry
+                    if datasets is not None and self.key not in datasets:
+                        continue
                     self.ds = self.hf[self.key]
-                    if self.ds.attrs.get('save_plot', True):
-                        self.plt() # this is the plot function
+                    if not self.ds.attrs.get('save_plot', True):
+                        continue
+                    if known_hashes is not None:
+                        self.hashes[self.key] = self._get_hash()
+                        if known_hashes.get(self.key) == self.hashes[self.key] and os.path.exists(self._get_image_path() + '.png'):
+                            continue
+                    self.plt() # this is the plot function
                 except Exception as e:
                     print("Exception in qkit/gui/plot/plot.py while plotting")
                     print(self.key)
                     print(e)
         #close hf file
         self.hf.close()
-        print('Plots saved in ' + self.image_dir)
+        if datasets is None:
+            print('Plots saved in ' + self.image_dir)
 
     def plt(self):
         """
@@ -209,10 +350,7 @@ class h5plot(object):
         for i in self.ax.get_yticklabels():
             i.set_fontsize(16)
 
-        save_name = str(os.path.basename(self.filedir))[0:6] + '_' + self.key.replace('/entry/','').replace('/','_')
-        if self.comment:
-            save_name = save_name+'_'+self.comment
-        image_path = str(os.path.join(self.image_dir,save_name))
+        image_path = self._get_image_path()
 
         if self.save_pdf:
             self.canvas.print_figure(image_path+'.pdf')
@@ -224,6 +362,40 @@ class h5plot(object):
             print e
         """
 
+    def _get_image_path(self):
+        """Returns the path of the image of the current dataset, without extension."""
+        save_name = str(os.path.basename(self.filedir))[0:6] + '_' + self.key.replace('/entry/','').replace('/','_')
+        if self.comment:
+            save_name = save_name+'_'+self.comment
+        return str(os.path.join(self.image_dir,save_name))
+
+    def _get_hash(self, block_bytes=2**24):
+        """Returns a hash of the content and attributes of the current dataset.
+        
+        Numeric data is read in blocks of about block_bytes along the first
+        axis, so large datasets are never loaded completely.
+        """
+        h = hashlib.sha1()
+        h.update(str(sorted((k, str(v)) for k, v in self.ds.attrs.items())).encode())
+        h.update(str((self.ds.shape, self.save_pdf, self.preview_points)).encode())
+        if self.ds.dtype.kind in 'biufc':
+            if self.ds.ndim == 0:
+                h.update(np.ascontiguousarray(self.ds[()]).tobytes())
+                return h.hexdigest()
+            row_bytes = self.ds.dtype.itemsize * int(np.prod(self.ds.shape[1:]))
+            rows = max(1, block_bytes // max(1, row_bytes))
+            for start in range(0, self.ds.shape[0], rows):
+                h.update(np.ascontiguousarray(self.ds[start:start + rows]).tobytes())
+        else:
+            h.update(str(self.ds[()]).encode())
+        return h.hexdigest()
+
+    def _get_strides(self, shape):
+        """Returns the slices to read at most preview_points per axis."""
+        if not self.preview_points:
+            return tuple(slice(None) for _ in shape)
+        return tuple(slice(None, None, max(1, -(-n // int(self.preview_points)))) for n in shape)
+
     def plt_vector(self):
         """
         Plot one-dimensional dataset. Print data vs. x-coordinate.
@@ -272,7 +444,7 @@ class h5plot(object):
         self.y_ds = self.hf[self.y_ds_url]
         self.y_exp = self._get_exp(np.array(self.y_ds))
         self.y_label = concat(self.y_ds.attrs.get('name', '_yname_'),' (', self._unit_prefixes[self.y_exp] ,self.y_ds.attrs.get('unit','_yunit_'),')')
-        self.ds_data = np.array(self.ds).T #transpose matrix to get x/y axis correct
+        self.ds_data = self.ds[self._get_strides(self.ds.shape)].T #transpose matrix to get x/y axis correct
         self.ds_exp = self._get_exp(self.ds_data)
         self.ds_data *= 10.**-self.ds_exp
         self.ds_label = concat(self.ds.attrs.get('name', '_name_'),' (',self._unit_prefixes[self.ds_exp],self.ds.attrs.get('unit', '_unit_'),')')
@@ -328,7 +500,8 @@ class h5plot(object):
         self.z_ds = self.hf[self.z_ds_url]
         self.z_exp = self._get_exp(np.array(self.z_ds))
         self.z_label = concat(self.z_ds.attrs.get('name', '_zname_'),' (',self._unit_prefixes[self.z_exp],self.z_ds.attrs.get('unit','_zunit_'), ')')
-        self.ds_data = np.array(self.ds)[:, :, self.ds.shape[2] // 2].T  # transpose matrix to get x/y axis correct
+        # only the displayed slice is read from the file
+        self.ds_data = self.ds[self._get_strides(self.ds.shape[:2]) + (self.ds.shape[2] // 2,)].T  # transpose matrix to get x/y axis correct
         self.ds_exp = self._get_exp(self.ds_data)
         self.ds_data *= 10.**-self.ds_exp
         self.ds_label = concat(self.ds.attrs.get('name', '_name_'),' (',self._unit_prefixes[self.ds_exp],self.ds.attrs.get('unit','_unit_'),')')
@@ -65,6 +65,13 @@ class DatasetsWindow(QMainWindow, Ui_MainWindow):
         self.refreshTime_value = 2000
         self.tree_refresh  = True
         self._force_live_plot = False
+        # open file, kept open between updates for files written in SWMR mode
+        self.h5file = None
+        self._h5file_path = None
+        self._swmr = False
+        # (shape, fill) of every dataset at the last update, the dataset info is only rebuilt if it changes
+        self._ds_signatures = {}
+        self._ds_shapes = {}
         self._setup_signal_slots()        
         self.setup_timer()
         self.set_cmd_options()
@@ -115,6 +122,7 @@ class DatasetsWindow(QMainWindow, Ui_MainWindow):
 
         self.DATA._remove_plot_widgets( closeAll = True)
         self.DATA.set_info_thread_continue(False)
+        self._close_h5file()
         event.accept()
     
     @pyqtSlot()
@@ -163,6 +171,11 @@ class DatasetsWindow(QMainWindow, Ui_MainWindow):
             
             for j,centry in enumerate(self.h5file[tree_key].keys()):
                 tree_key = "/entry/"+pentry+"/"+centry
+                signature = self._ds_signature(self.h5file[tree_key])
+                if tree_key in self.DATA.ds_tree_items and self._ds_signatures.get(tree_key) == signature:
+                    # nothing changed, keep the dataset info
+                    continue
+                self._ds_signatures[tree_key] = signature
                 if tree_key not in self.DATA.ds_tree_items:
                     item = self.addChild(parent, column, str(centry),tree_key)
                     self.DATA.ds_tree_items[tree_key] = item
@@ -186,6 +199,14 @@ class DatasetsWindow(QMainWindow, Ui_MainWindow):
                     print("catch: populate data list:",e)
                 
                 self.DATA.dataset_info[tree_key] = s
+
+    @staticmethod
+    def _ds_signature(ds):
+        try:
+            fill = ds.attrs.get('fill', None)
+            return ds.shape, None if fill is None else tuple(fill)
+        except (AttributeError, TypeError, ValueError):
+            return None
                
     def addParent(self, parent, column, title,data = ''):
         item = QtGui.QTreeWidgetItem(parent, [title])
@@ -236,15 +257,56 @@ class DatasetsWindow(QMainWindow, Ui_MainWindow):
             self.Dataset_properties.insertPlainText(self.DATA.dataset_info[ds])
  
             
+    def _open_h5file(self):
+        """Opens the data file for reading.
+
+        A file written in SWMR mode (qkit.cfg['hdf_swmr']) is opened once and
+        stays open, its datasets are refreshed on every update. The writer 
+        marks these files with the root attribute 'swmr' (H5_file.start_swmr).
+        Other files are opened for every update and closed again, as their 
+        writer may change them at any time.
+        """
+        path = str(self.DATA.DataFilePath)
+        if self._swmr and self.h5file and self._h5file_path == path:
+            return
+        self._close_h5file()
+        try:
+            # a file in SWMR mode can only be opened as SWMR reader, other files can be opened like this as well
+            self.h5file = h5py.File(path, mode='r', libver='latest', swmr=True)
+        except (IOError, OSError, ValueError):
+            self.h5file = h5py.File(path, mode='r')
+        self._swmr = bool(self.h5file.attrs.get('swmr', False))
+        self._h5file_path = path
+
+    def _close_h5file(self):
+        if self.h5file:
+            self.h5file.close()
+        self._swmr = False
+
+    def _refresh_datasets(self):
+        """Refreshes all datasets of a SWMR file, returns True if any dataset grew since the last update."""
+        grown = False
+        for group in self.h5file["/entry"].values():
+            for ds in group.values():
+                if isinstance(ds, h5py.Dataset):
+                    ds.refresh()
+                    grown |= self._ds_shapes.get(ds.name) != ds.shape
+                    self._ds_shapes[ds.name] = ds.shape
+        return grown
+
     def update_file(self):
-        "update_file is regularly called when _something_ has to be updated. open-> do something->close"
+        """update_file is regularly called when _something_ has to be updated. 
+        open-> do something->close, files in SWMR mode stay open while they grow."""
         try:
-            self.h5file= h5py.File(str(self.DATA.DataFilePath),mode='r')
+            self._open_h5file()
+            grown = self._swmr and self._refresh_datasets()
             self.DATA.filename = self.h5file.filename.split(os.path.sep)[-1]
             self.populate_data_list()
             self.update_plots()
             self._disable_live_update()
-            self.h5file.close()
+            if not grown:
+                # a new session also rereads groups and attributes, e.g. 'updating' at the end of the measurement
+                self._close_h5file()
             
             s = (self.DATA.DataFilePath.split(os.path.sep)[-5:])
             self.statusBar().showMessage((os.path.sep).join(s for s in s))
@@ -262,10 +324,12 @@ class DatasetsWindow(QMainWindow, Ui_MainWindow):
             
         if _DataFilePath:
             self.DATA.DataFilePath = _DataFilePath
-            self.h5file= h5py.File(self.DATA.DataFilePath,mode='r')
+            self._ds_signatures = {}
+            self._ds_shapes = {}
+            self._open_h5file()
             self.DATA.filename = self.h5file.filename.split(os.path.sep)[-1]
             self.populate_data_list()
-            self.h5file.close()
+            self._close_h5file()
             
             s = (self.DATA.DataFilePath.split(os.path.sep)[-5:])
             self.statusBar().showMessage((os.path.sep).join(s for s in s))
@@ -32,7 +32,7 @@ import qkit
 from qkit.gui.qviewkit.plot_view import Ui_Form
 from qkit.storage.hdf_constants import ds_types, view_types
 from qkit.gui.qviewkit.PlotWindow_lib import _display_1D_view, _display_1D_data, _display_2D_data, _display_table, _display_text
-from qkit.gui.qviewkit.PlotWindow_lib import _get_ds, _get_ds_url, _get_name, _get_unit
+from qkit.gui.qviewkit.PlotWindow_lib import _get_ds, _get_ds_url, _get_name, _get_unit, _filled_rows
 from qkit.core.lib.misc import str3
 
 class PlotWindow(QWidget,Ui_Form):
@@ -540,7 +540,8 @@ class PlotWindow(QWidget,Ui_Form):
         if ds.attrs.get('ds_type') == ds_types['box']:
             x_data = np.array(x_ds)[:ds.attrs.get('fill')[0]]
         else:
-            x_data = np.array(x_ds)[:ds.shape[0]]
+            # preallocated datasets: negative trace numbers count from the last written trace
+            x_data = np.array(x_ds)[:_filled_rows(ds)]
         xunit = _get_unit(x_ds)
         try:
             xval = x_data[num]
@@ -31,6 +31,7 @@ if not in_pyqt5:
 
 import numpy as np
 import json
+import warnings
 import pyqtgraph as pg
 import qkit
 from qkit.storage.hdf_constants import ds_types
@@ -113,9 +114,9 @@ def _display_1D_view(self, graphicsView):
                         self.VTraceYSelector.setRange(-1 * range_max, range_max - 1)
                         self.VTraceYValue.setText(self._getYValueFromTraceNum(dss[1], self.VTraceYNum))
                         x_data = dss[0][()]
-                        y_data = dss[1][:,self.VTraceYNum]
+                        y_data = _get_slice(self, dss[1], slice(None), self.VTraceYNum)
                         if err_url:
-                            err_data = dss[2][:,self.VTraceYNum]
+                            err_data = _get_slice(self, dss[2], slice(None), self.VTraceYNum)
                     else:
                         self.VTraceXSelector.setEnabled(True)
                         range_max = dss[1].shape[0]
@@ -124,9 +125,9 @@ def _display_1D_view(self, graphicsView):
                         self.VTraceYSelector.setEnabled(False)
                         
                         x_data = dss[0][()]
-                        y_data = dss[1][()][self.VTraceXNum]
+                        y_data = _get_slice(self, dss[1], self.VTraceXNum)
                         if err_url:
-                            err_data = dss[2][()][self.VTraceXNum]
+                            err_data = _get_slice(self, dss[2], self.VTraceXNum)
                     x_data_len = len(x_data)
                     y_data_len = len(y_data)
                     if x_data_len != y_data_len:
@@ -146,9 +147,9 @@ def _display_1D_view(self, graphicsView):
                     self.VTraceYValue.setText(self._getYValueFromTraceNum(dss[1], self.VTraceYNum))
                     
                     x_data = dss[0][()]
-                    y_data = dss[1][()][self.VTraceXNum, self.VTraceYNum, :]
+                    y_data = _get_slice(self, dss[1], self.VTraceXNum, self.VTraceYNum, slice(None))
                     if err_url:
-                        err_data = dss[2][()][self.VTraceXNum, self.VTraceYNum, :]
+                        err_data = _get_slice(self, dss[2], self.VTraceXNum, self.VTraceYNum, slice(None))
             
             ## This is in our case used so far only for IQ plots. The
             ## functionality derives from this application.
@@ -159,8 +160,8 @@ def _display_1D_view(self, graphicsView):
                 self.VTraceXValue.setText(self._getXValueFromTraceNum(dss[1], self.VTraceXNum))
                 self.VTraceYSelector.setEnabled(False)
                 
-                x_data = dss[0][()][self.VTraceXNum]
-                y_data = dss[1][()][self.VTraceXNum]
+                x_data = _get_slice(self, dss[0], self.VTraceXNum)
+                y_data = _get_slice(self, dss[1], self.VTraceXNum)
             
             elif x_ds_type == ds_types['box']:
                 self.VTraceXSelector.setEnabled(True)
@@ -172,8 +173,8 @@ def _display_1D_view(self, graphicsView):
                 self.VTraceYSelector.setRange(-1 * range_maxY, range_maxY - 1)
                 self.VTraceYValue.setText(self._getYValueFromTraceNum(dss[1], self.VTraceYNum))
                 
-                x_data = dss[0][()][self.VTraceXNum, self.VTraceYNum, :]
-                y_data = dss[1][()][self.VTraceXNum, self.VTraceYNum, :]
+                x_data = _get_slice(self, dss[0], self.VTraceXNum, self.VTraceYNum, slice(None))
+                y_data = _get_slice(self, dss[1], self.VTraceXNum, self.VTraceYNum, slice(None))
             
             else:
                 return
@@ -218,6 +219,7 @@ def _display_1D_view(self, graphicsView):
             if err_url:
                 err = pg.ErrorBarItem(x=x_data, y=y_data, height=err_data, beam=0.25 * scales[0][0])
                 graphicsView.getPlotItem().addItem(err)
+    _set_line_lod(graphicsView)
 
     # optionally take provided x_name, y_name as labels
     if view_params.get("labels", False):
@@ -275,7 +277,7 @@ def _display_1D_data(self, graphicsView):
         # timestamps do (not?) have a x_ds_url in the 1d case. This is more a bug to be fixed in the
         # timstamp_ds part of qkit the resulting error is fixed here for now.
         try:
-            x_data = dss[0][()][:dss[1].shape[-1]]  # x_data gets truncated to y_data shape if necessarry
+            x_data = dss[0][:dss[1].shape[-1]]  # x_data gets truncated to y_data shape if necessarry
         except:
             x_data = [i for i in range(dss[1].shape[-1])]
             units[0] = "#"
@@ -314,8 +316,8 @@ def _display_1D_data(self, graphicsView):
                 self.TraceXSelector.setValue(self.TraceXNum)
                 self.TraceXValueChanged = False
             
-            y_data = dss[1][()][self.TraceXNum]
-            x_data = dss[0][()][:dss[1].shape[-1]]  # x_data gets truncated to y_data shape if neccessary
+            y_data = _get_slice(self, dss[1], self.TraceXNum)
+            x_data = dss[0][:dss[1].shape[-1]]  # x_data gets truncated to y_data shape if neccessary
         
         if self.PlotTypeSelector.currentIndex() == 2:  # x_ds on x-axis
             dss, names, units, scales = _get_all_ds_names_units_scales(self.ds, ['x_ds_url'])
@@ -333,8 +335,8 @@ def _display_1D_data(self, graphicsView):
                 self.TraceYSelector.setValue(self.TraceYNum)
                 self.TraceYValueChanged = False
             
-            y_data = dss[1][()][:, self.TraceYNum]
-            x_data = dss[0][()][:dss[1].shape[0]]  # x_data gets truncated to y_data shape if neccessary
+            y_data = _get_slice(self, dss[1], slice(None), self.TraceYNum)
+            x_data = dss[0][:dss[1].shape[0]]  # x_data gets truncated to y_data shape if neccessary
         
         self.TraceXValue.setText(self._getXValueFromTraceNum(self.ds, self.TraceXNum))
         self.TraceYValue.setText(self._getYValueFromTraceNum(self.ds, self.TraceYNum))
@@ -391,16 +393,16 @@ def _display_1D_data(self, graphicsView):
 
         if self.PlotTypeSelector.currentIndex() == 5:
             dss, names, units, scales = _get_all_ds_names_units_scales(self.ds, ['z_ds_url'])
-            x_data = dss[0][()][:dss[1].shape[2]]  # x_data gets truncated to y_data shape if neccessary
-            y_data = dss[1][()][self.TraceXNum, self.TraceYNum, :]
+            x_data = dss[0][:dss[1].shape[2]]  # x_data gets truncated to y_data shape if neccessary
+            y_data = _get_slice(self, dss[1], self.TraceXNum, self.TraceYNum, slice(None))
         if self.PlotTypeSelector.currentIndex() == 4:
             dss, names, units, scales = _get_all_ds_names_units_scales(self.ds, ['y_ds_url'])
-            x_data = dss[0][()][:dss[1].shape[1]]
-            y_data = dss[1][()][self.TraceXNum, :, self.TraceZNum]
+            x_data = dss[0][:dss[1].shape[1]]
+            y_data = _get_slice(self, dss[1], self.TraceXNum, slice(None), self.TraceZNum)
         if self.PlotTypeSelector.currentIndex() == 3:
             dss, names, units, scales = _get_all_ds_names_units_scales(self.ds, ['x_ds_url'])
-            x_data = dss[0][()][:dss[1].shape[0]]
-            y_data = dss[1][()][:, self.TraceYNum, self.TraceZNum]
+            x_data = dss[0][:dss[1].shape[0]]
+            y_data = _get_slice(self, dss[1], slice(None), self.TraceYNum, self.TraceZNum)
 
     
     ## Any data manipulation (dB <-> lin scale, etc) is done here
@@ -427,6 +429,7 @@ def _display_1D_data(self, graphicsView):
     elif self.plot_style == self.plot_styles['point']:
         graphicsView.plot(y=y_data, x=x_data, clear=True, pen=None, symbol='+')
         self.linestyle_selector.point.setChecked(True)
+    _set_line_lod(graphicsView)
     
     plIt = graphicsView.getPlotItem()
     plVi = plIt.getViewBox()
@@ -532,7 +535,7 @@ def _display_2D_data(self, graphicsView):
         """
         dss, names, units, scales = _get_all_ds_names_units_scales(self.ds, ['x_ds_url', 'y_ds_url'])
         try:
-          data = dss[2][()]
+          data = _get_slice(self, dss[2], slice(None), slice(None))
         except IOError as e:
               print("Could not open data file")
               print(e)
@@ -560,7 +563,7 @@ def _display_2D_data(self, graphicsView):
             
             dss, names, units, scales = _get_all_ds_names_units_scales(self.ds, ['y_ds_url', 'z_ds_url'])
             try:
-              data = dss[2][()][self.TraceXNum, :, :]
+              data = _get_slice(self, dss[2], self.TraceXNum, slice(None), slice(None))
             except IOError as e:
               print("Could not open data file")
               print(e)
@@ -579,7 +582,7 @@ def _display_2D_data(self, graphicsView):
             
             dss, names, units, scales = _get_all_ds_names_units_scales(self.ds, ['x_ds_url', 'z_ds_url'])
             try:
-              data = dss[2][()][:, self.TraceYNum, :]
+              data = _get_slice(self, dss[2], slice(None), self.TraceYNum, slice(None))
             except IOError as e:
               print("Could not open data file")
               print(e)
@@ -598,7 +601,7 @@ def _display_2D_data(self, graphicsView):
             
             dss, names, units, scales = _get_all_ds_names_units_scales(self.ds, ['x_ds_url', 'y_ds_url'])
             try:
-              data = dss[2][()][:, :, self.TraceZNum]
+              data = _get_slice(self, dss[2], slice(None), slice(None), self.TraceZNum)
             except IOError as e:
               print("Could not open data file")
               print(e)
@@ -625,7 +628,8 @@ def _display_2D_data(self, graphicsView):
     if np.all(np.isnan(data)):
         data[(0,) * len(data.shape)] = 0
         print("Your Data array is all NaN. I set the first value to not blow up graphics window.")
-    graphicsView.setImage(data, pos=(scales[0][0] - scales[0][1] / 2., scales[1][0] - scales[1][1] / 2.), scale=(scales[0][1], scales[1][1]))
+    # large images are displayed block-reduced to the screen resolution, see _set_lod_image
+    _set_lod_image(self, graphicsView, data, pos=(scales[0][0] - scales[0][1] / 2., scales[1][0] - scales[1][1] / 2.), scale=(scales[0][1], scales[1][1]))
     graphicsView.show()
     
     # Fixme roi ...
@@ -643,8 +647,7 @@ def _display_2D_data(self, graphicsView):
     def mouseMoved(mpos):
         mpos = mpos[0]
         mousePoint = imIt.mapFromScene(mpos)
-        x_index = int(mousePoint.x())
-        y_index = int(mousePoint.y())
+        x_index, y_index = _lod_index(self, mousePoint)
         
         xval = scales[0][0] + x_index * scales[0][1]
         yval = scales[1][0] + y_index * scales[1][1]
@@ -677,8 +680,9 @@ def _display_2D_data(self, graphicsView):
         if mce.button() == 4:
             mce.accept()
             mousePoint = imIt.mapFromScene(mce.scenePos())
-            xval = scales[0][0] + int(mousePoint.x()) * scales[0][1]
-            yval = scales[1][0] + int(mousePoint.y()) * scales[1][1]
+            x_index, y_index = _lod_index(self, mousePoint)
+            xval = scales[0][0] + x_index * scales[0][1]
+            yval = scales[1][0] + y_index * scales[1][1]
 
             if self.distance_measure[0] is False:
                 roi = pg.RectROI((xval, yval), (0,0))
@@ -775,6 +779,265 @@ def _display_string(ds):
     return txt
 
 
+""" Reading the displayed part of a dataset """
+
+
+def _filled_rows(ds):
+    """Returns the number of rows (first axis) of ds which contain data.
+
+    Preallocated datasets are larger than their content, the 'fill' attribute
+    tells how far they are written. Without it, all rows are assumed filled.
+    """
+    fill = ds.attrs.get('fill', None)
+    if fill is not None and len(fill) and fill[0] > 0:
+        return min(int(fill[0]), ds.shape[0])
+    return ds.shape[0]
+
+
+def _resolve_index(ds, index):
+    """Turns the integer indices into row numbers of ds.
+
+    Negative indices count back from the last written trace, not from the 
+    end of the dataset, which may be preallocated (NaN) or over-allocated:
+    along the first axis from _filled_rows, along the second axis of a box 
+    from fill[1] if the current (last written) matrix is selected.
+    """
+    shape = ds.shape
+    rows = _filled_rows(ds)
+    resolved = []
+    for n, i in enumerate(index):
+        if isinstance(i, (int, np.integer)):
+            length = shape[n]
+            if i < 0:
+                if n == 0:
+                    length = rows
+                elif n == 1 and len(shape) == 3 and resolved[0] == rows - 1:
+                    fill = ds.attrs.get('fill', None)
+                    if fill is not None and len(fill) > 1 and fill[1] > 0:
+                        length = min(int(fill[1]), shape[1])
+            i = int(i) % max(length, 1)
+        resolved.append(i)
+    return tuple(resolved)
+
+
+def _get_slice(self, ds, *index):
+    """Reads ds[index] from the file, i.e. only the displayed trace or slice.
+
+    Integer indices select a single trace (negative values count from the 
+    last written trace, see _resolve_index), slice(None) selects a whole axis. Slices along the first axis are 
+    kept in self._slice_cache (one per dataset). When the same slice is 
+    displayed again, only the rows appended since the last refresh are read, 
+    plus the last row read before, which may have been incomplete.
+    
+    Args:
+        self: Object of the PlotWindow class.
+        ds: h5py dataset.
+        index: one index or slice(None) per dimension.
+
+    Returns:
+        Numpy array, a copy which may be changed by the caller.
+    """
+    shape = ds.shape
+    index = _resolve_index(ds, index)
+    if len(shape) < 2 or not isinstance(index[0], slice):
+        # a single trace
+        return ds[index]
+    
+    cache = self.__dict__.setdefault('_slice_cache', {})
+    rows = _filled_rows(ds)
+    cached_index, cached_shape, cached_rows, data = cache.get(ds.name, (None, None, 0, None))
+    if cached_index != index or cached_shape[1:] != shape[1:] or cached_shape[0] > shape[0] or cached_rows > rows:
+        data = ds[index]
+    else:
+        start = max(cached_rows - 1, 0)
+        if cached_shape[0] != shape[0]:
+            # the dataset grew
+            data = np.concatenate((data[:start], ds[(slice(start, shape[0]),) + index[1:]]))
+        elif rows > start:
+            data[start:rows] = ds[(slice(start, rows),) + index[1:]]
+    cache[ds.name] = (index, shape, rows, data)
+    return data.copy()
+
+
+def benchmark_slice_reads(folder=None, sizes=(100, 1000, 10000), tracelength=1001, repeat=5):
+    """Compares the refresh latency of reading the full dataset and indexing
+    it (as qviewkit did before) with the hyperslab reads of _get_slice, for 
+    matrices with different numbers of traces.
+
+    Args:
+        folder: directory for the temporary files, default: qkit.cfg['tempdir']
+        sizes: numbers of traces
+        tracelength: number of points per trace
+        repeat: number of refreshes
+
+    Returns:
+        dict {size: {'full_trace_ms', 'trace_ms', 'full_column_ms', 'column_ms', 'column_refresh_ms'}}
+    """
+    import os
+    import time
+    import h5py
+    if folder is None:
+        folder = qkit.cfg.get('tempdir')
+
+    class _Window(object):
+        pass
+
+    def first_read(window, ds, index):
+        window.__dict__.pop('_slice_cache', None)
+        return _get_slice(window, ds, *index)
+
+    def timed(f):
+        t0 = time.time()
+        for _ in range(repeat):
+            f()
+        return 1e3 * (time.time() - t0) / repeat
+
+    results = {}
+    for size in sizes:
+        path = os.path.join(folder, "qviewkit_benchmark_%i.h5" % size)
+        with h5py.File(path, 'w') as f:
+            f.create_dataset('data', data=np.random.rand(size, tracelength), chunks=(5, tracelength))
+        with h5py.File(path, 'r') as f:
+            ds = f['data']
+            window = _Window()
+            results[size] = dict(
+                full_trace_ms=timed(lambda: ds[()][size // 2]),
+                trace_ms=timed(lambda: _get_slice(window, ds, size // 2)),
+                full_column_ms=timed(lambda: ds[()][:, tracelength // 2]),
+                column_ms=timed(lambda: first_read(window, ds, (slice(None), tracelength // 2))),
+                column_refresh_ms=timed(lambda: _get_slice(window, ds, slice(None), tracelength // 2)))
+        os.remove(path)
+    return results
+
+
+""" Level of detail for large datasets """
+
+
+def _set_line_lod(graphicsView):
+    """Lets pyqtgraph draw only the visible part of long traces, min/max 
+    decimated ('peak' mode) to the number of pixels of the plot."""
+    if qkit.cfg.get('qviewkit_lod', True):
+        plIt = graphicsView.getPlotItem()
+        plIt.setDownsampling(auto=True, mode='peak')
+        plIt.setClipToView(True)
+
+
+def _block_reduce(data, fx, fy):
+    """Averages blocks of fx x fy values of the 2d array data, NaNs are ignored."""
+    if fx == 1 and fy == 1:
+        return data
+    data = np.asarray(data, dtype=float)
+    nx, ny = data.shape
+    data = np.pad(data, ((0, -nx % fx), (0, -ny % fy)), mode='constant', constant_values=np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # blocks with only NaNs
+        return np.nanmean(data.reshape(data.shape[0] // fx, fx, data.shape[1] // fy, fy), axis=(1, 3))
+
+
+def _lod_factor(n, pixels):
+    """Returns the smallest power of two which reduces n points to at most 
+    about 'pixels' points."""
+    pixels = max(int(pixels), qkit.cfg.get('qviewkit_lod_min_pixels', 512))
+    f = 1
+    while n > f * pixels:
+        f *= 2
+    return f
+
+
+def _set_lod_image(self, graphicsView, data, pos, scale):
+    """Displays the 2d array data in graphicsView at about the screen resolution.
+
+    Images larger than the view box are block-reduced by power-of-two factors.
+    The reduced images form a pyramid which is kept in self._lod until the 
+    next refresh. When the user zooms in, _update_lod_image replaces the image 
+    by the visible tile of a finer level, down to the full resolution.
+    
+    Args:
+        self: Object of the PlotWindow class.
+        graphicsView: Object of pyqtgraph's ImageView class.
+        data: 2d numpy array in full resolution.
+        pos, scale: position and scale of a full resolution pixel, as for 
+            ImageView.setImage.
+    """
+    self._lod = dict(data=data, pos=pos, scale=scale, levels={(1, 1): data}, tile=None,
+                     enabled=qkit.cfg.get('qviewkit_lod', True))
+    _show_lod_tile(self, graphicsView, (0, data.shape[0]), (0, data.shape[1]), autoRange=True)
+    if self._lod['enabled']:
+        vb = graphicsView.getView().getViewBox()
+        self.proxy_lod = pg.SignalProxy(vb.sigRangeChanged, rateLimit=5, slot=lambda _: _update_lod_image(self, graphicsView))
+
+
+def _show_lod_tile(self, graphicsView, xrange, yrange, autoRange=False, factors=None):
+    """Displays the index ranges xrange, yrange of the full resolution data 
+    at the level given by factors, default: the level matching the size of 
+    the view box."""
+    lod = self._lod
+    data, pos, scale = lod['data'], lod['pos'], lod['scale']
+    if factors is not None:
+        fx, fy = factors
+    elif lod['enabled']:
+        vb = graphicsView.getView().getViewBox()
+        fx = _lod_factor(xrange[1] - xrange[0], vb.width())
+        fy = _lod_factor(yrange[1] - yrange[0], vb.height())
+    else:
+        fx, fy = 1, 1
+    level = lod['levels'].get((fx, fy))
+    if level is None:
+        level = lod['levels'][(fx, fy)] = _block_reduce(data, fx, fy)
+    x0, x1 = xrange[0] // fx, -(-xrange[1] // fx)
+    y0, y1 = yrange[0] // fy, -(-yrange[1] // fy)
+    lod['tile'] = (x0 * fx, x1 * fx, y0 * fy, y1 * fy, fx, fy)
+    # the levels of the color scale are only set with the full view, not when zooming
+    graphicsView.setImage(level[x0:x1, y0:y1], autoRange=autoRange, autoLevels=autoRange, autoHistogramRange=autoRange,
+                          pos=(pos[0] + x0 * fx * scale[0], pos[1] + y0 * fy * scale[1]),
+                          scale=(fx * scale[0], fy * scale[1]))
+
+
+def _update_lod_image(self, graphicsView):
+    """Slot for range changes of the view box: shows the visible part of the 
+    data at a finer (zoom in) or coarser (zoom out) level if necessary. The 
+    tile includes a margin of half the visible range on each side, so small 
+    pans do not need a new tile."""
+    lod = self.__dict__.get('_lod')
+    if lod is None or lod['tile'] is None:
+        return
+    data, pos, scale = lod['data'], lod['pos'], lod['scale']
+    vb = graphicsView.getView().getViewBox()
+
+    def visible(vrange, p, s, n):
+        if s == 0:
+            return 0, n
+        a, b = sorted(((vrange[0] - p) / s, (vrange[1] - p) / s))
+        return max(0, min(n, int(np.floor(a)))), max(0, min(n, int(np.ceil(b))))
+
+    vx, vy = vb.viewRange()
+    xrange = visible(vx, pos[0], scale[0], data.shape[0])
+    yrange = visible(vy, pos[1], scale[1], data.shape[1])
+    if xrange[0] >= xrange[1] or yrange[0] >= yrange[1]:
+        return
+    x0, x1, y0, y1, fx, fy = lod['tile']
+    if (fx, fy) == (_lod_factor(xrange[1] - xrange[0], vb.width()), _lod_factor(yrange[1] - yrange[0], vb.height())) \
+            and x0 <= xrange[0] and xrange[1] <= x1 and y0 <= yrange[0] and yrange[1] <= y1:
+        return
+
+    def margin(r, n):
+        m = (r[1] - r[0]) // 2
+        return max(0, r[0] - m), min(n, r[1] + m)
+
+    # the factor is chosen for the visible range, the margin is only added to the tile
+    fx = _lod_factor(xrange[1] - xrange[0], vb.width())
+    fy = _lod_factor(yrange[1] - yrange[0], vb.height())
+    xrange, yrange = margin(xrange, data.shape[0]), margin(yrange, data.shape[1])
+    _show_lod_tile(self, graphicsView, xrange, yrange, factors=(fx, fy))
+
+
+def _lod_index(self, mousePoint):
+    """Converts a position in the displayed (possibly reduced) image to the 
+    index of the full resolution data."""
+    x0, _, y0, _, fx, fy = self.__dict__.get('_lod', {}).get('tile', None) or (0, 0, 0, 0, 1, 1)
+    return int(x0 + mousePoint.x() * fx), int(y0 + mousePoint.y() * fy)
+
+
 """ A few handy methods for label and scale """
 
 
@@ -0,0 +1,176 @@
+# Producer/consumer pipeline for measurement loops
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""
+The measurement loop (producer) acquires the data and hands storing and
+analysis (hdf writes, live fits) as jobs to a consumer thread. While the
+consumer writes the last trace, the loop already sets the next sweep point
+and starts the next sweep. The queue is bounded: if the consumer falls
+behind by more than 'maxsize' jobs, the loop waits for it.
+
+Jobs are executed in the order they were submitted, so everything that
+touches the data file after the start of the pipeline (appends, next_matrix,
+fits reading the file) has to be submitted as a job. An exception in a job
+drops the remaining jobs and is raised in the measurement loop with the
+next submit() or in close(). If close() is called while the loop is already
+unwinding from an exception, that exception is kept and the error of the
+job is only logged.
+
+With enabled=False, the jobs are executed right away in the calling thread.
+The time spent in each stage is recorded in both modes.
+
+usage:
+pipe = AcquisitionPipeline(enabled=True, maxsize=4)
+try:
+    for x in x_vec:
+        with pipe.timed('set_parameter'):
+            set_x(x)
+        with pipe.timed('sweep'):
+            data = vna.get_tracedata()
+        pipe.submit('store', ds.append, data)
+finally:
+    pipe.close()
+print(pipe.summary())
+"""
+
+import logging
+import sys
+import threading
+from contextlib import contextmanager
+from time import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+class AcquisitionPipeline(object):
+    def __init__(self, enabled=False, maxsize=4, name='measurement_pipeline'):
+        self.enabled = enabled
+        self.pipelined = enabled
+        self._stats = {}  # stage: [count, total time, max time]
+        self._lock = threading.Lock()
+        self._error = None
+        self._error_raised = False
+        self._start = time()
+        self._stop = None
+        self._thread = None
+        if enabled:
+            self._queue = queue.Queue(maxsize=max(1, int(maxsize)))
+            self._thread = threading.Thread(target=self._consume, name=name)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _record(self, stage, duration):
+        with self._lock:
+            stat = self._stats.setdefault(stage, [0, 0., 0.])
+            stat[0] += 1
+            stat[1] += duration
+            stat[2] = max(stat[2], duration)
+
+    @contextmanager
+    def timed(self, stage):
+        "records the time spent in the with block as stage"
+        start = time()
+        try:
+            yield
+        finally:
+            self._record(stage, time() - start)
+
+    def submit(self, stage, func, *args, **kwargs):
+        """
+        executes func(*args, **kwargs) on the consumer thread (or right away
+        if the pipeline is disabled) and records its time as stage.
+        """
+        self._raise_error()
+        if not self.enabled:
+            with self.timed(stage):
+                func(*args, **kwargs)
+            return
+        # waiting for a free slot means the consumer is the bottleneck
+        with self.timed('queue_wait'):
+            self._queue.put((stage, func, args, kwargs))
+
+    def _consume(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                stage, func, args, kwargs = job
+                if self._error is None:
+                    with self.timed(stage):
+                        func(*args, **kwargs)
+            except Exception as e:
+                logging.error("Measurement pipeline: %s failed, the following data is not stored: %s" % (stage, e))
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None and not self._error_raised:
+            self._error_raised = True
+            raise self._error
+
+    def close(self):
+        """
+        waits until all jobs are done and stops the consumer thread. An error
+        of a job is raised, unless close() is called (e.g. in a finally block)
+        while another exception is propagating, which would be replaced.
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        # later jobs are executed right away
+        self.enabled = False
+        if self._stop is None:
+            self._stop = time()
+        if sys.exc_info()[0] is not None:
+            if self._error is not None and not self._error_raised:
+                self._error_raised = True
+                logging.error("Measurement pipeline: the measurement stopped with %r, the failed job (%s) is not raised." % (sys.exc_info()[1], self._error))
+            return
+        self._raise_error()
+
+    def timings(self):
+        """
+        returns {stage: {'count', 'total', 'mean', 'max'}} (times in s) and
+        the wall time of the pipeline as 'wall'.
+        """
+        with self._lock:
+            stats = dict((stage, dict(count=c, total=t, mean=t / c if c else 0., max=m))
+                         for stage, (c, t, m) in self._stats.items())
+        stats['wall'] = (self._stop or time()) - self._start
+        return stats
+
+    def duty_cycle(self, stage='sweep'):
+        "fraction of the wall time spent in stage"
+        stats = self.timings()
+        if stage not in stats or not stats['wall']:
+            return 0.
+        return stats[stage]['total'] / stats['wall']
+
+    def summary(self, busy_stage='sweep'):
+        stats = self.timings()
+        lines = ["{:<16s} {:>7s} {:>10s} {:>10s} {:>10s}".format('stage', 'count', 'total/s', 'mean/ms', 'max/ms')]
+        for stage in sorted(s for s in stats if s != 'wall'):
+            st = stats[stage]
+            lines.append("{:<16s} {:>7d} {:>10.3f} {:>10.2f} {:>10.2f}".format(stage, st['count'], st['total'], 1e3 * st['mean'], 1e3 * st['max']))
+        lines.append("wall time {:.3f}s, {} duty cycle {:.1%}{}".format(stats['wall'], busy_stage, self.duty_cycle(busy_stage),
+                                                                      " (pipelined)" if self.pipelined else ""))
+        return "\n".join(lines)
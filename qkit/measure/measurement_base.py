@@ -25,6 +25,7 @@ import qkit
 import qkit.measure.write_additional_files as waf
 from qkit.gui.notebook.Progress_Bar import Progress_Bar
 from qkit.gui.plot import plot as qviewkit
+from qkit.measure.acquisition_pipeline import AcquisitionPipeline
 from qkit.measure.measurement_class import Measurement
 from qkit.storage import store as hdf
 
@@ -56,6 +57,16 @@ class MeasureBase(object):
         self.qviewkit_singleInstance = False
         self._qvk_process = False
         
+        # create 2D/3D datasets at their final size, the sweep vectors are known before the measurement
+        self.preallocate_datasets = qkit.cfg.get('hdf_preallocate', False)
+        # write the file in single-writer/multiple-reader mode once qviewkit is opened
+        self.swmr = qkit.cfg.get('hdf_swmr', False)
+        # store the data and fit on a consumer thread while the next point is measured
+        self.pipelined = qkit.cfg.get('measure_pipelined', False)
+        self.pipeline_queue_size = qkit.cfg.get('measure_pipeline_queue', 4)
+        self._pipeline = AcquisitionPipeline(enabled=False)
+        self.stage_timings = {}
+        
         self._measurement_object = Measurement()
         self._measurement_object.measurement_type = 'defaultMeasurement'
         self.web_visible = True
@@ -190,16 +201,20 @@ class MeasureBase(object):
                 raise TypeError('{:s}: Cannot set {!s} as unit for data {!s}: string needed'.format(__name__, self.unit, self.name))
             return True
     
-        def create_dataset(self, hdf_file):
+        def create_dataset(self, hdf_file, preallocate=False):
             if self.hdf_dataset is None or self.hdf_dataset.hf != hdf_file.hf: # If dataset not yet created or belongs to old hdf file
                 self.validate_parameters()
                 c = [co.create_dataset(hdf_file) for co in self.coordinates]
+                kwargs = dict(self.kwargs) # the extent belongs to this file only, the coordinates can change
+                if preallocate and self.dim > 1 and "extent" not in kwargs:
+                    # the last coordinate is the trace, the outer ones give the number of traces
+                    kwargs["extent"] = tuple(len(co.values) for co in self.coordinates[:-1])
                 if self.dim == 1:
-                    self.hdf_dataset = hdf_file.add_value_vector(self.name, x=c[0], unit = self.unit, **self.kwargs)
+                    self.hdf_dataset = hdf_file.add_value_vector(self.name, x=c[0], unit = self.unit, **kwargs)
                 elif self.dim == 2:
-                    self.hdf_dataset = hdf_file.add_value_matrix(self.name, x=c[0], y=c[1], unit = self.unit, **self.kwargs)
+                    self.hdf_dataset = hdf_file.add_value_matrix(self.name, x=c[0], y=c[1], unit = self.unit, **kwargs)
                 elif self.dim == 3:
-                    self.hdf_dataset = hdf_file.add_value_box(self.name, x=c[0], y=c[1], z=c[2], unit = self.unit, **self.kwargs)
+                    self.hdf_dataset = hdf_file.add_value_box(self.name, x=c[0], y=c[1], z=c[2], unit = self.unit, **kwargs)
             else:
                 logging.info(__name__ + ": Dataset for coordinate '{}' was already created.".format(self.name))
             return self.hdf_dataset
@@ -293,11 +308,11 @@ class MeasureBase(object):
                 raise TypeError('{:s}:  {!s} is no valid coordinate object'.format(__name__, c))
         self._create_file_name(data)
         
-        self._data_file = hdf.Data(name=self._file_name, mode='a')
+        self._data_file = hdf.Data(name=self._file_name, mode='a', swmr=self.swmr and self._swmr_possible())
         self._datasets = {}
         self._coordinates = {}
         for d in data:
-            self._datasets[d.name] = d.create_dataset(self._data_file)
+            self._datasets[d.name] = d.create_dataset(self._data_file, preallocate=self.preallocate_datasets)
             for c in d.coordinates:
                 self._coordinates[c.name] = c.create_dataset(self._data_file)  # it doesn't matter if you call create_dataset multiple times.
         for c in coords:
@@ -327,6 +342,13 @@ class MeasureBase(object):
         if self.comment:
             self._data_file.add_comment(self.comment)
     
+    def _swmr_possible(self):
+        """
+        returns False if this run adds datasets to the file during the measurement,
+        which is not possible in SWMR mode (see self.swmr). Overwritten by subclasses.
+        """
+        return True
+    
     def _open_qviewkit(self, datasets=None):
         """
         Closes the old qvk process if needed and creates a new one.
@@ -341,21 +363,48 @@ class MeasureBase(object):
         if datasets is None:
             datasets = list(self._datasets.keys())
         self._data_file.hf.hf.attrs['default_ds'] = datasets
+        if self.swmr:
+            # switches as soon as every dataset got its first data point, new objects are not allowed in SWMR mode
+            self._data_file.start_swmr()
         
         if self.open_qviewkit:
             self._qvk_process = qviewkit.plot(self._data_file.get_filepath(), datasets=datasets)
     
     def _acquire_log_functions(self):
-        for [ds, func] in self._log_datasets:
-            ds.append([func()])
+        values = [[func()] for [ds, func] in self._log_datasets]
+        self._pipeline.submit('store', self._append_log_values, values)
+    
+    def _append_log_values(self, values):
+        for [ds, func], value in zip(self._log_datasets, values):
+            ds.append(value)
+    
+    def _start_pipeline(self):
+        """
+        starts the pipeline for the measurement loop, see acquisition_pipeline.py.
+        Everything writing to the data file from here on goes through self._pipeline.submit().
+        """
+        self._pipeline = AcquisitionPipeline(enabled=self.pipelined, maxsize=self.pipeline_queue_size)
+    
+    def _stop_pipeline(self):
+        """
+        waits for the pending writes and stores the time per stage in self.stage_timings
+        """
+        try:
+            self._pipeline.close()
+        finally:
+            self.stage_timings = self._pipeline.timings()
+            logging.info("Measurement stage timings:\n" + self._pipeline.summary())
     
     def _end_measurement(self):
         """
         the data file is closed and filepath is printed
         """
-        print(self._data_file.get_filepath())
-        threading.Thread(target=qviewkit.save_plots, args=[self._data_file.get_filepath()]).start()
-        self._data_file.close_file()
-        waf.close_log_file(self._log)
-        self.measurement_name = None
-        qkit.flow.end()
+        try:
+            self._stop_pipeline()
+        finally:
+            print(self._data_file.get_filepath())
+            threading.Thread(target=qviewkit.save_plots, args=[self._data_file.get_filepath()]).start()
+            self._data_file.close_file()
+            waf.close_log_file(self._log)
+            self.measurement_name = None
+            qkit.flow.end()
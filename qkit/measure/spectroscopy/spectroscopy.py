@@ -30,9 +30,11 @@ if qkit.module_available("scipy"):
     from scipy.interpolate import interp1d, UnivariateSpline
 from qkit.storage import store as hdf
 from qkit.analysis.resonator import Resonator as resonator
+from qkit.drivers.AbstractVNA import get_vna_trace
 from qkit.gui.plot import plot as qviewkit
 from qkit.gui.notebook.Progress_Bar import Progress_Bar
 from qkit.measure.measurement_class import Measurement
+from qkit.measure.acquisition_pipeline import AcquisitionPipeline
 import qkit.measure.write_additional_files as waf
 
 
@@ -84,6 +86,13 @@ class spectrum(object):
 
         self.open_qviewkit = True
         self.qviewkit_singleInstance = False
+        # create the 2D/3D datasets at their final size (x_vec and y_vec are known up front)
+        self.preallocate_datasets = qkit.cfg.get('hdf_preallocate', False)
+        # store the data and fit on a consumer thread while the next point is measured (2D/3D)
+        self.pipelined = qkit.cfg.get('measure_pipelined', False)
+        self.pipeline_queue_size = qkit.cfg.get('measure_pipeline_queue', 4)
+        self._pipeline = AcquisitionPipeline(enabled=False)
+        self.stage_timings = {}
 
         self._measurement_object = Measurement()
         self._measurement_object.measurement_type = 'spectroscopy'
@@ -283,10 +292,11 @@ class spectrum(object):
         if self._scan_dim == 2:
             self._data_x = self._data_file.add_coordinate(self.x_coordname, unit=self.x_unit)
             self._data_x.add(self.x_vec)
+            extent = (len(self.x_vec),) if self.preallocate_datasets else None
             self._data_amp = self._data_file.add_value_matrix('amplitude', x=self._data_x, y=sweep_vector,
-                                                              unit='arb. unit', save_timestamp=True)
+                                                              unit='arb. unit', save_timestamp=True, extent=extent)
             self._data_pha = self._data_file.add_value_matrix('phase', x=self._data_x, y=sweep_vector, unit='rad',
-                                                              save_timestamp=True)
+                                                              save_timestamp=True, extent=extent)
 
             if self.log_function != None:  # use logging
                 self._log_value = []
@@ -316,11 +326,12 @@ class spectrum(object):
                 self._data_pha = self._data_file.add_value_matrix('phase', x=self._data_x, y=self._data_y, unit='rad',
                                                                   save_timestamp=False)
             else:
+                extent = (len(self.x_vec), len(self.y_vec)) if self.preallocate_datasets else None
                 self._data_amp = self._data_file.add_value_box('amplitude', x=self._data_x, y=self._data_y,
                                                                z=sweep_vector, unit='arb. unit',
-                                                               save_timestamp=False)
+                                                               save_timestamp=False, extent=extent)
                 self._data_pha = self._data_file.add_value_box('phase', x=self._data_x, y=self._data_y,
-                                                               z=sweep_vector, unit='rad', save_timestamp=False)
+                                                               z=sweep_vector, unit='rad', save_timestamp=False, extent=extent)
 
             if self.log_function != None:  # use logging
                 self._log_value = []
@@ -385,6 +396,7 @@ class spectrum(object):
             self._resonator = resonator(self._data_file.get_filepath())
 
         qkit.flow.start()
+        self._pipeline = AcquisitionPipeline(enabled=False)
         if rescan:
             if self.averaging_start_ready:
                 self.vna.start_measurement()
@@ -419,8 +431,10 @@ class spectrum(object):
                             qkit.flow.sleep(self.vna.get_sweeptime())  # wait single sweep time
                             if self.progress_bar: self._p.iterate()
 
-        data_amp, data_pha = self.vna.get_tracedata()
-        data_real, data_imag = self.vna.get_tracedata('RealImag')
+        with self._pipeline.timed('transfer'):
+            trace = get_vna_trace(self.vna)
+        data_amp, data_pha = trace.amp, trace.pha
+        data_real, data_imag = trace.real, trace.imag
 
         data_pha=self.edel_correction_data(data_pha)
 
@@ -429,7 +443,7 @@ class spectrum(object):
         self._data_real.append(data_real)
         self._data_imag.append(data_imag)
         if self._fit_resonator:
-            self._do_fit_resonator()
+            self._do_fit_resonator(data_amp, data_pha)
 
         qkit.flow.end()
         self._end_measurement()
@@ -568,21 +582,22 @@ class spectrum(object):
         the measurement loops feature the setting of the objects and saving the data in the .h5 file.
         '''
         qkit.flow.start()
+        # with self.pipelined, storing and fitting runs on a consumer thread while the VNA measures the next point
+        self._pipeline = AcquisitionPipeline(enabled=self.pipelined, maxsize=self.pipeline_queue_size)
         try:
             """
             loop: x_obj with parameters from x_vec
             """
             for ix, x in enumerate(self.x_vec):
-                self.x_set_obj(x)
+                with self._pipeline.timed('set_parameter'):
+                    self.x_set_obj(x)
                 sleep(self.tdx)
 
                 if self.log_function != None:
-                    for i, f in enumerate(self.log_function):
-                        self._log_value[i].append(float(f()))
+                    self._pipeline.submit('store', self._append_log_values, self._log_value, [float(f()) for f in self.log_function])
 
                 if self.log_function_2D != None:
-                    for i, f in enumerate(self.log_function_2D):
-                        self._log_value_2D[i].append(f())
+                    self._pipeline.submit('store', self._append_log_values, self._log_value_2D, [f() for f in self.log_function_2D])
 
                 if self._scan_dim == 3:
                     for y in self.y_vec:
@@ -592,76 +607,75 @@ class spectrum(object):
                             data_amp = np.full(int(self._nop), np.NaN, dtype=np.float16)
                             data_pha = np.full(int(self._nop), np.NaN, dtype=np.float16)  # fill with NaNs
                         else:
-                            self.y_set_obj(y)
+                            with self._pipeline.timed('set_parameter'):
+                                self.y_set_obj(y)
                             sleep(self.tdy)
-                            if self.averaging_start_ready:
-                                self.vna.start_measurement()
-                                # Check if the VNA is STILL in ready state, then add some delay.
-                                # If you manually decrease the poll_inveral, I guess you know what you are doing and will disable this safety query.
-                                if self.vna_poll_interval >= 0.1 and self.vna.ready():
-                                    logging.debug("VNA STILL ready... Adding delay")
-                                    qkit.flow.sleep(
-                                        .2)  # just to make sure, the ready command does not *still* show ready
-
-                                while not self.vna.ready():
-                                    qkit.flow.sleep(min(self.vna.get_sweeptime_averages(query=False) / 11., self.vna_poll_interval))
-                            else:
-                                self.vna.avg_clear()
-                                qkit.flow.sleep(self._sweeptime_averages)
+                            with self._pipeline.timed('sweep'):
+                                if self.averaging_start_ready:
+                                    self.vna.start_measurement()
+                                    # Check if the VNA is STILL in ready state, then add some delay.
+                                    # If you manually decrease the poll_inveral, I guess you know what you are doing and will disable this safety query.
+                                    if self.vna_poll_interval >= 0.1 and self.vna.ready():
+                                        logging.debug("VNA STILL ready... Adding delay")
+                                        qkit.flow.sleep(
+                                            .2)  # just to make sure, the ready command does not *still* show ready
+
+                                    while not self.vna.ready():
+                                        qkit.flow.sleep(min(self.vna.get_sweeptime_averages(query=False) / 11., self.vna_poll_interval))
+                                else:
+                                    self.vna.avg_clear()
+                                    qkit.flow.sleep(self._sweeptime_averages)
 
                             # if "avg_status" in self.vna.get_function_names():
                             #       while self.vna.avg_status() < self.vna.get_averages():
                             #            qkit.flow.sleep(.2) #maybe one would like to adjust this at a later point
 
                             """ measurement """
-                            if not self.landscape.xzlandscape_func:  # normal scan
-                                data_amp, data_pha = self.vna.get_tracedata()
-                            else:
-                                data_amp, data_pha = self.landscape.get_tracedata_xz(x)
+                            with self._pipeline.timed('transfer'):
+                                if not self.landscape.xzlandscape_func:  # normal scan
+                                    data_amp, data_pha = self.vna.get_tracedata()
+                                else:
+                                    data_amp, data_pha = self.landscape.get_tracedata_xz(x)
                             if self.progress_bar:
                                 self._p.iterate()
 
-                        if self._nop == 0:  # this does not work yet.
-                            print(data_amp[0], data_amp, self._nop)
-                            self._data_amp.append(data_amp[0])
-                            self._data_pha.append(data_pha[0])
-                        else:
-                            self._data_amp.append(data_amp)
-                            self._data_pha.append(data_pha)
+                        self._pipeline.submit('store', self._append_trace, data_amp, data_pha)
                         if self._fit_resonator:
-                            self._do_fit_resonator()
+                            self._do_fit_resonator(data_amp, data_pha)
                         qkit.flow.sleep()
                     """
                     filling of value-box is done here.
                     after every y-loop the data is stored the next 2d structure
                     """
-                    self._data_amp.next_matrix()
-                    self._data_pha.next_matrix()
+                    self._pipeline.submit('store', self._data_amp.next_matrix)
+                    self._pipeline.submit('store', self._data_pha.next_matrix)
 
                 if self._scan_dim == 2:
-                    if self.averaging_start_ready:
-                        self.vna.start_measurement()
-                        if self.vna.ready():
-                            logging.debug("VNA STILL ready... Adding delay")
-                            qkit.flow.sleep(.2)  # just to make sure, the ready command does not *still* show ready
-
-                        while not self.vna.ready():
-                            qkit.flow.sleep(min(self.vna.get_sweeptime_averages(query=False) / 11., .2))
-                    else:
-                        self.vna.avg_clear()
-                        qkit.flow.sleep(self._sweeptime_averages)
+                    with self._pipeline.timed('sweep'):
+                        if self.averaging_start_ready:
+                            self.vna.start_measurement()
+                            if self.vna.ready():
+                                logging.debug("VNA STILL ready... Adding delay")
+                                qkit.flow.sleep(.2)  # just to make sure, the ready command does not *still* show ready
+
+                            while not self.vna.ready():
+                                qkit.flow.sleep(min(self.vna.get_sweeptime_averages(query=False) / 11., .2))
+                        else:
+                            self.vna.avg_clear()
+                            qkit.flow.sleep(self._sweeptime_averages)
                     """ measurement """
-                    if not self.landscape.xzlandscape_func:  # normal scan
-                        data_amp, data_pha = self.vna.get_tracedata()
-                    else:
-                        data_amp, data_pha = self.landscape.get_tracedata_xz(x)
+                    with self._pipeline.timed('transfer'):
+                        if not self.landscape.xzlandscape_func:  # normal scan
+                            data_amp, data_pha = self.vna.get_tracedata()
+                        else:
+                            data_amp, data_pha = self.landscape.get_tracedata_xz(x)
 
-                    data_pha=self.edel_correction_data(data_pha)
-                    self._data_amp.append(data_amp)
-                    self._data_pha.append(data_pha)
+                    # corrected once here, the store and the fit get the same trace
+                    data_pha = self.edel_correction_data(data_pha)
+                    self._pipeline.submit('store', self._append_trace, data_amp, data_pha)
 
                     if self._fit_resonator:
-                        self._do_fit_resonator()
+                        self._do_fit_resonator(data_amp, data_pha)
                     if self.progress_bar:
                         self._p.iterate()
                     qkit.flow.sleep()
@@ -669,18 +683,41 @@ class spectrum(object):
             self._end_measurement()
             qkit.flow.end()
 
+    def _append_trace(self, data_amp, data_pha):
+        if self._nop == 0:  # this does not work yet.
+            print(data_amp[0], data_amp, self._nop)
+            self._data_amp.append(data_amp[0])
+            self._data_pha.append(data_pha[0])
+        else:
+            self._data_amp.append(data_amp)
+            self._data_pha.append(data_pha)
+
+    def _append_log_values(self, datasets, values):
+        for ds, value in zip(datasets, values):
+            ds.append(value)
+
     def _end_measurement(self):
         '''
         the data file is closed and filepath is printed
         '''
-        print(self._data_file.get_filepath())
-        # qviewkit.save_plots(self._data_file.get_filepath(),comment=self._plot_comment) #old version where we have to wait for the plots
-        t = threading.Thread(target=qviewkit.save_plots, args=[self._data_file.get_filepath(), self._plot_comment])
-        t.start()
-        self._data_file.close_file()
-        waf.close_log_file(self._log)
-        self.dirname = None
-        if self.averaging_start_ready: self.vna.post_measurement()
+        try:
+            # wait for the pending writes of the pipeline and the live fits
+            try:
+                self._pipeline.close()
+            finally:
+                if self._fit_resonator and getattr(self, '_resonator', None) is not None:
+                    self._resonator.wait()
+        finally:
+            self.stage_timings = self._pipeline.timings()
+            logging.info("Measurement stage timings:\n" + self._pipeline.summary())
+            print(self._data_file.get_filepath())
+            # qviewkit.save_plots(self._data_file.get_filepath(),comment=self._plot_comment) #old version where we have to wait for the plots
+            t = threading.Thread(target=qviewkit.save_plots, args=[self._data_file.get_filepath(), self._plot_comment])
+            t.start()
+            self._data_file.close_file()
+            waf.close_log_file(self._log)
+            self.dirname = None
+            if self.averaging_start_ready: self.vna.post_measurement()
 
     def set_resonator_fit(self, fit_resonator=True, fit_function='', f_min=None, f_max=None):
         '''
@@ -703,16 +740,25 @@ class spectrum(object):
             logging.error(
                 'Fit function not properly set. Must be either \'lorentzian\', \'skewed_lorentzian\', \'circle_fit_reflection\', \'circle_fit_notch\', \'fano\', or \'all_fits\'.')
         else:
+            self._fit_function_name = fit_function
             self._fit_resonator = True
             self._f_min = f_min
             self._f_max = f_max
 
-    def _do_fit_resonator(self):
+    def _do_fit_resonator(self, data_amp=None, data_pha=None):
         '''
         calls fit function in resonator class
         fit function is specified in self.set_fit, with boundaries f_mim and f_max
         only the last 'slice' of data is fitted, since we fit live while measuring.
+        With data_amp and data_pha (the trace just measured), the trace is fitted on the
+        worker of the resonator class without reading the file again. It is handed over
+        through the pipeline, after the trace is stored: the first fit reads the datasets
+        of the file.
         '''
+        if data_amp is not None and self._fit_function != 5:
+            self._pipeline.submit('fit', self._resonator.submit_trace, data_amp, data_pha, self._fit_function_name,
+                                  f_min=self._f_min, f_max=self._f_max)
+            return
 
         if self._fit_function == 0:  # lorentzian
             self._resonator.fit_lorentzian(f_min=self._f_min, f_max=self._f_max)
@@ -29,6 +29,7 @@ if qkit.module_available("scipy"):
     from scipy.optimize import curve_fit
     from scipy.interpolate import interp1d, UnivariateSpline
 from qkit.analysis.resonator import Resonator as resonator
+from qkit.drivers.AbstractVNA import get_vna_trace
 from qkit.gui.notebook.Progress_Bar import Progress_Bar
 from qkit.measure.measurement_base import MeasureBase
 
@@ -187,7 +188,10 @@ class spectrum(MeasureBase):
         
         self._open_qviewkit(datasets=[] if len(self._segments)>4 else None)
         
+        if self._fit_resonator:
+            self._resonator = resonator(self._data_file.get_filepath())
         qkit.flow.start()
+        self._start_pipeline()
         if rescan:
             self._pb = Progress_Bar(self.vna.get_averages(), self.measurement_name, self.vna.get_sweeptime(), dummy=not self.progress_bar)
             if self.averaging_start_ready:
@@ -217,12 +221,14 @@ class spectrum(MeasureBase):
                             qkit.flow.sleep(self.vna.get_sweeptime())  # wait single sweep time
                             self._pb.iterate()
         
-        data_amp, data_pha = self.vna.get_tracedata()
-        data_real, data_imag = self.vna.get_tracedata('RealImag')
+        with self._pipeline.timed('transfer'):
+            trace = get_vna_trace(self.vna)
+        data_amp, data_pha = trace.amp, trace.pha
+        data_real, data_imag = trace.real, trace.imag
         
         self._append(data_amp,data_pha,data_real,data_imag)
         if self._fit_resonator:
-            self._do_fit_resonator()
+            self._do_fit_resonator(data_amp, data_pha)
         self._end_measurement()
     
     def measure_2D(self):
@@ -348,20 +354,22 @@ class spectrum(MeasureBase):
                                 dummy=not self.progress_bar)
         
         qkit.flow.start()
+        self._start_pipeline()
         try:
             """
             loop: x_obj with parameters from x_vec
             """
 
             for i, x in enumerate(self._x_parameter.values):
-                self._x_parameter.set_function(x)
+                with self._pipeline.timed('set_parameter'):
+                    self._x_parameter.set_function(x)
                 qkit.flow.sleep(self._x_parameter.wait_time)
                 
                 self._acquire_log_functions()
                 
                 data_amp, data_pha = self._acquire_vna_data()
-                self._datasets['amplitude'].append(data_amp)
-                self._datasets['phase'].append(data_pha)
+                self._pipeline.submit('store', self._datasets['amplitude'].append, data_amp)
+                self._pipeline.submit('store', self._datasets['phase'].append, data_pha)
                 qkit.flow.sleep()
                 self._pb.iterate()
         finally:
@@ -369,22 +377,24 @@ class spectrum(MeasureBase):
             self._scan_time = False
     
     def _acquire_vna_data(self):
-        if self.averaging_start_ready:
-            self.vna.start_measurement()
-            if self._scan_time:
-                qkit.flow.sleep(self.vna.get_sweeptime(query=False))  # to prevent timeouts in time scan
-            elif self.vna.ready():
-                logging.debug("VNA STILL ready... Adding delay")
-                qkit.flow.sleep(.2)  # just to make sure, the ready command does not *still* show ready
-            
-            while not self.vna.ready():
-                qkit.flow.sleep(min(self.vna.get_sweeptime_averages(query=False) / 11., .2))
-        else:
-            self.vna.avg_clear()
-            qkit.flow.sleep(self._sweeptime_averages)
+        with self._pipeline.timed('sweep'):
+            if self.averaging_start_ready:
+                self.vna.start_measurement()
+                if self._scan_time:
+                    qkit.flow.sleep(self.vna.get_sweeptime(query=False))  # to prevent timeouts in time scan
+                elif self.vna.ready():
+                    logging.debug("VNA STILL ready... Adding delay")
+                    qkit.flow.sleep(.2)  # just to make sure, the ready command does not *still* show ready
+                
+                while not self.vna.ready():
+                    qkit.flow.sleep(min(self.vna.get_sweeptime_averages(query=False) / 11., .2))
+            else:
+                self.vna.avg_clear()
+                qkit.flow.sleep(self._sweeptime_averages)
         
         """ measurement """
-        return self.vna.get_tracedata()
+        with self._pipeline.timed('transfer'):
+            return self.vna.get_tracedata()
     
     def _append(self,amplitude,phase,real=None,imag=None):
         if self._segments:
@@ -407,12 +417,15 @@ class spectrum(MeasureBase):
         the measurement loops feature the setting of the objects and saving the data in the .h5 file.
         """
         qkit.flow.start()
+        # with self.pipelined, storing and fitting runs on a consumer thread while the VNA measures the next point
+        self._start_pipeline()
         try:
             """
             loop: x_obj with parameters from x_vec
             """
             for ix, x in enumerate(self._x_parameter.values):
-                self._x_parameter.set_function(x)
+                with self._pipeline.timed('set_parameter'):
+                    self._x_parameter.set_function(x)
                 qkit.flow.sleep(self._x_parameter.wait_time)
                 
                 self._acquire_log_functions()
@@ -425,34 +438,43 @@ class spectrum(MeasureBase):
                             data_amp = np.full(int(self._nop), np.NaN, dtype=np.float16)
                             data_pha = np.full(int(self._nop), np.NaN, dtype=np.float16)  # fill with NaNs
                         else:
-                            self._y_parameter.set_function(y)
+                            with self._pipeline.timed('set_parameter'):
+                                self._y_parameter.set_function(y)
                             qkit.flow.sleep(self._y_parameter.wait_time)
                             if not self.landscape.xzlandscape_func:  # normal scan
                                 data_amp, data_pha = self._acquire_vna_data()
                             else:
                                 data_amp, data_pha = self.landscape.get_tracedata_xz(x)
                             self._pb.iterate()
-                        self._append(data_amp,data_pha)
+                        self._pipeline.submit('store', self._append, data_amp, data_pha)
                         if self._fit_resonator:
-                            self._do_fit_resonator()
+                            self._do_fit_resonator(data_amp, data_pha)
                         qkit.flow.sleep()
                     """
                     filling of value-box is done here.
                     after every y-loop the data is stored the next 2d structure
                     """
-                    [d.next_matrix() for d in self._datasets.values()]
+                    self._pipeline.submit('store', lambda: [d.next_matrix() for d in self._datasets.values()])
     
                 if self._dim == 2:
                     data_amp, data_pha = self._acquire_vna_data()
-                    self._append(data_amp, data_pha)
+                    self._pipeline.submit('store', self._append, data_amp, data_pha)
                     
                     if self._fit_resonator:
-                        self._do_fit_resonator()
+                        self._do_fit_resonator(data_amp, data_pha)
                     self._pb.iterate()
                     qkit.flow.sleep()
         finally:
             self._end_measurement()
     
+    def _stop_pipeline(self):
+        try:
+            super(spectrum, self)._stop_pipeline()
+        finally:
+            # the pipeline hands over the last live fits, wait for them before the file is closed
+            if self._fit_resonator and getattr(self, '_resonator', None) is not None:
+                self._resonator.wait()
+
     def _end_measurement(self):
         super(spectrum, self)._end_measurement()
         if self.averaging_start_ready: self.vna.post_measurement()
@@ -470,23 +492,38 @@ class spectrum(MeasureBase):
         if not fit_resonator:
             self._fit_resonator = False
             return
-        self._functions = {'lorentzian': 0, 'skewed_lorentzian': 1, 'circle_fit_reflection': 2, 'circle_fit_notch': 3, 'fano': 5, 'all_fits': 5}
+        self._functions = {'lorentzian': 0, 'skewed_lorentzian': 1, 'circle_fit_reflection': 2, 'circle_fit_notch': 3, 'fano': 4, 'all_fits': 5}
         try:
             self._fit_function = self._functions[fit_function]
         except KeyError:
             logging.error(
                     'Fit function not properly set. Must be either \'lorentzian\', \'skewed_lorentzian\', \'circle_fit_reflection\', \'circle_fit_notch\', \'fano\', or \'all_fits\'.')
         else:
+            self._fit_function_name = fit_function
             self._fit_resonator = True
             self._f_min = f_min
             self._f_max = f_max
     
-    def _do_fit_resonator(self):
+    def _swmr_possible(self):
+        if self._fit_resonator and self.swmr:
+            logging.warning("The resonator fit adds datasets during the measurement, this file is not written in SWMR mode.")
+            return False
+        return True
+    
+    def _do_fit_resonator(self, data_amp=None, data_pha=None):
         """
         calls fit function in resonator class
         fit function is specified in self.set_fit, with boundaries f_mim and f_max
         only the last 'slice' of data is fitted, since we fit live while measuring.
-        """
+        With data_amp and data_pha (the trace just measured), the trace is fitted on the
+        worker of the resonator class without reading the file again. It is handed over
+        through the pipeline, after the trace is stored: the first fit reads the datasets
+        of the file.
+        """
+        if data_amp is not None and self._fit_function != 5:
+            self._pipeline.submit('fit', self._resonator.submit_trace, data_amp, data_pha, self._fit_function_name,
+                                  f_min=self._f_min, f_max=self._f_max)
+            return
         
         if self._fit_function == 0:  # lorentzian
             self._resonator.fit_lorentzian(f_min=self._f_min, f_max=self._f_max)
@@ -693,21 +693,29 @@ class VirtualAWG(object):
             ind += 1
         return sequences, readout_indices
 
-    def load(self, show_progress_bar=True, reset=True):
+    def load(self, show_progress_bar=True, reset=True, incremental=True, dry_run=False):
         """
         Load the sequences stored in the channels of the virtual AWG to your physical device (awg, fpga).
         Currently only enabled for the tabor awg.
+
+        Args:
+            incremental: only upload segments which changed since the last load (see load_tawg.load_tabor)
+            dry_run:     do not load anything, return a dict with the number of segments and bytes to be uploaded
         """
         # Case discrimination:
         if self._sample.awg.get_type() is "Tabor_WX1284C":
             sequences, readout_inds = self._sync()
-            load_tawg.load_tabor(
+            report = load_tawg.load_tabor(
                 sequences,
                 readout_inds,
                 self._sample,
                 reset=reset,
-                show_progress_bar=show_progress_bar
+                show_progress_bar=show_progress_bar,
+                incremental=incremental,
+                dry_run=dry_run
             )
+            if dry_run:
+                return report
         else:
             print("Unknown device type! Unable to load sequences.")
         return True
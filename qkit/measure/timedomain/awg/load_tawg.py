@@ -18,14 +18,28 @@
 # import qkit  # ToDO: flow comments?
 import numpy as np
 import logging
+import hashlib
 from qkit.gui.notebook.Progress_Bar import Progress_Bar
 import gc
 
 
-def _adjust_wfs_for_tabor(wf1, wf2, ro_index, chpair, segment, sample):
+# segments currently on the devices: {awg name: {'channels': number of channels,
+#                                               chpair: {content hash: segment number}}}
+_device_segments = {}
+
+
+def forget_device(awg):
+    """
+    Forgets which segments are on the awg, the next load_tabor uploads all segments again.
+    Call this if the awg was reset or programmed by someone else.
+    """
+    _device_segments.pop(awg.get_name(), None)
+
+
+def _prepare_wfs_for_tabor(wf1, wf2, ro_index, segment, sample):
     """
     This function simply adjust the waveforms, coming from the virtual awg, to fit the requirements of the
-    Tabor awg
+    Tabor awg. Returns wf1, wf2, marker1
     """
     divisor = 16
     readout_ind = int(ro_index[segment] + int(sample.clock * sample.readout_delay))
@@ -61,10 +75,54 @@ def _adjust_wfs_for_tabor(wf1, wf2, ro_index, chpair, segment, sample):
         wf1 = np.append(np.zeros(divisor - end_zeros), wf1)
         wf2 = np.append(np.zeros(divisor - end_zeros), wf2)
         marker1 = np.append(np.zeros(divisor - end_zeros), marker1)
+    return wf1, wf2, marker1
+
+
+def _adjust_wfs_for_tabor(wf1, wf2, ro_index, chpair, segment, sample):
+    """
+    Adjusts the waveforms for the Tabor awg and sends them to the given segment (+1).
+    """
+    wf1, wf2, marker1 = _prepare_wfs_for_tabor(wf1, wf2, ro_index, segment, sample)
     sample.awg.wfm_send2(wf1, wf2, marker1, marker1, chpair * 2 - 1, segment + 1)
 
 
-def load_tabor(channel_sequences, ro_index, sample, reset=True, show_progress_bar=True):
+def _pair_channels(channel_sequences, complex_channel):
+    """
+    Distributes the channels onto the channel pairs of the awg:
+    a complex channel occupies a whole pair (real part I, imaginary part Q),
+    two real channels share a pair, a single real channel leaves the second channel at 0.
+    Returns a list (one entry each channel pair) of lists of (wf1, wf2) for all sequences.
+    """
+    pairs = []
+    channels = list(zip(channel_sequences, complex_channel))
+    while channels:
+        sequences, is_complex = channels.pop(0)
+        if is_complex:
+            pairs.append([(seq.real, seq.imag) for seq in sequences])
+        elif channels and not channels[0][1]:
+            pairs.append(list(zip(sequences, channels.pop(0)[0])))
+        else:
+            pairs.append([(seq, [0]) for seq in sequences])
+    return pairs
+
+
+def _segment_hash(wf1, wf2, marker1):
+    h = hashlib.sha1()
+    for w in (wf1, wf2, marker1):
+        h.update(np.ascontiguousarray(w, dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+def _sequence_table(segments):
+    """the segment table needs at least 3 entries. So if it would be shorter, we just take it multiple times."""
+    if len(segments) == 1:
+        return segments * 3
+    if len(segments) == 2:
+        return segments * 2
+    return segments
+
+
+def load_tabor(channel_sequences, ro_index, sample, reset=True, show_progress_bar=True, incremental=True, dry_run=False):
     """
     This function takes the data, coming from virtual awg, and loads them into the awg
     :param channel_sequences: This must be a list of list, i.e., a list of channels each containing the sequences
@@ -73,10 +131,14 @@ def load_tabor(channel_sequences, ro_index, sample, reset=True, show_progress_ba
     :param sample: you should know this
     :param reset: simply sets the awg_channel active, probably not needed
     :param show_progress_bar: enables the progress bar
-    :return:
+    :param incremental: only upload segments which are not yet on the awg. Identical segments are uploaded once
+                        and used several times in the sequence table. If False, the awg is cleared and all
+                        segments are uploaded.
+    :param dry_run: do not touch the awg, only return what would be uploaded
+    :return: True if all channels are on, for dry_run a dict with the number of 'sequences', 'segments' (unique),
+             'uploads' and the 'bytes' to be sent
     """
     awg = sample.awg
-    awg.clear_waveforms()
     number_of_channels = 0
     complex_channel = []
     for chan in channel_sequences:
@@ -97,75 +159,73 @@ def load_tabor(channel_sequences, ro_index, sample, reset=True, show_progress_ba
             complex_channel[:2] = [True, False]
     #qkit.flow.start()
 
+    device = _device_segments.get(awg.get_name())
+    clear = not incremental or device is None or device['channels'] != number_of_channels
+    if clear:
+        device = {}
+    state = {'channels': number_of_channels}
+
+    # plan the upload: content hash of every segment, new segments get the numbers of segments no longer needed
+    report = dict(sequences=len(ro_index), segments=0, uploads=0, bytes=0)
+    uploads = []  # (chpair, segment number, overwrite, (wf1, wf2, marker1))
+    tables = {}
+    for chpair, pair in enumerate(_pair_channels(channel_sequences, complex_channel), 1):
+        on_device = device.get(chpair, {})
+        needed = {}
+        table = []
+        new = []
+        for j, (wf1, wf2) in enumerate(pair):
+            wfs = _prepare_wfs_for_tabor(wf1, wf2, ro_index, j, sample)
+            h = _segment_hash(*wfs)
+            if h not in needed:
+                needed[h] = on_device.get(h)
+                if needed[h] is None:
+                    new.append((h, wfs))
+            table.append(h)
+        used = set(needed.values())
+        free = sorted(set(on_device.values()) - used)
+        next_segment = max(list(on_device.values()) + [0]) + 1
+        segments = {h: seg for h, seg in on_device.items() if seg not in free[:len(new)]}
+        for i, (h, wfs) in enumerate(new):
+            if i < len(free):
+                seg = free[i]
+            else:
+                seg = next_segment
+                next_segment += 1
+            segments[h] = needed[h] = seg
+            uploads.append((chpair, seg, i < len(free), wfs))
+            report['bytes'] += 4 * max(len(wfs[0]), 192)  # 2 bytes per point and channel
+        state[chpair] = segments
+        tables[chpair] = [needed[h] for h in table]
+        report['segments'] += len(needed)
+    report['uploads'] = len(uploads)
+    if dry_run:
+        return report
+    logging.info("load_tabor: uploading %i of %i segments (%.1f MB) for %i sequences." %
+                 (report['uploads'], report['segments'], report['bytes'] / 1024. ** 2, report['sequences']))
+
+    if clear:
+        awg.clear_waveforms()
     if reset:
         _reset(awg, number_of_channels, ro_index)
-    else:
-        if number_of_channels <= 2:
-            awg.define_sequence(1, len(ro_index))
-        else:
-            awg.define_sequence(3, len(ro_index))
-    # Loading the waveforms into the AWG, differentiating between all cases
-    if show_progress_bar:
-        p = Progress_Bar(len(ro_index), 'Load AWG')
-
-    if number_of_channels == 1:
-        for j, seq in enumerate(channel_sequences[0]):
-            _adjust_wfs_for_tabor(seq, [0], ro_index, 1, j, sample)
+    # Loading the waveforms into the AWG
+    if show_progress_bar and uploads:
+        p = Progress_Bar(len(uploads), 'Load AWG')
+    try:
+        for chpair, seg, overwrite, (wf1, wf2, marker1) in uploads:
+            if overwrite:
+                # the old segment may have a different length
+                awg.delete_segment(seg, chpair * 2 - 1)
+            awg.wfm_send2(wf1, wf2, marker1, marker1, chpair * 2 - 1, seg)
             if show_progress_bar:
                 p.iterate()
-
-    elif number_of_channels == 2:
-        if complex_channel[0]:
-            for j, seq in enumerate(channel_sequences[0]):
-                _adjust_wfs_for_tabor(seq.real, seq.imag, ro_index, 1, j, sample)
-                if show_progress_bar:
-                    p.iterate()
-        else:
-            for j, seq in enumerate(zip(channel_sequences[0], channel_sequences[1])):
-                _adjust_wfs_for_tabor(seq[0], seq[1], ro_index, 1, j, sample)
-                if show_progress_bar:
-                    p.iterate()
-
-    elif number_of_channels == 3:
-        if complex_channel[0]:
-            for j, seq in enumerate(zip(channel_sequences[0], channel_sequences[1])):
-                _adjust_wfs_for_tabor(seq[0].real, seq[0].imag, ro_index, 1, j, sample)
-                _adjust_wfs_for_tabor(seq[1], [0], ro_index, 2, j, sample)
-                if show_progress_bar:
-                    p.iterate()
-        else:
-            for j, seq in enumerate(zip(channel_sequences[0], channel_sequences[1], channel_sequences[2])):
-                _adjust_wfs_for_tabor(seq[0], seq[1], ro_index, 1, j, sample)
-                _adjust_wfs_for_tabor(seq[2], [0], ro_index, 2, j, sample)
-                if show_progress_bar:
-                    p.iterate()
-
-    else:  # 4 channels
-        if complex_channel == [True, True]:
-            for j, seq in enumerate(zip(channel_sequences[0], channel_sequences[1])):
-                _adjust_wfs_for_tabor(seq[0].real, seq[0].imag, ro_index, 1, j, sample)
-                _adjust_wfs_for_tabor(seq[1].real, seq[1].imag, ro_index, 2, j, sample)
-                if show_progress_bar:
-                    p.iterate()
-        elif complex_channel == [True, False, False]:
-            for j, seq in enumerate(zip(channel_sequences[0], channel_sequences[1], channel_sequences[2])):
-                _adjust_wfs_for_tabor(seq[0].real, seq[0].imag, ro_index, 1, j, sample)
-                _adjust_wfs_for_tabor(seq[1], seq[2], ro_index, 2, j, sample)
-                if show_progress_bar:
-                    p.iterate()
-        elif complex_channel == [False, False, True]:
-            for j, seq in enumerate(zip(channel_sequences[0], channel_sequences[1], channel_sequences[2])):
-                _adjust_wfs_for_tabor(seq[0], seq[1], ro_index, 1, j, sample)
-                _adjust_wfs_for_tabor(seq[2].real, seq[2].imag, ro_index, 2, j, sample)
-                if show_progress_bar:
-                    p.iterate()
-        else:
-            for j, seq in enumerate(zip(channel_sequences[0], channel_sequences[1],
-                                        channel_sequences[2], channel_sequences[3])):
-                _adjust_wfs_for_tabor(seq[0], seq[1], ro_index, 1, j, sample)
-                _adjust_wfs_for_tabor(seq[2], seq[3], ro_index, 2, j, sample)
-                if show_progress_bar:
-                    p.iterate()
+    except Exception:
+        # the state of the device is unknown now
+        forget_device(awg)
+        raise
+    for chpair, table in tables.items():
+        awg.define_sequence(chpair * 2 - 1, _sequence_table(table))
+    _device_segments[awg.get_name()] = state
 
     gc.collect()
 
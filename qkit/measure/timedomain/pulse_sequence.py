@@ -1,9 +1,11 @@
 """Module to provide a high-level possibility to arange pulses for an experiment."""
 from enum import Enum
+from collections import OrderedDict
 import numpy as np
 import inspect
 from typing import Dict, Set, List, Union, Callable, Any, Tuple
 import logging
+import time as _time
 
 
 plot_enable = False
@@ -19,33 +21,61 @@ class Shape(np.vectorize):
     """
     A vectorized function describing a possible shape
     defined on the standardized interval [0,1).
+
+    By default, func is evaluated for every single sample (np.vectorize).
+    If func already works on numpy arrays, pass vectorized=True and func is
+    called once with the whole array of time fractions, e.g.
+        Shape("cos", lambda x: np.cos(np.pi * (x - 0.5)), vectorized=True)
+    Shapes can be combined with *, e.g. Shape(...) * ShapeLib.rect.
     """
 
     def __init__(
-        self, name: str, func: Callable[[float], float], *args: Any, **kwargs: Any
+        self,
+        name: str,
+        func: Callable[[float], float],
+        *args: Any,
+        vectorized: bool = False,
+        **kwargs: Any
     ):
         self.name = name
+        self.vectorized = vectorized
         super(Shape, self).__init__(func, *args, **kwargs)
 
+    def __call__(self, *args: Any, **kwargs: Any) -> np.ndarray:
+        if not self.vectorized:
+            return super(Shape, self).__call__(*args, **kwargs)
+        x = np.asarray(args[0], dtype=float)
+        values = np.asarray(self.pyfunc(x, *args[1:], **kwargs))
+        if values.shape != x.shape:
+            # e.g. constant shapes returning a scalar
+            values = np.broadcast_to(values, x.shape).copy()
+        return values
+
     def __mul__(self, other):
-        return Shape(self.name, lambda x: self.pyfunc(x) * other.pyfunc(x))
+        return Shape(self.name, lambda x: self(x) * other(x), vectorized=True)
 
 
 class ShapeLibClass(object):
     """
     Object containing pre-defined pulse shapes.
-    Currently implemented: rect, gauss
+    Currently implemented: zero, rect, gauss, ramp, sqrfct
     """
 
     def __init__(self):
-        self.zero = Shape("", lambda x: 0)
-        self.rect = Shape("rect", lambda x: np.where(x >= 0 and x < 1, 1, 0))
+        self.zero = Shape("", lambda x: np.zeros_like(x), vectorized=True)
+        self.rect = Shape(
+            "rect", lambda x: ((x >= 0) & (x < 1)).astype(float), vectorized=True
+        )
         self.gauss = (
-            Shape("gauss", lambda x: np.exp(-0.5 * np.power((x - 0.5) / 0.166, 2.0)))
+            Shape(
+                "gauss",
+                lambda x: np.exp(-0.5 * np.power((x - 0.5) / 0.166, 2.0)),
+                vectorized=True,
+            )
             * self.rect
         )
-        self.ramp = Shape("ramp", lambda x: x) * self.rect
-        self.sqrfct = Shape("sqrfct", lambda x: x ** 2) * self.rect
+        self.ramp = Shape("ramp", lambda x: x, vectorized=True) * self.rect
+        self.sqrfct = Shape("sqrfct", lambda x: x ** 2, vectorized=True) * self.rect
 
 
 # Make ShapeLib a singleton:
@@ -265,6 +295,90 @@ class Pulse(object):
         return self.length.is_parametrized or self.amplitude.is_parametrized
 
 
+class WaveformCache(object):
+    """
+    LRU cache for the waveforms of single pulses.
+
+    Most pulses of a sweep (pi pulses, readout, fixed waits) are the same for
+    every point, so their waveforms are only calculated once. The waveforms are
+    keyed on everything they depend on (shape, length, amplitude, IQ parameters,
+    samplerate and start phase), i.e. changing a pulse parameter automatically
+    leads to a new waveform. The least recently used waveforms are dropped if
+    the cache holds more than max_bytes.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self._waveforms: "OrderedDict[Tuple, np.ndarray]" = OrderedDict()
+        self._nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(
+        self,
+        pulse: "Pulse",
+        samplerate: float,
+        heterodyne: bool = False,
+        start_phase: float = 0,
+        **variables: Any
+    ) -> np.ndarray:
+        """
+        Returns pulse(samplerate, heterodyne, start_phase, **variables) from the cache,
+        if possible. The returned array is read-only.
+        """
+        length = pulse.length(**variables)
+        amplitude = pulse.amplitude(**variables)
+        modulated = bool(heterodyne) and pulse.iq_frequency != 0
+        key: Tuple = (pulse.shape, length, amplitude, samplerate, modulated)
+        if modulated:
+            # homodyne envelopes do not depend on the IQ parameters
+            key += (
+                pulse.phase,
+                pulse.iq_frequency,
+                pulse.iq_dc_offset,
+                pulse.iq_angle,
+                pulse.q_rel,
+                start_phase,
+            )
+        try:
+            wfm = self._waveforms.pop(key)
+            self.hits += 1
+        except KeyError:
+            wfm = np.asarray(
+                pulse(
+                    samplerate,
+                    heterodyne=heterodyne,
+                    start_phase=start_phase,
+                    **variables
+                )
+            )
+            wfm.flags.writeable = False
+            self.misses += 1
+            self._nbytes += wfm.nbytes
+            while self._waveforms and self._nbytes > self.max_bytes:
+                self._nbytes -= self._waveforms.popitem(last=False)[1].nbytes
+        self._waveforms[key] = wfm
+        return wfm
+
+    def clear(self):
+        self._waveforms.clear()
+        self._nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the cached waveforms."""
+        return self._nbytes
+
+    def __len__(self) -> int:
+        return len(self._waveforms)
+
+
+# Waveform cache shared by all sequences:
+waveform_cache = WaveformCache()
+
+
 class PulseSequence(object):
     """
     Class for aranging pulses for a time-domain experiment.
@@ -278,6 +392,8 @@ class PulseSequence(object):
         add_readout: adds the readout to the experiment
         plot:        plots schematic of the sequence
         get_pulses:  returns list of currently added pulses and their properties.
+        cache:       WaveformCache for the waveforms of the pulses (default: the shared
+                     pulse_sequence.waveform_cache), None to calculate all waveforms again.
     """
 
     def __init__(
@@ -298,6 +414,7 @@ class PulseSequence(object):
         self._variables: Set[str] = set()
         self._sample = sample
         self.dc_corr: float = dc_corr
+        self.cache: Union[WaveformCache, None] = waveform_cache
         try:
             self.samplerate = self._sample.clock
         except AttributeError:
@@ -362,14 +479,13 @@ class PulseSequence(object):
             logging.error("Sequence call requires samplerate.")
             return None
 
-        # build the waveform of this sequence
-        full_waveform = np.zeros(0, dtype=np.complex128)
+        # collect the waveforms of all pulses and their positions in the sequence
+        placed_waveforms: List[Tuple[int, np.ndarray]] = []
+        waveform_length = 0
         timestep = 1.0 / samplerate  # minimum time step
         readout_index = 0  # index of the readout in the waveform of the whole sequence
         position_of_next_slice = 0  # index where the next time slice will start
         for time_slice in self._sequence:
-            # holds all waveforms that start at the same time (within the same slice)
-            wfm_slice = np.zeros(0, dtype=np.complex128)
             # tracks the length of the last waveform in the slice as the next slice will start after that
             last_wfm_length = 0
             for pulse in time_slice:
@@ -379,57 +495,48 @@ class PulseSequence(object):
                 startphase = (
                     2.0 * np.pi * pulse.iq_frequency * position_of_next_slice * timestep
                 )  # zero for homodyne mixing
-                wfm = pulse(
-                    samplerate,
-                    start_phase=startphase,
-                    heterodyne=IQ_mixing,
-                    **variables
-                )
-
-                # if (pulse_dict["pulse"].type == PulseType.Readout) and (i == len(self._sequence) - 1):
-                #     # if readout is last, omit the wfm (apart from a single digit)
-                #     length = timestep
+                if self.cache is not None:
+                    wfm = self.cache(
+                        pulse,
+                        samplerate,
+                        start_phase=startphase,
+                        heterodyne=IQ_mixing,
+                        **variables
+                    )
+                else:
+                    wfm = pulse(
+                        samplerate,
+                        start_phase=startphase,
+                        heterodyne=IQ_mixing,
+                        **variables
+                    )
 
                 # Store index if this pulse is a readout pulse (will have the last one at the end)
+                # Readout pulses are not taken into account in the waveform, unless include_readout is True
                 if pulse.type == PulseType.Readout:
                     readout_index = position_of_next_slice
-                    if not include_readout:
-                        # Readout pulses are not taken into account here
-                        wfm[:] = 0
+                    if include_readout:
+                        placed_waveforms.append((position_of_next_slice, wfm))
+                else:
+                    placed_waveforms.append((position_of_next_slice, wfm))
 
                 # Store the size of the last waveform in a slice
                 # This waveform has skip=False and thus the next slice will start when this pulse is finished
                 # even if other pulses of the current slice are longer
                 last_wfm_length = len(wfm)
-
-                # Enlarge waveforms to be the same size
-                if len(wfm_slice) < len(wfm):
-                    wfm_slice.resize(len(wfm))
-                else:
-                    wfm.resize(len(wfm_slice))
-                # Add pulse to waveform of current time slice
-                wfm_slice += wfm
-
-            # Resize waveform to be capable of holding current wfm_slice
-            new_waveform_length: float = max(
-                len(full_waveform), position_of_next_slice + len(wfm_slice)
-            )
-            full_waveform.resize(new_waveform_length)
-            # Add current time slice to global waveform
-            full_waveform[
-                position_of_next_slice : (position_of_next_slice + len(wfm_slice))
-            ] += wfm_slice
+                waveform_length = max(waveform_length, position_of_next_slice + len(wfm))
 
             # Update position for next slice (the last waveform has no skip and thus decides the time)
             position_of_next_slice += last_wfm_length
 
-        full_waveform += self.dc_corr
-
-        # make sure first and last point of the waveform go to 0
-        full_waveform = np.append(0, full_waveform)
-        full_waveform = np.append(full_waveform, 0)
+        # build the waveform of this sequence in one buffer,
+        # the first and last point of the waveform stay 0
+        full_waveform = np.zeros(waveform_length + 2, dtype=np.complex128)
+        for position, wfm in placed_waveforms:
+            full_waveform[1 + position : 1 + position + len(wfm)] += wfm
+        full_waveform[1:-1] += self.dc_corr
 
-        if not any(np.iscomplex(full_waveform)):
+        if not np.iscomplex(full_waveform).any():
             # No complex information in there, so just return the real part
             full_waveform = np.real(full_waveform)
 
@@ -666,3 +773,41 @@ class PulseSequence(object):
         ax.spines["right"].set_visible(False)
         ax.spines["top"].set_visible(False)
         return
+
+
+def benchmark_shapes(samples: int = 100000, repeat: int = 10) -> Dict[str, Tuple[float, float]]:
+    """
+    Compares the evaluation time of the shapes in ShapeLib with the former
+    per-sample implementation (np.vectorize of scalar functions).
+
+    Args:
+        samples: number of time fractions per evaluation (e.g. 100 us at 1 GS/s)
+        repeat:  number of evaluations
+
+    Returns:
+        dict {shape name: (per-sample time, vectorized time)} in seconds per evaluation
+    """
+    scalar_rect = Shape("rect", lambda x: np.where(x >= 0 and x < 1, 1, 0))
+
+    def scalar_product(name: str, func: Callable[[float], float]) -> Shape:
+        return Shape(name, lambda x: func(x) * scalar_rect.pyfunc(x))
+
+    legacy = {
+        "rect": scalar_rect,
+        "gauss": scalar_product(
+            "gauss", lambda x: np.exp(-0.5 * np.power((x - 0.5) / 0.166, 2.0))
+        ),
+        "ramp": scalar_product("ramp", lambda x: x),
+        "sqrfct": scalar_product("sqrfct", lambda x: x ** 2),
+    }
+    x = np.arange(samples) / float(samples)
+    results: Dict[str, Tuple[float, float]] = {}
+    for name, legacy_shape in legacy.items():
+        timings = []
+        for shape in (legacy_shape, getattr(ShapeLib, name)):
+            t0 = _time.time()
+            for _ in range(repeat):
+                shape(x)
+            timings.append((_time.time() - t0) / repeat)
+        results[name] = (timings[0], timings[1])
+    return results
@@ -113,6 +113,8 @@ class transport(object):
         self._numder_args = ()  # arguments for derivation function
         self._numder_kwargs = {'window_length': 15, 'polyorder': 3, 'deriv': 1}  # keyword arguments for derivation function
         self._average = None  # trace averaging
+        self._average_write_every = 1  # iterations between two write-backs of the averaged traces
+        self._average_error = False  # adds the standard error of the averaged traces as data series
         self._view_xy = False
         # x and y data
         self._hdf_x = None
@@ -924,20 +926,33 @@ class transport(object):
         self._comment = None
         return
     
-    def set_average(self, avg):
+    def set_average(self, avg, write_every=1, error=False):
         """
         Sets trace average parameter.
+        The traces are averaged in running sums, so the averaging time per iteration and the memory do not grow with the number of iterations.
         
         Parameters
         ----------
         avg: int
             Number of averages of whole traces. Must be None (off) or natural numbers.
+        write_every: int, optional
+            Number of iterations between two write-backs of the averaged traces to the data file. The final average is always written. Default is 1.
+        error: bool, optional
+            Adds the standard error of the mean of I and V (I_<i>_error, V_<i>_error) as data series in analysis. Default is False.
         
         Returns
         -------
         None
+        
+        Examples
+        --------
+        >>> tr.set_average(1000, write_every=50, error=True)
         """
+        if write_every < 1:
+            raise ValueError('{:s}: Cannot set {!s} as write_every: natural number needed'.format(__name__, write_every))
         self._average = avg
+        self._average_write_every = int(write_every)
+        self._average_error = bool(error)
         return
     
     def get_average(self):
@@ -1129,8 +1144,6 @@ class transport(object):
                         self._pb.iterate()
                     time.sleep(self._x_dt)
             elif self._scan_dim in [1, 2, 3]:  # IV curve
-                _rst_log_hdf_appnd = False  # variable to save points of log-function in 2D-matrix
-                self._rst_fit_hdf_appnd = False
                 for self.ix, (x, x_func) in enumerate([(None, _pass)] if self._scan_dim < 2 else [(x, self._x_set_obj) for x in self._x_vec]):  # loop: x_obj with parameters from x_vec if 2D or 3D else pass(None)
                     x_func(x)
                     time.sleep(self._x_dt)
@@ -1145,11 +1158,10 @@ class transport(object):
                                     self._hdf_log[j].append(self._data_log[j])
                                 elif self._scan_dim == 2:
                                     self._data_log[j][self.ix] = float(f())
-                                    self._hdf_log[j].append(self._data_log[j], reset=True)
+                                    self._hdf_log[j].write_point(self.ix, self._data_log[j][self.ix], shape=self._data_log[j].shape)
                                 elif self._scan_dim == 3:
                                     self._data_log[j][self.ix, self.iy] = float(f())
-                                    self._hdf_log[j].append(self._data_log[j][self.ix], reset=_rst_log_hdf_appnd)
-                                    _rst_log_hdf_appnd = not bool(self.iy+1 == len(self._y_vec))
+                                    self._hdf_log[j].write_point((self.ix, self.iy), self._data_log[j][self.ix, self.iy], shape=self._data_log[j].shape)
                         # iterate sweeps and take data
                         self._get_sweepdata()
                     # filling of value-box by storing data in the next 2d structure after every y-loop
@@ -1157,6 +1169,8 @@ class transport(object):
                         for lst in [val for k, val in enumerate([self._hdf_I, self._hdf_V, self._hdf_dVdI]) if k < 2+int(self._dVdI)]:
                             for val in range(self.sweeps.get_nos()):
                                 lst[val].next_matrix()
+                        for ds in self._hdf_I_err + self._hdf_V_err:
+                            ds.next_matrix()
         finally:
             ''' end measurement '''
             qkit.flow.end()
@@ -1244,6 +1258,8 @@ class transport(object):
         self._hdf_dVdI = []
         self._hdf_fit = []
         self._data_fit = []
+        self._hdf_I_err = []
+        self._hdf_V_err = []
         if self._scan_dim == 0:
             ''' xy '''
             # add data variables
@@ -1389,6 +1405,9 @@ class transport(object):
             self._add_log_value_vector()
             # add views
             self._add_views()
+        # standard error of averaged traces
+        if self._scan_dim > 0 and self._average is not None and self._average_error:
+            self._add_average_error_datasets()
         ''' add comment '''
         if self._comment:
             self._data_file.add_comment(self._comment)
@@ -1526,6 +1545,32 @@ class transport(object):
                     self._data_log.append(np.ones((len(self._x_vec), len(self._y_vec)))*np.nan)
         return
     
+    def _add_average_error_datasets(self):
+        """
+        Adds data series for the standard error of the mean of the averaged I and V traces, in the shape of the I and V data series.
+        
+        Parameters
+        ----------
+        None
+        
+        Returns
+        -------
+        None
+        """
+        add_value = {1: self._data_file.add_value_vector,
+                     2: self._data_file.add_value_matrix,
+                     3: self._data_file.add_value_box}[self._scan_dim]
+        coordinates = {1: (), 2: (self._hdf_x,), 3: (self._hdf_x, self._hdf_y)}[self._scan_dim]
+        for i in range(self.sweeps.get_nos()):
+            for name, unit, lst in (('I', 'A', self._hdf_I_err), ('V', 'V', self._hdf_V_err)):
+                lst.append(add_value('{:s}_{:d}_error'.format(name, i),
+                                     *(coordinates + (self._hdf_bias[i],)),
+                                     unit=unit,
+                                     save_timestamp=False,
+                                     folder='analysis',
+                                     comment='standard error of the mean of {:s}_{:d}'.format(name, i)))
+        return
+    
     def _add_views(self):
         """
         Adds views to the .h5-file. The view "IV" plots I(V) and contains the whole set of sweeps that are set.
@@ -1610,14 +1655,13 @@ class transport(object):
                                                                           data[self._hdf_V[j]][0],
                                                                           data[self._hdf_dVdI[j]][0],
                                                                           **self._fit_kwargs))
-                        data[self._hdf_fit[j]] = (self._data_fit[j], True)
+                        self._hdf_fit[j].write_point(self.ix, self._data_fit[j][self.ix], shape=self._data_fit[j].shape)
                     elif self._scan_dim == 3:
                         self._data_fit[j][self.ix, self.iy] = float(self._fit_func(data[self._hdf_I[j]][0],
                                                                                    data[self._hdf_V[j]][0],
                                                                                    data[self._hdf_dVdI[j]][0],
                                                                                    **self._fit_kwargs))
-                        data[self._hdf_fit[j]] = (self._data_fit[j][self.ix], self._rst_fit_hdf_appnd)
-                        self._rst_fit_hdf_appnd = not bool(self.iy + 1 == len(self._y_vec))
+                        self._hdf_fit[j].write_point((self.ix, self.iy), self._data_fit[j][self.ix, self.iy], shape=self._data_fit[j].shape)
                 # save data
                 for key, val in data.items():
                     key.append(*val)
@@ -1626,44 +1670,57 @@ class transport(object):
                     self._pb.iterate(addend=self._pb_addend[self.ix] if self._landscape else 1)
                 qkit.flow.sleep()
         else:
-            I_values, V_values = [], []
+            averages = [(self.running_average(), self.running_average()) for j in range(self.sweeps.get_nos())]  # (I, V) of every sweep
+            written = False
             for i in range(self._average):
-                I_values.append([])
-                V_values.append([])
                 self.sweeps.create_iterator()
                 for j in range(self.sweeps.get_nos()):
                     # take data
                     if (self._IVD.get_sweep_mode()%2 == 0): #volt bias
-                        for val, lst in zip(self.take_IV(sweep=self.sweeps.get_sweep()), [V_values, I_values]):
-                            lst[i].append(list(val))  # append as list in order to later use zip
+                        V_values, I_values = self.take_IV(sweep=self.sweeps.get_sweep())
                     elif(self._IVD.get_sweep_mode()%2 == 1): #curr bias
-                        for val, lst in zip(self.take_IV(sweep=self.sweeps.get_sweep()), [I_values, V_values]):
-                            lst[i].append(list(val))  # append as list in order to later use zip
+                        I_values, V_values = self.take_IV(sweep=self.sweeps.get_sweep())
                     else:
                         raise Exception("Wrong sweep mode defined in SMU.")
-
-                    I_values_avg, V_values_avg = np.mean(list(zip(*I_values))[j], axis=0), np.mean(list(zip(*V_values))[j], axis=0)  # use zip since np.mean cannot handle different shapes
+                    averages[j][0].add(I_values)
+                    averages[j][1].add(V_values)
+                    # iterate progress bar
+                    if self.progress_bar:
+                        self._pb.iterate(addend=self._pb_addend[self.ix] if self._landscape else 1)
+                if (i+1) % self._average_write_every and i+1 < self._average:
+                    continue
+                for j, (I_avg, V_avg) in enumerate(averages):
+                    I_values_avg, V_values_avg = I_avg.get_mean(), V_avg.get_mean()
                     data = {self._hdf_I[j]:I_values_avg,
                             self._hdf_V[j]:V_values_avg}
                     if self._dVdI:
                         data[self._hdf_dVdI[j]] = self._numerical_derivative(I_values_avg, V_values_avg)
-                    if self._fit_func:
-                        data[self._hdf_fit[j]] = self._fit_func(data[self._hdf_I[j]],
-                                                                data[self._hdf_V[j]],
-                                                                data[self._hdf_dVdI[j]],
-                                                                **self._fit_kwargs)
+                    if self._average_error:
+                        data[self._hdf_I_err[j]] = I_avg.get_error()
+                        data[self._hdf_V_err[j]] = V_avg.get_error()
                     # save data
                     for key, val in data.items():
-                        key.append(val, reset=bool(i))  # append data series or overwrite last iteration by new averaged data
+                        key.append(val, reset=written)  # append data series or overwrite last iteration by new averaged data
                         key.ds.attrs['average'] = '({:d}/{:d})'.format(i+1, self._average)  # add (iteration/average) as attribute
-                        self._data_file.flush()
-                    # iterate progress bar
-                    if self.progress_bar:
-                        self._pb.iterate(addend=self._pb_addend[self.ix] if self._landscape else 1)
+                    if self._fit_func:
+                        fit = float(self._fit_func(data[self._hdf_I[j]],
+                                                   data[self._hdf_V[j]],
+                                                   data[self._hdf_dVdI[j]],
+                                                   **self._fit_kwargs))
+                        if self._scan_dim == 1:
+                            self._data_fit[j] = fit
+                            self._hdf_fit[j].write_point(0, fit)
+                        else:
+                            index = self.ix if self._scan_dim == 2 else (self.ix, self.iy)
+                            self._data_fit[j][index] = fit
+                            self._hdf_fit[j].write_point(index, fit, shape=self._data_fit[j].shape)
+                written = True
+                self._data_file.flush()
             # set average attribute to number of averages
             for j in range(self.sweeps.get_nos()):
-                for lst in [val for k, val in enumerate([self._hdf_I, self._hdf_V, self._hdf_dVdI]) if k < 2+int(self._dVdI)]:
-                    lst[j].ds.attrs['average'] = self._average
+                for lst in [val for k, val in enumerate([self._hdf_I, self._hdf_V, self._hdf_dVdI]) if k < 2+int(self._dVdI)] + [self._hdf_I_err, self._hdf_V_err]:
+                    if lst:
+                        lst[j].ds.attrs['average'] = self._average
             self._data_file.flush()
             qkit.flow.sleep()
         return
@@ -1723,6 +1780,53 @@ class transport(object):
         self._plot_comment = comment
         return
     
+    class running_average(object):
+        """
+        This is a subclass of <transport> that averages traces element-wise in running sums.
+        Mean and variance are updated with Welford's algorithm, so neither the memory nor the time per added trace grows with the number of traces.
+        NaN entries (e.g. bias values skipped by a landscape) are not counted.
+        """
+        def __init__(self):
+            self.n = None
+            self.mean = None
+            self._m2 = None
+        
+        def add(self, trace):
+            """
+            Adds a trace to the average.
+            
+            Parameters
+            ----------
+            trace: array_likes of floats
+                Trace of the same length as all traces before.
+            
+            Returns
+            -------
+            None
+            """
+            trace = np.asarray(trace, dtype=float)
+            if self.n is None:
+                self.n, self.mean, self._m2 = np.zeros(trace.shape), np.zeros(trace.shape), np.zeros(trace.shape)
+            mask = ~np.isnan(trace)
+            self.n[mask] += 1
+            delta = np.where(mask, trace - self.mean, 0)
+            self.mean += np.where(mask, delta / np.maximum(self.n, 1), 0)
+            self._m2 += np.where(mask, delta * (trace - self.mean), 0)
+            return
+        
+        def get_mean(self):
+            """
+            Returns the mean of all added traces, NaN where no value was added.
+            """
+            return np.where(self.n > 0, self.mean, np.nan)
+        
+        def get_error(self):
+            """
+            Returns the standard error of the mean of all added traces, NaN where less than two values were added.
+            """
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return np.where(self.n > 1, np.sqrt(self._m2 / (self.n - 1) / self.n), np.nan)
+    
     class sweep(object):
         """
         This is a subclass of <transport> that provides the customized usage of many sweeps in one measurement.
@@ -32,8 +32,11 @@ def get_instrument_settings(path):
     for ins_name in qkit.instruments.get_instruments():
         ins = qkit.instruments.get(ins_name)
         param_dict = {}
-        for (param, popts) in _dict_to_ordered_tuples(ins.get_parameters()):
-            param_dict.update({param:ins.get(param, query=False, channels=popts)})
+        # one batch get per instrument, uncached values are read in one go if the driver supports it
+        params = _dict_to_ordered_tuples(ins.get_parameters())
+        values = ins.get([param for param, popts in params], query=False)
+        for (param, popts) in params:
+            param_dict.update({param:values.get(param)})
             try:
                 if popts.get('offset',False):
                     param_dict.update({param+"_offset": ins._offsets[param]})
@@ -24,6 +24,20 @@ class hdf_dataset(object):
     of the datasets and derive all the unknown values from the real data.
     The working horse here is the 'append()' or the 'add()' function. Before, 
     just an empty dataset is created and the metadata are set.
+    
+    Optionally, appended data can be buffered in memory and written to the
+    file in blocks (write-behind). The policy is taken from the hdf file 
+    (see H5_file.set_write_buffer) or given per dataset with the 'buffer'
+    keyword: False disables buffering, a dict with the keys 'rows', 'nbytes'
+    and 'interval' sets an own policy.
+    
+    If the number of traces is known before the measurement starts, it can 
+    be passed as 'extent', e.g. extent=(len(x_vec),) for a matrix or 
+    extent=(len(x_vec), len(y_vec)) for a box. The dataset is then created
+    at its final size and the traces are written in place.
+    
+    Chunk shape and compression follow the storage policy of the file, or 
+    the 'storage' keyword (a StoragePolicy or a dict of its arguments).
     """
     
     def __init__(self, hdf_file, name='', 
@@ -46,9 +60,15 @@ class hdf_dataset(object):
         self.z_object = z
         self.dim = meta.get('dim', None)
         self.dtype = meta.get('dtype','f')
+        self.extent = meta.get('extent', None)
+        self.storage = meta.get('storage', None)
         self.ds_type = ds_type
         self._next_matrix = False
         self._save_timestamp = save_timestamp
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._buffer_since = None
+        self.buffer_policy = None
         
         ## only one information: either 'name' (for creation) or 'ds_url' (for readout)
         if (name and ds_url) or (not name and not ds_url) :
@@ -56,6 +76,14 @@ class hdf_dataset(object):
             raise NameError
         if name:
             self._new_ds_defaults(name, unit, folder, comment)
+            self.hf.dataset_pending(self)
+            buffer_policy = meta.get('buffer', None)
+            if buffer_policy is None:
+                buffer_policy = self.hf.buffer_policy
+            if buffer_policy and ds_type != ds_types['txt']:
+                self.buffer_policy = dict(rows=None, nbytes=None, interval=None)
+                self.buffer_policy.update(buffer_policy)
+                self.hf.register_buffered(self)
         elif ds_url:
             self._read_ds_from_hdf(ds_url)
 
@@ -131,18 +159,153 @@ class hdf_dataset(object):
                                              folder=self.folder,
                                              dim = self.dim,
                                              ds_type = self.ds_type,
-                                             dtype = self.dtype)
+                                             dtype = self.dtype,
+                                             extent = self.extent,
+                                             storage = self.storage)
             self._setup_metadata()
             if self._save_timestamp:
                 self._create_timestamp_ds()
+            self.hf.dataset_created(self)
+
+        if self.buffer_policy and not reset:
+            self._buffer.append((data, numpy.array([time.time()]), self._next_matrix, pointwise))
+            self._next_matrix = False
+            self._buffer_bytes += data.nbytes
+            if self._buffer_since is None:
+                self._buffer_since = time.time()
+            # commits this and the other buffered datasets of the file, if due
+            if self.hf.commit_due_buffers():
+                self.hf.flush()
+            return
+        # pending rows have to be in the file before they can be overwritten
+        self.commit(flush=False)
 
-        self.hf.append(self.ds, data, next_matrix=self._next_matrix, reset=reset, pointwise=pointwise)
+        self.hf.append(self.ds, data, next_matrix=self._next_matrix, reset=reset, pointwise=pointwise, flush=False)
         if self._save_timestamp:
-            self.hf.append(self.ds_ts, numpy.array([time.time()]), next_matrix=self._next_matrix, reset=reset)
+            self.hf.append(self.ds_ts, numpy.array([time.time()]), next_matrix=self._next_matrix, reset=reset, flush=False)
         if self._next_matrix:
             self._next_matrix = False
 
         self.hf.flush()
+
+    def append_block(self, data):
+        """Function to save several datapoints (vector) or datalines (matrix) at once.
+        
+        Equals a sequence of append() calls, but the dataset is resized and 
+        written once and the file is flushed once. All entries get the same
+        timestamp. Boxes and buffered datasets fall back to single appends.
+        
+        Args:
+            data: 1dim array of datapoints (vector, coordinate) or 2dim array
+                with one dataline per row (matrix)
+        """
+        data = numpy.array(data, dtype=self.dtype)
+        if len(data) == 0:
+            return
+        if self.first or self._next_matrix:
+            self.append(data[0])
+            data = data[1:]
+        if self.buffer_policy or self.ds_type == ds_types['box']:
+            for d in data:
+                self.append(d)
+            return
+        if len(data) == 0:
+            return
+        # pending rows have to be in the file first
+        self.commit(flush=False)
+        self.hf.append_block(self.ds, data)
+        if self._save_timestamp:
+            self.hf.append_block(self.ds_ts, numpy.full(len(data), time.time()))
+        self.hf.flush()
+
+    def write_point(self, index, value, shape=None):
+        """Writes a single value at index, e.g. the value of a log function 
+        at (ix,) of a vector or (ix, iy) of a matrix.
+        
+        Other than append(..., reset=True), only this value is written to the
+        file and the 'fill' attribute is extended to cover index, see 
+        H5_file.write_point(). No timestamp is recorded.
+        
+        Args:
+            index: integer or tuple of integers, one per dimension
+            value: scalar
+            shape (tuple, optional): expected final shape, used to chunk the 
+                dataset when it is created by the first point
+        """
+        index = tuple(numpy.atleast_1d(index))
+        if self.first:
+            self.first = False
+            tracelength = shape[-1] if shape else index[-1] + 1
+            self.ds = self.hf.create_dataset(self.name, tracelength,
+                                             folder=self.folder,
+                                             dim=self.dim,
+                                             ds_type=self.ds_type,
+                                             dtype=self.dtype,
+                                             storage=self.storage)
+            self._setup_metadata()
+            self.hf.dataset_created(self)
+        # pending rows have to be in the file first
+        self.commit(flush=False)
+        self.hf.write_point(self.ds, index, value)
+
+    def _buffer_due(self):
+        if not self._buffer:
+            return False
+        policy = self.buffer_policy
+        if policy['rows'] is not None and len(self._buffer) >= policy['rows']:
+            return True
+        if policy['nbytes'] is not None and self._buffer_bytes >= policy['nbytes']:
+            return True
+        if policy['interval'] is not None and time.time() - self._buffer_since >= policy['interval']:
+            return True
+        return False
+
+    def commit(self, flush=True):
+        """Writes the buffered rows of this dataset to the hdf file.
+        
+        Consecutive rows are written as one block. Rows which start a new 
+        matrix or are appended pointwise go through the regular append.
+        
+        Args:
+            flush (Boolean, optional): flush the hdf file after writing
+        """
+        if not self._buffer:
+            return
+        buffer, self._buffer = self._buffer, []
+        self._buffer_bytes = 0
+        self._buffer_since = None
+
+        block = []
+        for data, ts, next_matrix, pointwise in buffer:
+            if next_matrix or pointwise:
+                self._write_block(block)
+                block = []
+                self.hf.append(self.ds, data, next_matrix=next_matrix, pointwise=pointwise, flush=False)
+                if self._save_timestamp:
+                    self.hf.append(self.ds_ts, ts, next_matrix=next_matrix, flush=False)
+            else:
+                block.append((data, ts))
+        self._write_block(block)
+
+        if flush:
+            self.hf.flush()
+
+    def _write_block(self, block):
+        if not block:
+            return
+        if len(self.ds.shape) == 1:
+            self.hf.append_block(self.ds, numpy.concatenate([data for data, ts in block]))
+        elif len(set(len(data) for data, ts in block)) == 1:
+            self.hf.append_block(self.ds, numpy.array([data for data, ts in block]))
+        else:
+            ## traces of different length are not stacked
+            for data, ts in block:
+                self.hf.append(self.ds, data, flush=False)
+        if self._save_timestamp:
+            if len(self.ds_ts.shape) == 1:
+                self.hf.append_block(self.ds_ts, numpy.concatenate([ts for data, ts in block]))
+            else:
+                self.hf.append_block(self.ds_ts, numpy.array([ts for data, ts in block]))
             
     def add(self,data):
         """Function to save a 1dim dataset once.
@@ -7,10 +7,12 @@ Created 2015
 
 """
 import logging
+import time
 import h5py
 import numpy as np
 import qkit
 from qkit.storage.hdf_constants import ds_types
+from qkit.storage.hdf_storage_policy import StoragePolicy
 from distutils.version import LooseVersion
 
 file_kwargs = dict()
@@ -32,12 +34,25 @@ class H5_file(object):
     trick of placing added data in the correct position in the dataset.
     """    
     
-    def __init__(self,output_file, mode,**kw):
+    def __init__(self,output_file, mode, swmr=False, **kw):
         """Inits the H5_file at the path 'output_file' with the access mode
-        'mode'
+        'mode'. With swmr=True, the file is prepared for the single-writer/
+        multiple-reader mode, see start_swmr().
         """
+        self.swmr = swmr
         self.create_file(output_file, mode)
         self.newfile = False
+        # write-behind buffering (see set_write_buffer)
+        self.buffer_policy = None
+        self._buffered_datasets = []
+        # hdf_datasets which are created with their first append (see start_swmr)
+        self._pending_datasets = []
+        self._created_datasets = []
+        self._swmr_requested = None # time of the postponed start_swmr() call
+        # datasets created at their final size (see create_dataset)
+        self._preallocated = set()
+        # chunk shapes and filters of new datasets
+        self.storage_policy = StoragePolicy()
         
         if self.hf.attrs.get("qt-file",None) or self.hf.attrs.get("qkit",None):
             "File existed before and was created by qkit."
@@ -52,7 +67,76 @@ class H5_file(object):
                 self.grp.attrs[k] = kw[k]
         
     def create_file(self,output_file, mode):
-        self.hf = h5py.File(output_file, mode,**file_kwargs )
+        kwargs = dict(file_kwargs)
+        if self.swmr:
+            # SWMR needs the latest file format
+            kwargs['libver'] = 'latest'
+        self.hf = h5py.File(output_file, mode,**kwargs )
+
+    def start_swmr(self, force=False):
+        """Switches the file into single-writer/multiple-reader mode.
+        
+        Readers (qviewkit) can then keep the file open and see appended data
+        without conflicts. From here on, no groups, datasets or attributes can
+        be added, so call this after the file structure is complete. The root
+        attribute 'swmr' tells readers that the file is written in SWMR mode.
+        
+        hdf_datasets create their HDF5 datasets with the first append(). If 
+        some of them are not created yet, the switch is postponed until the 
+        last one is (see dataset_created). Datasets that do not get data 
+        within qkit.cfg['hdf_swmr_wait'] seconds (default 30) are not waited 
+        for. If such a dataset is created later (or force=True skips the 
+        wait), the file leaves the SWMR mode for good. close_file() leaves the
+        SWMR mode as well.
+        """
+        if not self.swmr or getattr(self.hf, 'swmr_mode', False):
+            return
+        if self._pending_datasets and not force:
+            if self._swmr_requested is None:
+                self._swmr_requested = time.time()
+                logging.info("SWMR mode is postponed until these datasets got their first data: %s"
+                             % ", ".join(d.name for d in self._pending_datasets))
+            return
+        if self._pending_datasets:
+            logging.warning("SWMR mode starts without the datasets %s, which got no data yet. If they get data later, the file leaves SWMR mode."
+                            % ", ".join(d.name for d in self._pending_datasets))
+        self._swmr_requested = None
+        self.hf.attrs['swmr'] = True
+        self.hf.flush()
+        self.hf.swmr_mode = True
+
+    def _check_swmr_wait(self):
+        "starts the postponed SWMR mode once the pending datasets were waited for long enough"
+        if self._swmr_requested is not None and time.time() - self._swmr_requested > qkit.cfg.get('hdf_swmr_wait', 30):
+            self.start_swmr(force=True)
+
+    def _reopen_without_swmr(self):
+        """Leaves the SWMR mode by reopening the file. The HDF5 datasets of 
+        the hdf_datasets are looked up again in the new file handle."""
+        names = [(d, d.ds.name, d.ds_ts.name if getattr(d, 'ds_ts', None) is not None else None)
+                 for d in self._created_datasets]
+        filename = self.hf.filename
+        self.hf.close()
+        self.hf = h5py.File(filename, 'r+', **file_kwargs)
+        self.setup_required_groups()
+        self.hf.attrs['swmr'] = False
+        for d, name, ts_name in names:
+            d.ds = self.hf[name]
+            if ts_name is not None:
+                d.ds_ts = self.hf[ts_name]
+
+    def dataset_pending(self, dataset):
+        "registers an hdf_dataset whose HDF5 dataset is created later"
+        if dataset not in self._pending_datasets:
+            self._pending_datasets.append(dataset)
+
+    def dataset_created(self, dataset):
+        "called by an hdf_dataset after it created its HDF5 dataset and attributes"
+        if dataset in self._pending_datasets:
+            self._pending_datasets.remove(dataset)
+        self._created_datasets.append(dataset)
+        if self._swmr_requested is not None:
+            self.start_swmr()
 
     def set_base_attributes(self):
         "stores some attributes and creates the default data group"
@@ -86,9 +170,12 @@ class H5_file(object):
         self.vgrp = self.entry.require_group("views")
         
     def create_dataset(self,name, tracelength, ds_type = ds_types['vector'],
-                       folder = "data", dim = 1,  **kwargs):
+                       folder = "data", dim = 1, extent = None, storage = None, **kwargs):
         """Dataset for one, two, and three dimensional data
         
+            In SWMR mode, no datasets can be created: the file leaves the
+            SWMR mode first.
+        
             Args:
                 
                 'tracelength'
@@ -101,29 +188,52 @@ class H5_file(object):
             
                 'folder' is a optional group relative to the default group
             
+                'extent' is the optional number of traces of a 2D (nx,) or 
+                    3D (nx, ny) dataset, if known up front. The dataset is 
+                    then created at its final size filled with NaN and the
+                    traces are written in place, see append().
+            
+                'storage' is an optional StoragePolicy (or a dict of its 
+                    arguments) for chunks and compression, default is the
+                    storage_policy of the file.
+            
                 'kwargs' are appended as attributes to the dataset
         """
         self.ds_type = ds_type
         
+        if extent is not None and dim in (2, 3):
+            extent = tuple(int(e) for e in extent)
+            if len(extent) != dim - 1:
+                logging.error("Create datasets: extent '%s' does not fit to %d dims." % (extent, dim))
+                raise ValueError
+        else:
+            extent = None
+        
+        if storage is None:
+            storage = self.storage_policy
+        elif isinstance(storage, dict):
+            storage = StoragePolicy(**storage)
+        
         if dim == 1:
             shape    = (0,)
             maxshape = (None,)
-            chunks=True
             
         elif dim == 2:
             shape    = (0,0)
             maxshape = (None,None)
-            chunks=(5, tracelength)
             
         elif dim == 3:
             shape    = (0,0,0)
             maxshape = (None,None,None)
-            chunks=(5, 5, tracelength)
             
         else:
             logging.error("Create datasets: '%s' is wrong number of dims." %(dim))
             raise ValueError
 
+        if getattr(self.hf, 'swmr_mode', False):
+            logging.warning("Dataset '%s' is created after the file was switched to SWMR mode, the file leaves SWMR mode." % (name))
+            self._reopen_without_swmr()
+
         if folder == "data":
             self.grp = self.dgrp
         elif folder == "analysis":
@@ -158,10 +268,18 @@ class H5_file(object):
                 # comment: The above line does remove the reference to the dataset but does not free the space aquired
                 # fixme if possible ...
                 
+        if extent is not None:
+            shape = extent + (tracelength,)
+        
+        chunks = storage.chunks(dim, tracelength, dtype, extent)
+        
         if ds_type == ds_types['txt']:
             ds = self.grp.create_dataset(name, shape, maxshape=maxshape, chunks = chunks, dtype=dtype)
         else:
-            ds = self.grp.create_dataset(name, shape, maxshape=maxshape, chunks = chunks, dtype=dtype, fillvalue = np.nan)
+            ds = self.grp.create_dataset(name, shape, maxshape=maxshape, chunks = chunks, dtype=dtype, fillvalue = np.nan,
+                                         **storage.filters(dtype))
+        if extent is not None:
+            self._preallocated.add(ds.name)
         
         ds.attrs.create("name",name.encode())
         ds.attrs.create("ds_type", ds_type)
@@ -175,7 +293,48 @@ class H5_file(object):
         self.flush()
         return ds
         
-    def append(self,ds,data, next_matrix=False, reset=False, pointwise=False):
+    def set_write_buffer(self, rows=None, nbytes=None, interval=None):
+        """Sets the default write-behind policy for datasets of this file.
+
+        Buffered datasets keep appended rows in memory and commit them to the
+        file as one block as soon as one of the given limits is exceeded. 
+        Pending rows are always committed on flush() and close_file().
+
+        Args:
+            rows (int): number of pending rows that triggers a commit
+            nbytes (int): number of pending bytes that triggers a commit
+            interval (float): age in seconds of the oldest pending row that 
+                triggers a commit. It is checked for all buffered datasets 
+                on every append and flush, so rows of a dataset that is 
+                appended to rarely do not wait for its next append.
+        Passing no limit at all disables buffering for new datasets.
+        """
+        if rows is None and nbytes is None and interval is None:
+            self.buffer_policy = None
+        else:
+            self.buffer_policy = dict(rows=rows, nbytes=nbytes, interval=interval)
+
+    def register_buffered(self, dataset):
+        "registers a buffered hdf_dataset, so that its rows get committed on flush/close"
+        if dataset not in self._buffered_datasets:
+            self._buffered_datasets.append(dataset)
+
+    def commit_buffers(self):
+        "writes all pending rows of the buffered datasets to the file"
+        for dataset in self._buffered_datasets:
+            dataset.commit(flush=False)
+
+    def commit_due_buffers(self):
+        """writes the pending rows of the buffered datasets which exceed one 
+        of their limits, returns True if anything was written"""
+        committed = False
+        for dataset in self._buffered_datasets:
+            if dataset._buffer_due():
+                dataset.commit(flush=False)
+                committed = True
+        return committed
+
+    def append(self,ds,data, next_matrix=False, reset=False, pointwise=False, flush=True):
         """Method for appending hdf5 data. 
         
         A simple append method for data traces.
@@ -188,9 +347,16 @@ class H5_file(object):
             numpy array 'data'
             boolean 'next_matrix'
             pointwise (Boolean): if True, the data is appended pointwise, i.e. to the innermost dimension
+            flush (Boolean): if False, the caller is responsible for flushing the file
         Returns:
             The function operates on the given variables.
         """
+        self._check_swmr_wait()
+        if ds.name in self._preallocated:
+            self._write_in_place(ds, data, next_matrix=next_matrix, reset=reset, pointwise=pointwise)
+            if flush:
+                self.flush()
+            return
         # it gets a little ugly with all the different user-cases here ...
         if len(ds.shape) == 1:
             ## 1dim dataset (text, coordinate, vector)
@@ -280,13 +446,165 @@ class H5_file(object):
                 ds[fill[0]-1,fill[1]-1] = data
             ds.attrs.modify("fill", fill)
 
-        self.flush()
+        if flush:
+            self.flush()
+
+    def append_block(self, ds, block):
+        """Method for appending several data traces at once.
+        
+        The block equals a sequence of plain append() calls (no next_matrix, 
+        reset or pointwise), but the dataset is resized and written only once.
+        The 'fill' attribute is updated after the data is in place, so a 
+        concurrent reader never sees rows that are not written yet.
+        The file is not flushed.
+        
+        Args:
+            hdf_dataset 'ds'
+            numpy array 'block': concatenated entries for 1D datasets, 
+                one trace per row for 2D and 3D datasets
+        """
+        n = len(block)
+        if n == 0:
+            return
+        self._check_swmr_wait()
+        if ds.name in self._preallocated:
+            self._write_in_place(ds, block, block=True)
+            return
+        if len(ds.shape) == 1:
+            dim1 = ds.shape[0]
+            ds.resize((dim1+n,))
+            ds[dim1:] = block
+
+        if len(ds.shape) == 2:
+            fill = ds.attrs.get('fill')
+            dim0 = ds.shape[0]
+            ds.resize((dim0+n, block.shape[1]))
+            ds[dim0:,:] = block
+            fill[0] += n
+            fill[1] = block.shape[1]
+            ds.attrs.modify('fill', fill)
+
+        if len(ds.shape) == 3:
+            dim0 = max(1, ds.shape[0])
+            dim1 = ds.shape[1]
+            fill = ds.attrs.get('fill')
+            if dim0 == 1:
+                fill[0] = 1
+                dim1 += n
+            ds.resize((dim0, dim1, block.shape[1]))
+            ds[fill[0]-1, fill[1]:fill[1]+n] = block
+            fill[1] += n
+            ds.attrs.modify("fill", fill)
+
+    def write_point(self, ds, index, value, flush=True):
+        """Writes a single value at index into the dataset.
+        
+        The dataset grows (filled with NaN) if index lies beyond its shape. 
+        The 'fill' attribute of matrices and boxes is extended to cover index:
+        for a matrix, fill[0] counts the rows and fill[1] the columns written, 
+        for a box, fill[0] counts the matrices and fill[1] the traces of the 
+        last matrix. Only the value itself is written, independent of the
+        size of the dataset.
+        
+        Args:
+            hdf_dataset 'ds'
+            tuple 'index': one integer per dimension
+            'value': scalar
+            flush (Boolean): if False, the caller is responsible for flushing the file
+        """
+        self._check_swmr_wait()
+        index = tuple(int(i) for i in index)
+        if len(index) != len(ds.shape) or min(index) < 0:
+            logging.error("write_point: index %s does not fit to dataset '%s' of shape %s." % (index, ds.name, ds.shape))
+            raise ValueError
+        shape = tuple(max(s, i + 1) for s, i in zip(ds.shape, index))
+        if shape != ds.shape:
+            ds.resize(shape)
+        ds[index] = value
+        if len(ds.shape) > 1:
+            fill = ds.attrs.get('fill')
+            if len(ds.shape) == 3 and index[0] + 1 > fill[0]:
+                fill[1] = 0
+            fill[0] = max(fill[0], index[0] + 1)
+            fill[1] = max(fill[1], index[1] + 1)
+            ds.attrs.modify('fill', fill)
+        if flush:
+            self.flush()
+
+    def _write_in_place(self, ds, data, next_matrix=False, reset=False, pointwise=False, block=False):
+        """Writes traces into a preallocated dataset and advances 'fill'.
         
+        Matrices are filled row by row, boxes matrix by matrix as in append().
+        Single values appended pointwise to a matrix fill its rows point by 
+        point, also as in append().
+        The dataset only grows if more traces arrive than announced.
+        """
+        fill = ds.attrs.get('fill')
+        if pointwise and len(ds.shape) == 2 and not block and len(data) == 1:
+            if next_matrix or fill[0] == 0:
+                fill[0] += 1
+                fill[1] = 0
+            fill[1] += 1
+            shape = (max(ds.shape[0], fill[0]), max(ds.shape[1], fill[1]))
+            if shape != ds.shape:
+                ds.resize(shape)
+            ds[fill[0]-1, fill[1]-1] = data[0]
+            ds.attrs.modify("fill", fill)
+            return
+        n = len(data) if block else 1
+        tracelength = data.shape[-1]
+        if len(ds.shape) == 2:
+            if reset:
+                ds[fill[0]-1, :tracelength] = data
+                return
+            shape = (max(ds.shape[0], fill[0]+n), max(ds.shape[1], tracelength))
+            if shape != ds.shape:
+                ds.resize(shape)
+            ds[fill[0]:fill[0]+n, :tracelength] = data
+            fill[0] += n
+            fill[1] = tracelength
+        if len(ds.shape) == 3:
+            if next_matrix:
+                fill[0] += 1
+                fill[1] = 0
+            if fill[0] == 0:
+                fill[0] = 1
+            if reset:
+                ds[fill[0]-1, fill[1]-1, :tracelength] = data
+                return
+            shape = (max(ds.shape[0], fill[0]), max(ds.shape[1], fill[1]+n), max(ds.shape[2], tracelength))
+            if shape != ds.shape:
+                ds.resize(shape)
+            ds[fill[0]-1, fill[1]:fill[1]+n, :tracelength] = data
+            fill[1] += n
+        ds.attrs.modify("fill", fill)
+
+    def _trim_preallocated(self):
+        """Shrinks preallocated datasets to the filled part, e.g. after an 
+        aborted measurement, so that the file looks like a grown one."""
+        for name in self._preallocated:
+            ds = self.hf[name]
+            fill = ds.attrs.get('fill')
+            if len(ds.shape) == 2:
+                shape = (fill[0], ds.shape[1])
+            else:
+                shape = (fill[0], ds.shape[1] if fill[0] > 1 else fill[1], ds.shape[2])
+            if shape != ds.shape:
+                ds.resize(shape)
+        self._preallocated = set()
+
     def flush(self):
+        self.commit_due_buffers()
         self.hf.flush()
         
     def close_file(self):
         # delegate close
+        self.commit_buffers()
+        if getattr(self.hf, 'swmr_mode', False):
+            # shrinking datasets and changing attributes is not allowed in SWMR mode
+            self._reopen_without_swmr()
+        if self._preallocated:
+            self._trim_preallocated()
         if self.newfile:
             self.entry.attrs["updating"] = False
         self.hf.close()
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Chunk and filter policies for the qkit hdf datasets.
+
+The chunk shape decides how fast data can be appended trace by trace and how
+fast it can be read back in slices (e.g. a single frequency over all x values
+in qviewkit). Optionally, a lossless compression filter (gzip, lzf) with
+byte shuffling is applied.
+
+The defaults are taken from qkit.cfg:
+    cfg['hdf_chunk_layout']  = 'legacy'  # 'legacy', 'rows' or 'columns'
+    cfg['hdf_chunk_bytes']   = 256*1024  # target size of one chunk
+    cfg['hdf_compression']   = None      # None, 'gzip' or 'lzf'
+    cfg['hdf_compression_opts'] = 4      # gzip level
+    cfg['hdf_shuffle']       = True      # shuffle filter, only with compression
+"""
+import logging
+import os
+import time
+
+import numpy as np
+import qkit
+from qkit.storage.hdf_constants import ds_types
+
+layouts = ['legacy', 'rows', 'columns']
+compressions = [None, 'gzip', 'lzf']
+
+# default of the compression argument: take it from qkit.cfg. None means uncompressed.
+FROM_CFG = object()
+
+
+class StoragePolicy(object):
+    """Chooses chunk shape and filters for a new hdf dataset.
+
+    Layouts:
+        'legacy':  fixed chunks (5, tracelength) and (5, 5, tracelength), as
+                   in all qkit versions before.
+        'rows':    chunks of whole traces, sized to chunk_bytes. Best for
+                   appending traces and reading traces.
+        'columns': chunks span many traces but only a part of each trace.
+                   Best for reading slices across traces (qviewkit views of a
+                   single frequency, transposed plots).
+
+    Unset arguments are taken from qkit.cfg. compression=None disables the
+    compression even if it is enabled in qkit.cfg.
+
+    Compression and large chunks do not go well together when the data is
+    appended trace by trace: the partly filled chunk is compressed again on
+    every append. With the default chunk_bytes, gzip writes drop to ~0.2 MB/s
+    for 'columns' and ~0.7 MB/s for 'rows' (see benchmark()), so compress
+    'legacy' datasets or use compression for data written in blocks.
+    """
+    def __init__(self, layout=None, chunk_bytes=None, compression=FROM_CFG, compression_opts=None, shuffle=None):
+        self.layout = layout if layout is not None else qkit.cfg.get('hdf_chunk_layout', 'legacy')
+        self.chunk_bytes = int(chunk_bytes if chunk_bytes is not None else qkit.cfg.get('hdf_chunk_bytes', 256*1024))
+        self.compression = compression if compression is not FROM_CFG else qkit.cfg.get('hdf_compression', None)
+        self.compression_opts = compression_opts if compression_opts is not None else qkit.cfg.get('hdf_compression_opts', 4)
+        self.shuffle = shuffle if shuffle is not None else qkit.cfg.get('hdf_shuffle', True)
+        if self.layout not in layouts:
+            logging.error("StoragePolicy: layout '%s' unknown, use one of %s." % (self.layout, layouts))
+            raise ValueError
+        if self.compression not in compressions:
+            logging.error("StoragePolicy: compression '%s' unknown, use one of %s." % (self.compression, compressions))
+            raise ValueError
+
+    def chunks(self, dim, tracelength, dtype='f', extent=None):
+        """Returns the chunk shape for a dataset with 'dim' dimensions.
+
+        Args:
+            dim: 1, 2 or 3
+            tracelength: length of the first trace (last dimension)
+            dtype: dtype of the dataset, used to size the chunks
+            extent: optional number of traces (nx,) or (nx, ny), if known
+        """
+        if dim == 1:
+            return True
+        tracelength = max(1, int(tracelength))
+        if self.layout == 'legacy':
+            if dim == 2:
+                return (5, tracelength)
+            return (5, 5, tracelength)
+
+        items = max(1, self.chunk_bytes // np.dtype(dtype).itemsize)
+        if self.layout == 'rows':
+            cols = min(tracelength, items)
+            rows = max(1, items // cols)
+            if dim == 2:
+                chunks = [rows, cols]
+            else:
+                chunks = [1, rows, cols]
+        else:  # columns
+            cols = min(tracelength, max(1, int(items ** (1. / dim))))
+            if dim == 2:
+                chunks = [max(1, items // cols), cols]
+            else:
+                side = max(1, int((items // cols) ** .5))
+                chunks = [side, side, cols]
+        if extent is not None:
+            chunks = [min(c, max(1, int(e))) for c, e in zip(chunks, extent)] + chunks[len(extent):]
+        return tuple(chunks)
+
+    def filters(self, dtype='f'):
+        """Returns the filter keywords for h5py's create_dataset."""
+        if self.compression is None or not np.issubdtype(np.dtype(dtype), np.number):
+            return {}
+        kwargs = dict(compression=self.compression, shuffle=bool(self.shuffle))
+        if self.compression == 'gzip':
+            kwargs['compression_opts'] = self.compression_opts
+        return kwargs
+
+    def __repr__(self):
+        return "StoragePolicy(layout=%r, chunk_bytes=%r, compression=%r)" % (self.layout, self.chunk_bytes, self.compression)
+
+
+def benchmark(folder=None, tracelength=1001, traces=500, policies=None):
+    """Measures write throughput and read latency of different storage policies.
+
+    For every policy a matrix of 'traces' x 'tracelength' float values is
+    appended trace by trace through H5_file.append(). Afterwards, the read
+    time of a single trace (row) and of a single point over all traces
+    (column, as displayed by qviewkit) is measured.
+
+    Args:
+        folder: directory for the temporary files, default: qkit.cfg['tempdir']
+        tracelength: number of points per trace
+        traces: number of traces
+        policies: dict {name: StoragePolicy}, default: all layouts with and
+            without compression
+    Returns:
+        dict {name: {'write_MBps', 'row_read_ms', 'column_read_ms', 'file_MB'}}
+    """
+    from qkit.storage.hdf_file import H5_file
+    if folder is None:
+        folder = qkit.cfg.get('tempdir')
+    if policies is None:
+        policies = {}
+        for layout in layouts:
+            for compression in compressions:
+                policies["%s/%s" % (layout, compression)] = StoragePolicy(layout=layout, compression=compression)
+    # smooth data with a bit of noise, similar to a measured trace
+    data = np.sin(np.linspace(0, 20, tracelength))[None, :] + 1e-3 * np.random.randn(traces, tracelength)
+
+    results = {}
+    for name, policy in policies.items():
+        path = os.path.join(folder, "qkit_storage_benchmark_%s.h5" % name.replace("/", "_"))
+        hf = H5_file(path, 'w')
+        hf.storage_policy = policy
+        ds = hf.create_dataset('benchmark', tracelength, ds_type=ds_types['matrix'], dim=2)
+        t0 = time.time()
+        for trace in data:
+            hf.append(ds, trace)
+        t_write = time.time() - t0
+        hf.close_file()
+
+        hf = H5_file(path, 'r')
+        ds = hf['/entry/data0/benchmark']
+        t0 = time.time()
+        ds[traces // 2, :]
+        t_row = time.time() - t0
+        t0 = time.time()
+        ds[:, tracelength // 2]
+        t_column = time.time() - t0
+        hf.close_file()
+        results[name] = dict(write_MBps=data.astype('f').nbytes / 1024. ** 2 / t_write,
+                             row_read_ms=1e3 * t_row,
+                             column_read_ms=1e3 * t_column,
+                             file_MB=os.path.getsize(path) / 1024. ** 2)
+        os.remove(path)
+    return results
@@ -16,6 +16,7 @@ from qkit.storage.hdf_file import H5_file
 from qkit.storage.hdf_dataset import hdf_dataset
 from qkit.storage.hdf_constants import ds_types
 from qkit.storage.hdf_view import dataset_view
+from qkit.storage.hdf_storage_policy import StoragePolicy, FROM_CFG
 from qkit.storage.hdf_DateTimeGenerator import DateTimeGenerator
 
 
@@ -29,7 +30,7 @@ class Data(object):
     mentioned classes.
     """
     # a types
-    def __init__(self, name = None, mode = 'r+', copy_file = False):
+    def __init__(self, name = None, mode = 'r+', copy_file = False, write_buffer = None, storage = None, swmr = None):
         """Creates an empty data set including the file, for which the currently
         set file name generator is used or opens the h5 file at location 'name'.
 
@@ -37,6 +38,14 @@ class Data(object):
             name (string):  filename or absolute filepath
             mode (string):  access mode to the hdf5 file, default: 'r+' (read+write).
                 Other modes are 'a' (read, write, and create)
+            write_buffer (dict): optional write-behind policy for all datasets
+                of this file, e.g. {'rows': 100, 'interval': 2}. See
+                set_write_buffer(). Default: qkit.cfg['hdf_write_buffer']
+            storage (dict): optional chunk layout and compression for all 
+                datasets of this file, e.g. {'layout': 'columns', 'compression': 'lzf'}.
+                See set_storage_policy(). Default: qkit.cfg['hdf_chunk_layout'], ...
+            swmr (bool): prepare the file for the single-writer/multiple-reader 
+                mode, see start_swmr(). Default: qkit.cfg['hdf_swmr']
         """
         self._name = name
         if os.path.isfile(self._name):
@@ -52,8 +61,10 @@ class Data(object):
             self._filepath = os.path.abspath(self._name)
             self._folder,self._filename = os.path.split(self._filepath)
         "setup the  file"
+        if swmr is None:
+            swmr = qkit.cfg.get('hdf_swmr', False)
         try:
-            self.hf = H5_file(self._filepath, mode)
+            self.hf = H5_file(self._filepath, mode, swmr=swmr)
         except IOError:
             raise IOError('File does not exist. Use argument \"mode=\'a\'\" to create a new h5 file.')
         if self.hf.newfile:
@@ -64,6 +75,12 @@ class Data(object):
                 self.hf.hf.attrs['_user'] = qkit.cfg.get('user')
             if "run_id" in qkit.cfg:
                 self.hf.hf.attrs['_run_id'] = qkit.cfg.get('run_id').upper()
+        if write_buffer is None:
+            write_buffer = qkit.cfg.get('hdf_write_buffer', None)
+        if write_buffer:
+            self.set_write_buffer(**write_buffer)
+        if storage:
+            self.set_storage_policy(**storage)
         self._mapH5PathToObject()
         self.hf.flush()
         
@@ -235,6 +252,7 @@ class Data(object):
             unit: Optional string.
             comment: Optional string to put in any comment.
             folder: Optional string ('data' or 'analysis').
+            extent: Optional tuple (len(x),) to create the matrix at its final size.
         
         Returns:
             hdf_dataset object.
@@ -259,6 +277,7 @@ class Data(object):
             unit: Optional string.
             comment: Optional string to put in any comment.
             folder: Optional string ('data' or 'analysis').
+            extent: Optional tuple (len(x), len(y)) to create the box at its final size.
         
         Returns:
             hdf_dataset object.
@@ -297,6 +316,43 @@ class Data(object):
     
         self.hf.agrp.attrs[param] = value
 
+    def set_write_buffer(self, rows=None, nbytes=None, interval=None):
+        """Buffers appended data in memory and writes it in blocks.
+        
+        Applies to all datasets created after this call, single datasets can
+        override it with the 'buffer' argument, e.g. 
+        add_value_matrix(..., buffer=False). Pending data is written as soon 
+        as one of the limits is exceeded, on flush() and on close().
+        
+        Args:
+            rows: Optional number of pending traces.
+            nbytes: Optional number of pending bytes.
+            interval: Optional age of the oldest pending trace in seconds. 
+                This keeps the live view in qviewkit up to date. It is 
+                checked on every append to the file and on flush().
+        Calling it without arguments disables buffering.
+        """
+        self.hf.set_write_buffer(rows=rows, nbytes=nbytes, interval=interval)
+
+    def set_storage_policy(self, layout=None, chunk_bytes=None, compression=FROM_CFG, compression_opts=None, shuffle=None):
+        """Sets chunk layout and compression for datasets created afterwards.
+        
+        Single datasets can override it with the 'storage' argument, e.g.
+        add_value_box(..., storage={'layout': 'rows'}).
+        Unset arguments are taken from qkit.cfg.
+        
+        Args:
+            layout: Optional string 'legacy', 'rows' (fast appending and 
+                trace reading) or 'columns' (fast slices across traces).
+            chunk_bytes: Optional target size of a chunk in bytes.
+            compression: Optional lossless filter 'gzip' or 'lzf', None for 
+                no compression (also if it is enabled in qkit.cfg).
+            compression_opts: Optional gzip level (0-9).
+            shuffle: Optional boolean, apply the shuffle filter before compression.
+        """
+        self.hf.storage_policy = StoragePolicy(layout=layout, chunk_bytes=chunk_bytes, compression=compression,
+                                               compression_opts=compression_opts, shuffle=shuffle)
+
     def get_dataset(self,ds_url):
         return hdf_dataset(self.hf,ds_url = ds_url)
 
@@ -304,8 +360,18 @@ class Data(object):
         pass
 
     def flush(self):
+        self.hf.commit_buffers()
         self.hf.flush()
 
+    def start_swmr(self):
+        """Switches the file into single-writer/multiple-reader mode, if it 
+        was opened with swmr=True. qviewkit then keeps the file open and only
+        reads the new data. No datasets, views or attributes can be added
+        afterwards (until the file is closed). Datasets are created with their
+        first data point, the switch happens when all of them exist.
+        """
+        self.hf.start_swmr()
+
     def close_file(self):
         self.hf.close_file()
     def close(self):
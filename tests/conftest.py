@@ -0,0 +1,24 @@
+# pytest setup for the qkit tests
+# The tests run from the repository without qkit.start(): the repository root
+# and the driver directory are put on the path and qkit.flow is set up as in
+# qkit/core/s_init/S30_qkit_start.py.
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, 'qkit', 'drivers')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import qkit
+
+
+@pytest.fixture
+def flow():
+    import qkit.core.flow as flow
+    qkit.flow = flow.FlowControl()
+    qkit.flow.sleep = qkit.flow.measurement_idle
+    yield qkit.flow
+    del qkit.flow
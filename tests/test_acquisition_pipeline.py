@@ -0,0 +1,65 @@
+import threading
+import time
+
+import pytest
+
+from qkit.measure.acquisition_pipeline import AcquisitionPipeline
+
+
+@pytest.mark.parametrize('enabled', [False, True])
+def test_jobs_run_in_order(enabled):
+    done = []
+    pipe = AcquisitionPipeline(enabled=enabled, maxsize=2)
+    for i in range(10):
+        pipe.submit('store', done.append, i)
+    pipe.close()
+    assert done == list(range(10))
+    assert pipe.timings()['store']['count'] == 10
+
+
+def test_jobs_run_in_consumer_thread():
+    threads = []
+    pipe = AcquisitionPipeline(enabled=True)
+    pipe.submit('store', lambda: threads.append(threading.current_thread()))
+    pipe.close()
+    assert threads and threads[0] is not threading.current_thread()
+
+
+def test_loop_overlaps_with_jobs():
+    pipe = AcquisitionPipeline(enabled=True, maxsize=4)
+    start = time.time()
+    for i in range(5):
+        with pipe.timed('sweep'):
+            time.sleep(0.02)
+        pipe.submit('store', time.sleep, 0.02)
+    pipe.close()
+    # sequentially 0.2 s
+    assert time.time() - start < 0.17
+
+
+def test_job_error_is_raised_with_next_submit():
+    done = []
+
+    def fail():
+        raise IOError('disk full')
+
+    pipe = AcquisitionPipeline(enabled=True)
+    pipe.submit('store', fail)
+    pipe._queue.join()
+    with pytest.raises(IOError):
+        pipe.submit('store', done.append, 1)
+    pipe.close()
+    assert done == []
+
+
+def test_close_keeps_the_exception_of_the_loop():
+    def fail():
+        raise IOError('disk full')
+
+    pipe = AcquisitionPipeline(enabled=True)
+    with pytest.raises(KeyboardInterrupt):
+        try:
+            pipe.submit('store', fail)
+            raise KeyboardInterrupt
+        finally:
+            pipe.close()
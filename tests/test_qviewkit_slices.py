@@ -0,0 +1,59 @@
+import os
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import h5py
+import numpy as np
+import pytest
+
+pytest.importorskip('PyQt5')
+from qkit.gui.qviewkit.PlotWindow_lib import _get_slice
+
+
+class Window(object):
+    "stands in for the PlotWindow, _get_slice only keeps its cache there"
+    pass
+
+
+@pytest.fixture
+def ds(tmp_path):
+    with h5py.File(str(tmp_path / 'slices.h5'), 'w') as f:
+        ds = f.create_dataset('m', (6, 4), maxshape=(None, 4), dtype='f', fillvalue=np.nan)
+        ds.attrs['fill'] = [0, 0, 0]
+        yield ds
+
+
+def write(ds, rows):
+    for row in rows:
+        fill = ds.attrs['fill']
+        if fill[0] >= ds.shape[0]:
+            ds.resize((fill[0] + 1, ds.shape[1]))
+        ds[fill[0]] = row
+        fill[0] += 1
+        ds.attrs['fill'] = fill
+
+
+def test_negative_index_counts_from_the_last_written_trace(ds):
+    write(ds, [np.full(4, 1.), np.full(4, 2.)])
+    np.testing.assert_array_equal(_get_slice(Window(), ds, -1, slice(None)), np.full(4, 2.))
+
+
+def test_refresh_reads_the_new_rows(ds):
+    window = Window()
+    write(ds, [np.arange(4.)])
+    column = _get_slice(window, ds, slice(None), 1)
+    assert column[0] == 1. and np.isnan(column[1:]).all()
+    write(ds, [np.arange(4.) + 10, np.arange(4.) + 20])
+    np.testing.assert_array_equal(_get_slice(window, ds, slice(None), 1)[:3], [1., 11., 21.])
+    # beyond the preallocated rows
+    write(ds, [np.arange(4.) + 30 + i for i in range(4)])
+    column = _get_slice(window, ds, slice(None), 1)
+    np.testing.assert_array_equal(column, ds[:, 1])
+    assert len(column) == 7
+
+
+def test_slice_is_a_copy(ds):
+    window = Window()
+    write(ds, [np.arange(4.)])
+    _get_slice(window, ds, slice(None), slice(None))[:] = -1
+    np.testing.assert_array_equal(_get_slice(window, ds, slice(None), slice(None))[0], np.arange(4.))
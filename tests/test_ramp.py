@@ -0,0 +1,126 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from qkit.core.instrument_base import Instrument
+from qkit.core.lib import ramp as ramp_engine
+from qkit.core.lib.ramp import Ramp, RampCancelled, RampEngine
+
+
+class Recorder(object):
+    "step function that records the values and the times it was called"
+    def __init__(self, fail_at=None):
+        self.values = []
+        self.times = []
+        self.fail_at = fail_at
+
+    def __call__(self, value):
+        if value == self.fail_at:
+            raise IOError('step failed')
+        self.values.append(value)
+        self.times.append(time.time())
+
+
+class Source(Instrument):
+    def __init__(self, name):
+        Instrument.__init__(self, name)
+        self.values = []
+        self._voltage = 0.
+        self.add_parameter('voltage', type=float, flags=Instrument.FLAG_GETSET, maxstep=0.1, stepdelay=10)
+
+    def do_get_voltage(self):
+        return self._voltage
+
+    def do_set_voltage(self, voltage):
+        time.sleep(0.002)
+        self._voltage = voltage
+        self.values.append(voltage)
+
+
+@pytest.fixture
+def engine():
+    return RampEngine()
+
+
+def test_steps_in_order_with_stepdelay(engine):
+    steps = Recorder()
+    done = []
+    ramp = engine.submit(Ramp('r', [1, 2, 3], 0.02, steps, lambda: done.append(True)))
+    assert ramp.result(5) == 3
+    assert steps.values == [1, 2, 3]
+    assert min(np.diff(steps.times)) >= 0.019
+    assert done == [True]
+
+
+def test_ramps_run_in_parallel(engine):
+    a, b = Recorder(), Recorder()
+    start = time.time()
+    ramps = [engine.submit(Ramp('a', range(20), 0.02, a)), engine.submit(Ramp('b', range(20), 0.02, b))]
+    assert ramp_engine.wait_all(ramps, 5)
+    # one after the other would take 0.76 s
+    assert time.time() - start < 0.6
+    assert a.values == b.values == list(range(20))
+
+
+def test_cancel_keeps_last_value(engine):
+    steps = Recorder()
+    ramp = engine.submit(Ramp('r', range(100), 0.01, steps))
+    time.sleep(0.05)
+    ramp.cancel()
+    with pytest.raises(RampCancelled):
+        ramp.wait(5)
+    assert 0 < len(steps.values) < 100
+    assert ramp.value == steps.values[-1]
+
+
+def test_failed_step_is_raised(engine):
+    ramp = engine.submit(Ramp('r', [1, 2, 3], 0.01, Recorder(fail_at=2)))
+    with pytest.raises(IOError):
+        ramp.wait(5)
+    assert ramp.value == 1
+
+
+def test_inline_ramp(engine):
+    threads = []
+    ramp = engine.submit(Ramp('r', [1, 2], 0.01, lambda v: threads.append(threading.current_thread())), inline=True)
+    assert ramp.done() and ramp.value == 2
+    assert threads == [threading.current_thread()] * 2
+
+
+def test_stop_waits_for_the_step_in_progress(engine):
+    lock = threading.RLock()
+    entered = threading.Event()
+
+    def slow_step(value):
+        entered.set()
+        time.sleep(0.05)
+
+    ramp = engine.submit(Ramp('r', [1, 2, 3], 0., slow_step, lock=lock))
+    entered.wait(5)
+    assert ramp.stop() == 1
+    assert ramp.done()
+    with pytest.raises(RampCancelled):
+        ramp.wait(1)
+
+
+def test_instrument_ramp(flow):
+    source = Source('source')
+    source.get_voltage()
+    assert source.ramp('voltage', 0.5).result(5) == 0.5
+    np.testing.assert_allclose(source.values, [0.1, 0.2, 0.3, 0.4, 0.5])
+
+
+def test_new_ramp_starts_where_the_old_one_stopped(flow):
+    source = Source('source')
+    source.get_voltage()
+    first = source.ramp('voltage', 1.)
+    time.sleep(0.05)
+    second = source.ramp('voltage', -0.5)
+    with pytest.raises(RampCancelled):
+        first.wait(5)
+    assert second.result(5) == -0.5
+    assert source.get_voltage(query=False) == -0.5
+    # one ramp at a time, no step larger than maxstep
+    assert max(np.abs(np.diff([0.] + source.values))) <= 0.1 + 1e-9
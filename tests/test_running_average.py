@@ -0,0 +1,22 @@
+import numpy as np
+
+from qkit.measure.transport.transport import transport
+
+
+def test_mean_and_error_match_numpy():
+    traces = np.random.RandomState(0).normal(size=(20, 5))
+    avg = transport.running_average()
+    for trace in traces:
+        avg.add(trace)
+    np.testing.assert_allclose(avg.get_mean(), traces.mean(axis=0))
+    np.testing.assert_allclose(avg.get_error(), traces.std(axis=0, ddof=1) / np.sqrt(len(traces)))
+
+
+def test_nan_entries_are_not_counted():
+    avg = transport.running_average()
+    avg.add([1., np.nan, np.nan])
+    avg.add([3., 2., np.nan])
+    np.testing.assert_array_equal(avg.get_mean(), [2., 2., np.nan])
+    error = avg.get_error()
+    assert error[0] == 1.
+    assert np.isnan(error[1:]).all()
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from qkit.drivers.Spectrum_dma import DMABufferRing, PAGE_SIZE, SpcmStandIn, scale_to_float
+
+
+class Counter(object):
+    "signal of the stand-in: every transfer is filled with the number of the transfer"
+    def __init__(self):
+        self.n = 0
+
+    def __call__(self, samples):
+        self.n += 1
+        return np.full(samples, self.n, np.int8)
+
+
+@pytest.fixture
+def card(flow):
+    from qkit.drivers.Spectrum_M4i2211 import Spectrum_M4i2211
+    card = Spectrum_M4i2211('card', dll=SpcmStandIn(Counter()))
+    card.select_channel0()
+    card.set_multi_mode()
+    card.set_segmentsize(64)
+    card.set_memsize(256)
+    return card
+
+
+@pytest.fixture
+def mspec(card):
+    # the constructor needs a real card setup, only the readout is tested
+    from qkit.drivers.virtual_measure_spec import virtual_measure_spec
+    mspec = object.__new__(virtual_measure_spec)
+    mspec._dacq = card
+    mspec._gate_func = None
+    mspec._numchannels, mspec._segments, mspec._samples, mspec._averages = 1, 1, 64, 4
+    return mspec
+
+
+def acquire(mspec, **kwargs):
+    mspec._acquire_multimode_prepare()
+    return mspec._acquire_multimode_extract(averaged=False, **kwargs)
+
+
+def test_ring_blocks_are_page_aligned():
+    ring = DMABufferRing(3)
+    ring.resize(5000)
+    assert ring.blocksize == 2 * PAGE_SIZE
+    indices = []
+    for i in range(4):
+        index, view = ring.next(5000)
+        indices.append(index)
+        assert view.ctypes.data % PAGE_SIZE == 0
+        assert view.nbytes == 5000
+    assert indices == [0, 1, 2, 0]
+
+
+def test_ring_keeps_memory_for_smaller_blocks():
+    ring = DMABufferRing(2)
+    ring.resize(3 * PAGE_SIZE)
+    buffer = ring.buffer
+    ring.resize(PAGE_SIZE)
+    assert ring.buffer is buffer
+    ring.resize(4 * PAGE_SIZE)
+    assert ring.buffer is not buffer
+
+
+def test_scale_to_float_into_out():
+    data = np.array([-128, 0, 127], np.int8)
+    out = np.empty(3, np.float32)
+    assert scale_to_float(data, 255., 10., out) is out
+    np.testing.assert_allclose(out, [-246., 10., 264.])
+
+
+def test_binary_readout_is_a_view_of_the_ring(card):
+    views = []
+    for i in range(card.dma_blocks + 1):
+        card.start_with_trigger()
+        views.append(card.readout_singlechannel_multimode_bin())
+    assert all(np.shares_memory(view, card._dma.buffer) for view in views)
+    # the first block is used again by the last acquisition
+    assert np.shares_memory(views[0], views[-1])
+    assert not np.shares_memory(views[0], views[1])
+
+
+def test_multimode_extract_copies_by_default(mspec):
+    first = acquire(mspec)
+    kept = first.copy()
+    for i in range(mspec._dacq.dma_blocks):
+        acquire(mspec)
+    assert first.shape == (64, 4, 1)
+    assert not np.shares_memory(first, mspec._dacq._dma.buffer)
+    np.testing.assert_array_equal(first, kept)
+
+
+def test_multimode_extract_view_is_overwritten(mspec):
+    first = acquire(mspec, copy=False)
+    kept = first.copy()
+    assert np.shares_memory(first, mspec._dacq._dma.buffer)
+    for i in range(mspec._dacq.dma_blocks):
+        acquire(mspec)
+    assert not np.array_equal(first, kept)
@@ -0,0 +1,136 @@
+import time
+
+import h5py
+import numpy as np
+import pytest
+
+from qkit.storage.store import Data
+
+
+@pytest.fixture
+def data(tmp_path):
+    data = Data(str(tmp_path / 'test.h5'), mode='a')
+    yield data
+    if data.hf.hf:
+        data.close()
+
+
+def read(data, name):
+    "dataset in the open file, as a reader would see it"
+    return data.hf.hf['/entry/data0/' + name]
+
+
+def fill(data, name):
+    return list(read(data, name).attrs['fill'][:2])
+
+
+def test_buffer_commits_after_rows(data):
+    data.set_write_buffer(rows=3)
+    x = data.add_coordinate('x')
+    x.add(np.arange(4))
+    m = data.add_value_matrix('m', x=x, y=x)
+    for i in range(2):
+        m.append(np.full(4, i))
+    assert read(data, 'm').shape[0] == 0
+    m.append(np.full(4, 2))
+    np.testing.assert_array_equal(read(data, 'm')[:, 0], [0, 1, 2])
+    assert fill(data, 'm') == [3, 4]
+
+
+def test_buffer_interval_of_other_datasets_is_checked(data):
+    data.set_write_buffer(interval=0.05)
+    slow = data.add_coordinate('slow')
+    fast = data.add_coordinate('fast', buffer=False)
+    slow.append(1.)
+    fast.append(1.)
+    assert read(data, 'slow').shape == (0,)
+    time.sleep(0.1)
+    # slow is not appended to again, the interval is checked on the append of fast
+    fast.append(2.)
+    np.testing.assert_array_equal(read(data, 'slow')[:], [1.])
+
+
+def test_buffer_is_committed_on_flush_and_close(data, tmp_path):
+    data.set_write_buffer(rows=100)
+    v = data.add_coordinate('v')
+    v.append(1.)
+    data.flush()
+    assert read(data, 'v').shape == (1,)
+    v.append(2.)
+    data.close()
+    with h5py.File(str(tmp_path / 'test.h5'), 'r') as f:
+        np.testing.assert_array_equal(f['/entry/data0/v'][:], [1., 2.])
+
+
+def test_append_block_equals_appends(data):
+    x = data.add_coordinate('x')
+    x.add(np.arange(3))
+    traces = np.arange(12.).reshape(4, 3)
+    a = data.add_value_matrix('a', x=x, y=x)
+    b = data.add_value_matrix('b', x=x, y=x)
+    for trace in traces:
+        a.append(trace)
+    b.append_block(traces)
+    np.testing.assert_array_equal(read(data, 'a')[:], read(data, 'b')[:])
+    assert fill(data, 'a') == fill(data, 'b') == [4, 3]
+
+
+def test_preallocated_matrix_is_written_in_place_and_trimmed(data, tmp_path):
+    x = data.add_coordinate('x')
+    x.add(np.arange(5))
+    m = data.add_value_matrix('m', x=x, y=x, extent=(5,))
+    m.append(np.ones(3))
+    m.append(2 * np.ones(3))
+    assert read(data, 'm').shape == (5, 3)
+    assert fill(data, 'm') == [2, 3]
+    assert np.isnan(read(data, 'm')[2:]).all()
+    data.close()
+    # an aborted measurement looks like a grown dataset
+    with h5py.File(str(tmp_path / 'test.h5'), 'r') as f:
+        np.testing.assert_array_equal(f['/entry/data0/m'][:], [[1.] * 3, [2.] * 3])
+
+
+def test_preallocated_matrix_pointwise(data):
+    x = data.add_coordinate('x')
+    x.add(np.arange(2))
+    m = data.add_value_matrix('m', x=x, y=x, extent=(2,))
+    for v in (1., 2., 3.):
+        m.append(v, pointwise=True)
+    m.next_matrix()
+    m.append(4., pointwise=True)
+    np.testing.assert_array_equal(read(data, 'm')[:], [[1., 2., 3.], [4., np.nan, np.nan]])
+    assert fill(data, 'm') == [2, 1]
+
+
+def test_preallocated_box(data):
+    x = data.add_coordinate('x')
+    x.add(np.arange(2))
+    b = data.add_value_box('b', x=x, y=x, z=x, extent=(2, 2))
+    b.append(np.zeros(4))
+    b.append(np.ones(4))
+    b.next_matrix()
+    b.append(2 * np.ones(4))
+    assert read(data, 'b').shape == (2, 2, 4)
+    assert fill(data, 'b') == [2, 1]
+    np.testing.assert_array_equal(read(data, 'b')[1, 0], 2 * np.ones(4))
+
+
+def test_write_point(data):
+    x = data.add_coordinate('x')
+    x.add(np.arange(4))
+    v = data.add_value_vector('v', x=x)
+    v.write_point(2, 1.)
+    np.testing.assert_array_equal(read(data, 'v')[:], [np.nan, np.nan, 1.])
+    m = data.add_value_matrix('m', x=x, y=x)
+    m.write_point((1, 2), 5., shape=(4, 4))
+    m.write_point((0, 0), 3.)
+    assert read(data, 'm').shape == (2, 3)
+    assert read(data, 'm')[1, 2] == 5. and read(data, 'm')[0, 0] == 3.
+    assert fill(data, 'm') == [2, 3]
+
+
+def test_write_point_rejects_wrong_index(data):
+    v = data.add_coordinate('v')
+    v.write_point(0, 1.)
+    with pytest.raises(ValueError):
+        v.write_point((0, 1), 1.)
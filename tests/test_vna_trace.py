@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from qkit.drivers.AbstractVNA import VNATrace, get_vna_trace
+
+
+def test_representations_of_one_transfer():
+    data = np.array([1 + 1j, -2j, 3])
+    trace = VNATrace(data)
+    np.testing.assert_allclose(trace.amp, np.abs(data))
+    np.testing.assert_allclose(trace.pha, np.angle(data))
+    real, imag = trace.get('RealImag')
+    np.testing.assert_array_equal(real, data.real)
+    np.testing.assert_array_equal(imag, data.imag)
+    assert trace.amp is trace.amp
+    with pytest.raises(ValueError):
+        trace.get('dB')
+
+
+def test_from_interleaved():
+    trace = VNATrace.from_interleaved([1., 2., 3., 4.])
+    np.testing.assert_array_equal(trace.data, [1 + 2j, 3 + 4j])
+
+
+def test_cw_trace_is_averaged():
+    trace = VNATrace.from_iq([1., 3.], [0., 2.], cw=True)
+    np.testing.assert_array_equal(trace.data, [2 + 1j])
+    assert len(trace) == 1
+
+
+def test_get_vna_trace_without_get_trace():
+    class VNA(object):
+        def get_tracedata(self, format='AmpPha'):
+            if format == 'RealImag':
+                return np.array([0., 1.]), np.array([1., 0.])
+            return np.array([1., 1.]), np.array([np.pi / 2, 0.])
+
+    amp, pha = get_vna_trace(VNA()).get()
+    np.testing.assert_allclose(amp, [1., 1.])
+    np.testing.assert_allclose(pha, [np.pi / 2, 0.])